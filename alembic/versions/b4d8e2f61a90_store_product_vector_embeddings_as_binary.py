@@ -0,0 +1,94 @@
+"""store product vector embeddings as binary
+
+Revision ID: b4d8e2f61a90
+Revises: 7c1e9a4b2d3f
+Create Date: 2026-10-17 14:05:48.611203
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d8e2f61a90'
+down_revision: Union[str, Sequence[str], None] = '7c1e9a4b2d3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows converted per statement batch. Bulk batches commit on their own (autocommit block),
+# so row locks are held briefly and the table stays writable during the backfill; only the
+# final catch-up pass holds a table lock.
+BATCH_SIZE = 500
+
+product_vectors = sa.table(
+    'product_vectors',
+    sa.column('id', sa.Uuid()),
+    sa.column('embedding', sa.JSON()),
+    sa.column('embedding_data', sa.LargeBinary()),
+    sa.column('embedding_dtype', sa.String()),
+    sa.column('embedding_scale', sa.Float()),
+)
+
+
+def _batches(bind, columns, where):
+    """Yields batches of rows in id order (keyset pagination), each read in its own statement.
+
+    Ids are random UUIDs, so rows inserted while a pass runs can land behind the cursor; the
+    pass is restarted from the beginning until ``where`` matches no row any more.
+    """
+    while True:
+        last_id = None
+        while True:
+            statement = sa.select(product_vectors.c.id, *columns).where(where).order_by(product_vectors.c.id).limit(BATCH_SIZE)
+            if last_id is not None:
+                statement = statement.where(product_vectors.c.id > last_id)
+            rows = bind.execute(statement).all()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+        if bind.execute(sa.select(sa.literal(1)).select_from(product_vectors).where(where).limit(1)).first() is None:
+            return
+
+
+def _lock_product_vectors(bind):
+    """Blocks concurrent writes until the migration transaction commits (PostgreSQL only)."""
+    if bind.dialect.name == 'postgresql':
+        bind.execute(sa.text('LOCK TABLE product_vectors IN SHARE ROW EXCLUSIVE MODE'))
+
+
+def _encode(bind, rows):
+    update = (
+        product_vectors.update()
+        .where(product_vectors.c.id == sa.bindparam('row_id'))
+        .values(embedding_data=sa.bindparam('data'), embedding_dtype='float32')
+    )
+    params = []
+    for row_id, embedding in rows:
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        data = np.asarray(embedding or [], dtype='<f4').tobytes()
+        params.append({'row_id': row_id, 'data': data})
+    bind.execute(update, params)
+
+
+def _decode(bind, rows):
+    columns = [product_vectors.c.embedding_data, product_vectors.c.embedding_dtype, product_vectors.c.embedding_scale]
+    pending = product_vectors.c.embedding.is_(None)
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for rows in _batches(bind, columns, pending):
+            _decode(bind, rows)
+
+    bind = op.get_bind()
+    _lock_product_vectors(bind)
+    for rows in _batches(bind, columns, pending):
+        _decode(bind, rows)
+
+    op.drop_column('product_vectors', 'embedding_scale')
+    op.drop_column('product_vectors', 'embedding_dtype')
+    op.drop_column('product_vectors', 'embedding_data')
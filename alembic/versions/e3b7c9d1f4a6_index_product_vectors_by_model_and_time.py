@@ -0,0 +1,40 @@
+"""index product vectors by model and creation time
+
+Revision ID: e3b7c9d1f4a6
+Revises: d91f3a7c5e28
+Create Date: 2026-10-17 17:02:44.918230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7c9d1f4a6'
+down_revision: Union[str, Sequence[str], None] = 'd91f3a7c5e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The composite indexes also serve lookups by model_id alone, replacing the single-column ones.
+    # product_vectors can be large: build without blocking writes (PostgreSQL, outside a transaction).
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_product_vectors_model_id_created_at', 'product_vectors', ['model_id', 'created_at'],
+            unique=False, postgresql_concurrently=True,
+        )
+    op.drop_index(op.f('ix_product_vectors_model_id'), table_name='product_vectors')
+    op.create_index('ix_product_vector_tombstones_model_id_deleted_at', 'product_vector_tombstones', ['model_id', 'deleted_at'], unique=False)
+    op.drop_index(op.f('ix_product_vector_tombstones_model_id'), table_name='product_vector_tombstones')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_product_vector_tombstones_model_id'), 'product_vector_tombstones', ['model_id'], unique=False)
+    op.drop_index('ix_product_vector_tombstones_model_id_deleted_at', table_name='product_vector_tombstones')
+    op.create_index(op.f('ix_product_vectors_model_id'), 'product_vectors', ['model_id'], unique=False)
+    op.drop_index('ix_product_vectors_model_id_created_at', table_name='product_vectors')
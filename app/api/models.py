@@ -8,6 +8,7 @@ from app.deps import SessionDep
 from app.models import AIModelType
 from app.services.ai_service import model_manager
 from app.services.r2_service import r2_service # New import
+from app.services.reembedding import reembedding_runner
 import mimetypes # New import
 
 router = APIRouter(
@@ -93,6 +94,9 @@ async def upload_embedding_model(
 
     # Schedule model reloading in the background
     background_tasks.add_task(model_manager.reload_models)
+    # Regenerate vectors of existing images once the new model is active
+    crud.create_reembedding_job(session=session, model_id=db_model.id)
+    background_tasks.add_task(reembedding_runner.schedule)
 
     db_model.file_path = r2_service.get_public_url(db_model.file_path) # Return public URL
     return db_model
@@ -119,6 +123,27 @@ async def get_latest_embedding_model(session: SessionDep):
     model.file_path = r2_service.get_public_url(model.file_path) # Return public URL
     return model
 
+@router.get("/status", response_model=schemas.AIModelStatusOut)
+async def get_model_status():
+    """
+    Returns the model pair currently serving predictions and the pair being loaded, if any.
+    """
+    return model_manager.status()
+
+@router.get("/metrics", response_model=schemas.PipelineMetricsOut)
+async def get_pipeline_metrics():
+    """
+    Returns latency histograms for each prediction pipeline stage, and per-image counters, since startup.
+    """
+    return model_manager.metrics.snapshot()
+
+@router.get("/reembedding-jobs", response_model=list[schemas.ReembeddingJobOut])
+async def list_reembedding_jobs(session: SessionDep):
+    """
+    Lists the most recent re-embedding jobs and their progress, newest first.
+    """
+    return crud.get_reembedding_jobs(session)
+
 @router.get("/crop", response_model=schemas.AIModelListResponse)
 async def list_crop_models(session: SessionDep):
     """
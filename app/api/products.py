@@ -1,11 +1,15 @@
 from fastapi import APIRouter, HTTPException, status, Query, UploadFile, File, Form
 from uuid import UUID, uuid4
 import mimetypes
+import numpy as np
+import zipfile
 
 from app import crud, schemas
 from app.deps import SessionDep
 from app.services.ai_service import model_manager
+from app.services.bulk_ingest import BulkImageIngestor, sources_from_uploads, sources_from_zip
 from app.services.r2_service import r2_service
+from app.services.vector_index import VectorBatch, vector_index
 
 router = APIRouter(
     prefix="/products",
@@ -219,6 +223,7 @@ async def delete_product(
         )
     
     crud.delete_product(session=session, product_id=product_id)
+    vector_index.remove_product(product_id)
     return
 
 @router.get(
@@ -360,7 +365,7 @@ async def add_product_image(
         )
     
     # Generate vectors from the image
-    vectors, model_id = model_manager.predict(file_content)
+    vectors, model_id = await model_manager.predict_async(file_content)
     
     if model_id is None:
         raise HTTPException(
@@ -376,18 +381,62 @@ async def add_product_image(
     new_image = crud.create_product_image(session=session, product_id=product_id, image_in=image_create_data)
 
     # Save the generated vectors
+    vector_ids, stored_embeddings = [], []
     for vector in vectors:
-        crud.create_product_vector(
+        db_vector = crud.create_product_vector(
             session=session,
             product_id=product_id,
             model_id=model_id,
             embedding=vector,
             image_id=new_image.id
         )
+        vector_ids.append(db_vector.id)
+        stored_embeddings.append(db_vector.embedding) # As stored (possibly int8), so the index matches a rebuild
+    vector_index.add(VectorBatch(
+        model_id, vector_ids, [product_id] * len(vector_ids), [new_image.id] * len(vector_ids), np.array(stored_embeddings)
+    ))
     
     new_image.image_url = r2_service.get_public_url(new_image.image_url)
     return new_image
 
+@router.post(
+    "/images/bulk",
+    response_model=schemas.BulkImageIngestOut,
+    summary="Bulk add images to products and generate vectors"
+)
+async def bulk_add_product_images(
+    session: SessionDep,
+    archive: UploadFile | None = File(None, description="Zip file with one folder per product, named by product ID or barcode."),
+    files: list[UploadFile] | None = File(None, description="Image files, used when no archive is given."),
+    product_keys: list[str] | None = Form(None, description="Product ID or barcode for each file in `files`, in the same order."),
+) -> schemas.BulkImageIngestOut:
+    """
+    Adds many non-primary product images in one request, either as a zip archive
+    (`<product_id or barcode>/<image>`) or as multipart `files` with matching `product_keys`.
+    Files are uploaded to storage and run through the AI model concurrently, and images and
+    vectors are inserted in batches. A failing file does not affect the others; the
+    response reports the outcome of every file, plus throughput.
+    """
+    if archive is not None:
+        try:
+            zip_archive = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Archive is not a valid zip file."
+            )
+        with zip_archive:
+            sources = sources_from_zip(zip_archive)
+            return await BulkImageIngestor(session, model_manager).ingest(sources)
+
+    if not files or not product_keys or len(files) != len(product_keys):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide a zip archive, or files with one product key per file."
+        )
+    sources = sources_from_uploads(files, product_keys)
+    return await BulkImageIngestor(session, model_manager).ingest(sources)
+
 @router.delete(
     "/images/{image_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -413,6 +462,7 @@ async def delete_product_image(
     
     # Delete associated vectors first
     crud.delete_vectors_by_image_id(session=session, image_id=image_id)
+    vector_index.remove_images([image_id])
 
     # Then, delete from R2
     if not r2_service.delete_file(image.image_url):
@@ -1,31 +1,112 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import StreamingResponse
-import io
-import json
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
 from sqlmodel import Session
+from typing import Literal
+from uuid import UUID
 
 from app import crud, schemas
+from app.core import vector_projection, vector_snapshot
+from app.core.config import settings
 from app.deps import get_db
+from app.models import AIModelType, VectorCompactionJob
+from app.services.ai_service import model_manager
+from app.services import vector_codebooks, vector_compaction, vector_compression, vector_projections, vector_snapshots
+from app.services.vector_compaction import vector_compaction_runner
+from app.services.vector_index import vector_index
+from app.services.vector_snapshots import snapshot_store
 
 router = APIRouter(
     prefix="/vectors",
     tags=["Vectors"],
 )
 
+def _prefers_binary(accept: str) -> bool:
+    """
+    Content negotiation cho `/download`: True nếu header Accept ưu tiên
+    `application/octet-stream` hơn JSON. Không có Accept hoặc `*/*` giữ JSON.
+    """
+    quality = {}
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        quality[media_type.lower()] = max(q, quality.get(media_type.lower(), 0.0))
+    binary = quality.get(vector_snapshot.MEDIA_TYPE, quality.get("application/*", 0.0))
+    json_q = quality.get("application/json", quality.get("application/*", quality.get("*/*", 0.0)))
+    return binary > 0 and binary > json_q
+
+
+def _resolve_model_id(db: Session, model_id: UUID | None = None) -> UUID:
+    """
+    Model embedding mà export/delta áp dụng: `model_id` nếu có (phải là model
+    embedding đã upload), không thì model đang phục vụ; nếu chưa nạp model thì
+    lấy model embedding mới nhất.
+    """
+    if model_id is not None:
+        model = crud.get_ai_model_by_id(session=db, model_id=model_id)
+        if model is None or model.model_type != AIModelType.EMBEDDING:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Embedding model not found."
+            )
+        return model_id
+    model_id = model_manager.embedding_model_id
+    if model_id is None:
+        latest = crud.get_latest_ai_model_by_type(session=db, model_type=AIModelType.EMBEDDING)
+        model_id = latest.id if latest else None
+    if model_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No embedding model available."
+        )
+    return model_id
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """So khớp header If-None-Match (danh sách ETag hoặc `*`, so sánh yếu) với `etag`."""
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
 @router.get("/download")
-def download_all_vectors(*, db: Session = Depends(get_db)):
+def download_all_vectors(
+    *,
+    db: Session = Depends(get_db),
+    accept: str = Header("application/json"),
+    if_none_match: str | None = Header(None),
+    dtype: Literal["float32", "int8", "pq"] | None = Query(
+        None, description="Kiểu phần tử của ma trận trong snapshot nhị phân (mặc định VECTOR_STORAGE_DTYPE)."
+    ),
+    model_id: UUID | None = Query(None, description="Model embedding của các vector (mặc định model đang phục vụ)."),
+):
     """
-    Trả về tất cả product vectors dưới dạng file JSON để tải về.
+    Trả về tất cả product vectors của một model embedding (mặc định model đang
+    phục vụ) để tải về, ở dạng JSON hoặc snapshot nhị phân tùy header `Accept`.
+    Vector của các model khác nằm ở không gian embedding khác nên không được gửi.
 
-    File JSON có cấu trúc:
+    Mặc định (hoặc `Accept: application/json`) là file JSON có cấu trúc:
 
     {
+      "model_id": "0f9c2b1e-7a4d-4e8f-b3c6-5d2a1e0f9b87",
       "vectors": [
         {
+          "id": "5b0e3f7c-9d1a-4c2e-8f6b-0a7d2c4e9b13",
           "product_id": "212e0ffb-7b33-40cc-8fe4-024f9fa7b23e",
           "embedding": [0.1, 0.2, 0.3, ...]
         },
         {
+          "id": "c8a14e2d-3b5f-4d7a-9e60-1f2b3c4d5e6f",
           "product_id": "a12f3bcd-4e56-7890-abcd-1234567890ef",
           "embedding": [0.4, 0.5, 0.6, ...]
         }
@@ -33,36 +114,410 @@ def download_all_vectors(*, db: Session = Depends(get_db)):
     }
 
     Mỗi mục trong `vectors` chứa:
+    - `id`: UUID4 của vector (chuỗi), dùng để áp dụng `deleted_ids` của `/delta`
     - `product_id`: UUID4 của sản phẩm (chuỗi)
     - `embedding`: mảng số biểu diễn vector của sản phẩm
+
+    Với `Accept: application/octet-stream`, trả về snapshot nhị phân: header (model id, số chiều, số vector),
+    bảng vector id, bảng product id và ma trận float32 hoặc int8 (`dtype`) liên
+    tục, có thể memory-map trực tiếp. Định dạng mô tả ở `app/core/vector_snapshot.py`.
+    `dtype=pq` gửi mã product quantization (1 byte cho mỗi `subvector_dim` chiều)
+    kèm codebook đã huấn luyện qua `POST /codebook` (404 nếu chưa có codebook cho
+    projection hiện tại); vector mới từ `/delta` được cart tự mã hóa bằng codebook
+    đó. Xem `/compression-report` để chọn dạng theo recall chấp nhận được.
+
+    Header `X-Sync-Cursor` là cursor để gọi `/delta` cho lần đồng bộ tiếp theo.
+
+    Khi bật VECTOR_PROJECTION_DIMS và đã có phiên bản projection (`POST /projection`),
+    vector được chiếu PCA xuống số chiều đó; header `X-Projection-Id` (và `projection_id` trong file) là phiên bản
+    projection, cart tải ma trận qua `/projection` để chiếu embedding truy vấn.
+
+    Khi đã có file dựng sẵn (`VECTOR_SNAPSHOT_DIR`), phản hồi là file đó kèm
+    ETag mạnh (hash nội dung): gửi lại `If-None-Match` nhận 304 nếu không đổi,
+    và header `Range` để tải tiếp phần còn thiếu. Với lưu trữ R2, phản hồi là
+    redirect 307 tới file trên R2. File dựng với projection (hoặc codebook) cũ
+    hơn phiên bản hiện tại không được dùng; vector được mã hóa trực tiếp tới khi
+    file được dựng lại.
     """
-    all_vectors_from_db = crud.get_all_product_vectors(session=db)
-    
-    simplified_vectors = [
-        {"product_id": vec.product_id, "embedding": vec.embedding}
-        for vec in all_vectors_from_db
-    ]
-    
-    json_payload = {"vectors": simplified_vectors}
-    json_content = json.dumps(json_payload, indent=2, default=str)
-    
-    string_io = io.StringIO(json_content)
-    
-    headers = {
-        'Content-Disposition': 'attachment; filename="product_vectors.json"'
+    model_id = _resolve_model_id(db, model_id)
+    variant = (dtype or settings.VECTOR_STORAGE_DTYPE) if _prefers_binary(accept) else vector_snapshots.JSON
+    media_type = vector_snapshots.media_type_of(variant)
+    headers = {'Vary': 'Accept'}
+    projection = vector_projections.get_export_projection(db, model_id)
+    quantizer = None
+    if variant == vector_snapshot.PQ:
+        quantizer = vector_codebooks.get_export_codebook(db, model_id, projection)
+        if quantizer is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Vector codebook not found. Train one with POST /vectors/codebook."
+            )
+
+    artifact = snapshot_store.get(model_id, variant)
+    if artifact is not None and (
+        artifact.projection_id != (str(projection.projection_id) if projection else None)
+        or (quantizer is not None and artifact.codebook_id != str(quantizer.codebook_id))
+    ):
+        # File dựng trước lần fit PCA / huấn luyện codebook gần nhất: mã hóa trực tiếp tới khi được dựng lại
+        artifact = None
+    if artifact is not None:
+        # File dựng sẵn: ETag là hash nội dung, cursor là của lúc dựng file
+        headers.update({'ETag': artifact.etag, 'X-Sync-Cursor': artifact.cursor.isoformat(), 'Cache-Control': 'no-cache'})
+        if artifact.projection_id:
+            headers['X-Projection-Id'] = artifact.projection_id
+        if if_none_match and _etag_matches(if_none_match, artifact.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if artifact.key:
+            # R2 tự phục vụ Range/ETag của object (tên object theo hash nên không đổi nội dung)
+            return RedirectResponse(snapshot_store.public_url(artifact), status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers)
+        # FileResponse hỗ trợ Range/If-Range để cart tải tiếp khi bị ngắt giữa chừng
+        return FileResponse(artifact.path, media_type=media_type, filename=vector_snapshots.filename_of(variant), headers=headers)
+
+    # Chưa có file dựng sẵn (hoặc tắt tính năng): mã hóa trực tiếp từ database.
+    # Cursor lấy trước khi đọc dữ liệu: thay đổi ghi trong lúc tải sẽ có trong delta kế tiếp.
+    # Không có Content-Length: phản hồi được gửi theo chunked transfer encoding.
+    headers.update({
+        'Content-Disposition': f'attachment; filename="{vector_snapshots.filename_of(variant)}"',
+        'X-Sync-Cursor': vector_snapshots.sync_cursor(db).isoformat(),
+    })
+    if projection is not None:
+        headers['X-Projection-Id'] = str(projection.projection_id)
+    content = vector_snapshots.iter_export(model_id, variant, settings.VECTOR_EXPORT_BATCH_SIZE, projection, quantizer)
+    return StreamingResponse(content=content, media_type=media_type, headers=headers)
+
+
+@router.get("/delta", response_model=schemas.VectorDeltaOut)
+def get_vector_delta(
+    *,
+    db: Session = Depends(get_db),
+    since: datetime = Query(..., description="Cursor của lần đồng bộ trước (`cursor` của `/delta` hoặc header `X-Sync-Cursor` của `/download`)."),
+    model_id: UUID | None = Query(None, description="Model embedding của các vector cart đang có (mặc định model đang phục vụ)."),
+    projection_id: UUID | None = Query(None, description="Projection của các vector cart đang có (`X-Projection-Id` của `/download`)."),
+):
+    """
+    Trả về các thay đổi vector của một model embedding kể từ cursor `since`:
+    vector mới thêm (`vectors`) và id các vector đã xóa (`deleted_ids`). Cart
+    ghi đè vector theo `id`, sau đó mới xóa các `deleted_ids` (một vector có thể
+    vừa được thêm vừa bị xóa trong cùng khoảng), rồi lưu `cursor` cho lần sau.
+
+    `full_resync` là true (danh sách thay đổi rỗng) khi cart phải tải lại toàn
+    bộ qua `/download`: model đang phục vụ khác `model_id`, projection hiện tại
+    khác `projection_id` (PCA được fit lại, bật hoặc tắt), cursor cũ hơn thời
+    gian giữ tombstone, hoặc có hơn VECTOR_SYNC_MAX_VECTORS vector mới.
+    """
+    current_model_id = _resolve_model_id(db)
+    if model_id is not None:
+        _resolve_model_id(db, model_id)
+    cursor = vector_snapshots.sync_cursor(db)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    retention = timedelta(days=settings.VECTOR_TOMBSTONE_RETENTION_DAYS)
+    projection = vector_projections.get_export_projection(db, current_model_id)
+    current_projection_id = projection.projection_id if projection else None
+    full_resync = {
+        "model_id": current_model_id, "projection_id": current_projection_id,
+        "full_resync": True, "cursor": None, "vectors": [], "deleted_ids": [],
     }
-    
-    return StreamingResponse(
-        content=iter(string_io.readline, ''),
-        media_type="application/json",
-        headers=headers
+    if (
+        (model_id is not None and model_id != current_model_id)
+        or projection_id != current_projection_id
+        or since < cursor - retention
+    ):
+        return full_resync
+
+    max_vectors = settings.VECTOR_SYNC_MAX_VECTORS
+    added, deleted_ids = crud.get_product_vector_changes(db, current_model_id, since, max_vectors + 1)
+    if len(added) > max_vectors:
+        return full_resync
+    embeddings = vector_snapshots.export_embeddings([row[2:] for row in added], projection)
+    return {
+        "model_id": current_model_id,
+        "projection_id": current_projection_id,
+        "full_resync": False,
+        "cursor": cursor,
+        "vectors": [
+            {"id": vector_id, "product_id": product_id, "embedding": embedding.tolist()}
+            for (vector_id, product_id, *_), embedding in zip(added, embeddings)
+        ],
+        "deleted_ids": deleted_ids,
+    }
+
+
+@router.get("/projection")
+def download_projection(
+    *,
+    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(None),
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+    projection_id: UUID | None = Query(None, description="Phiên bản projection (mặc định phiên bản đang dùng để xuất vector)."),
+):
+    """
+    Tải ma trận PCA (mean và components) của một phiên bản projection, để cart
+    chiếu embedding truy vấn giống như vector đã tải về:
+    `components @ (x / ||x|| - mean)`. Định dạng mô tả ở
+    `app/core/vector_projection.py`.
+
+    Một phiên bản không bao giờ thay đổi: ETag là id phiên bản, gửi lại
+    `If-None-Match` nhận 304.
+    """
+    if projection_id is not None:
+        projection = vector_projections.load_projection(db, projection_id)
+    else:
+        projection = vector_projections.get_export_projection(db, _resolve_model_id(db, model_id))
+    if projection is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector projection not found.")
+    etag = f'"{projection.projection_id}"'
+    headers = {'ETag': etag, 'X-Projection-Id': str(projection.projection_id)}
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers['Content-Disposition'] = 'attachment; filename="vector_projection.bin"'
+    return Response(
+        content=vector_projection.encode_projection(projection), media_type=vector_projection.MEDIA_TYPE, headers=headers
     )
 
 
+@router.post("/projection", response_model=schemas.VectorProjectionOut, status_code=status.HTTP_201_CREATED)
+def fit_projection(
+    *,
+    db: Session = Depends(get_db),
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+    dims: int | None = Query(None, ge=1, description="Số chiều sau khi chiếu (mặc định VECTOR_PROJECTION_DIMS)."),
+    sample_size: int = Query(
+        settings.VECTOR_PROJECTION_TRAIN_SAMPLE, ge=1, le=100000, description="Số vector ngẫu nhiên dùng để fit PCA."
+    ),
+):
+    """
+    Fit PCA trên các vector của model và lưu thành phiên bản projection mới.
+    Đây là cách duy nhất tạo phiên bản: các lượt tải vector chỉ đọc phiên bản
+    mới nhất, nên sau khi bật VECTOR_PROJECTION_DIMS cần gọi endpoint này một
+    lần (tới lúc đó vector được xuất nguyên chiều), và gọi lại khi catalog thay
+    đổi nhiều. Nếu `dims` bằng VECTOR_PROJECTION_DIMS, phiên bản này được dùng
+    cho các lượt xuất vector tiếp theo, snapshot dựng sẵn được dựng lại và cart
+    nhận `full_resync` ở lần `/delta` kế tiếp.
+    """
+    model_id = _resolve_model_id(db, model_id)
+    dims = dims or settings.VECTOR_PROJECTION_DIMS
+    if dims <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="dims is required when VECTOR_PROJECTION_DIMS is 0.")
+    try:
+        return vector_projections.fit_vector_projection(db, model_id, dims, sample_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/codebook", response_model=schemas.VectorCodebookOut, status_code=status.HTTP_201_CREATED)
+def train_codebook(
+    *,
+    db: Session = Depends(get_db),
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+    subvector_dim: int = Query(
+        settings.VECTOR_PQ_SUBVECTOR_DIM, ge=1, description="Số chiều mỗi đoạn, mã hóa bằng 1 byte (mặc định VECTOR_PQ_SUBVECTOR_DIM)."
+    ),
+    sample_size: int = Query(
+        settings.VECTOR_PQ_TRAIN_SAMPLE, ge=1, le=100000, description="Số vector ngẫu nhiên dùng để huấn luyện codebook."
+    ),
+):
+    """
+    Huấn luyện codebook product quantization trên các vector của model (đã chiếu
+    bằng projection hiện tại nếu có) và lưu thành phiên bản mới. Đây là cách duy
+    nhất tạo codebook: `/download?dtype=pq` và snapshot dựng sẵn chỉ dùng phiên
+    bản mới nhất đã lưu, nên file pq giữ nguyên nội dung và ETag khi vector
+    không đổi. Gọi một lần trước khi dùng `dtype=pq`, sau mỗi lần fit lại PCA
+    (`POST /projection`), và khi catalog thay đổi nhiều.
+    """
+    model_id = _resolve_model_id(db, model_id)
+    try:
+        return vector_codebooks.train_vector_codebook(db, model_id, subvector_dim, sample_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.get("/last-updated", response_model=schemas.LastUpdatedOut)
-def get_last_updated(*, db: Session = Depends(get_db)):
+def get_last_updated(
+    *,
+    db: Session = Depends(get_db),
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+):
     """
-    Get the timestamp of the most recently added product vector.
+    Get the timestamp of the most recently added product vector of an embedding model
+    (the served one by default).
     """
-    latest_timestamp = crud.get_latest_vector_timestamp(session=db)
+    latest_timestamp = crud.get_latest_vector_timestamp(session=db, model_id=_resolve_model_id(db, model_id))
     return {"last_updated": latest_timestamp}
+
+
+@router.post("/compaction", response_model=schemas.VectorCompactionJobOut, status_code=status.HTTP_202_ACCEPTED)
+def compact_vectors(
+    *,
+    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+    max_per_product: int = Query(
+        settings.VECTOR_COMPACTION_MAX_PER_PRODUCT, ge=1, le=1000, description="Số vector tối đa giữ lại cho mỗi sản phẩm."
+    ),
+    duplicate_threshold: float = Query(
+        settings.VECTOR_COMPACTION_DUPLICATE_THRESHOLD, gt=0, le=1, description="Cosine từ ngưỡng này trở lên được coi là trùng."
+    ),
+    queries: int = Query(200, ge=0, le=2000, description="Số vector ngẫu nhiên dùng làm truy vấn để đo recall."),
+    dry_run: bool = Query(False, description="Chỉ tạo báo cáo, không xóa vector."),
+):
+    """
+    Tạo job thu gọn vector của từng sản phẩm: bỏ vector gần trùng (cosine từ
+    `duplicate_threshold`) rồi giữ tối đa `max_per_product` medoid của các cụm
+    k-means. Vector bị bỏ được xóa kèm tombstone nên export, `/delta` và tìm
+    kiếm đều dùng tập đã thu gọn. Báo cáo gồm số vector và kích thước index
+    trước/sau và recall@1/@5 theo sản phẩm của tìm kiếm trên tập thu gọn so với
+    toàn bộ. Chạy `dry_run=true` trước để xem ảnh hưởng.
+
+    Job đọc toàn bộ vector của model, có thể mất vài phút với catalog lớn, nên
+    chạy ở chế độ nền: endpoint trả về job ngay (202), theo dõi trạng thái và
+    lấy báo cáo qua `GET /compaction/{job_id}`.
+    """
+    model_id = _resolve_model_id(db, model_id)
+    job = crud.create_vector_compaction_job(db, VectorCompactionJob(
+        model_id=model_id,
+        max_per_product=max_per_product,
+        duplicate_threshold=duplicate_threshold,
+        queries=queries,
+        dry_run=dry_run,
+    ))
+    background_tasks.add_task(vector_compaction_runner.schedule)
+    return job
+
+
+@router.get("/compaction", response_model=list[schemas.VectorCompactionJobOut])
+def list_compaction_jobs(*, db: Session = Depends(get_db)):
+    """
+    Lists the most recent vector compaction jobs and their reports, newest first.
+    """
+    return crud.get_vector_compaction_jobs(db)
+
+
+@router.get("/compaction/{job_id}", response_model=schemas.VectorCompactionJobOut)
+def get_compaction_job(*, db: Session = Depends(get_db), job_id: UUID):
+    """
+    Get a vector compaction job; `report` is set once its status is COMPLETED.
+    """
+    job = crud.get_vector_compaction_job_by_id(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector compaction job not found.")
+    return job
+
+
+@router.get("/compression-report", response_model=schemas.VectorCompressionReportOut)
+def get_compression_report(
+    *,
+    db: Session = Depends(get_db),
+    model_id: UUID | None = Query(None, description="Embedding model of the vectors (defaults to the served model)."),
+    sample_size: int = Query(5000, ge=10, le=50000, description="Số vector ngẫu nhiên dùng để đánh giá."),
+    queries: int = Query(200, ge=1, le=2000, description="Số vector trong mẫu được dùng làm truy vấn."),
+    subvector_dim: list[int] = Query(
+        [], description="Số chiều mỗi đoạn của các cấu hình pq cần đánh giá (mặc định VECTOR_PQ_SUBVECTOR_DIM).",
+    ),
+):
+    """
+    Đánh giá các dạng nén vector của `/download` trên một mẫu vector của model:
+    với mỗi dạng (float32, int8, pq theo từng `subvector_dim`), trả về số byte
+    mỗi vector (pq không tính codebook dùng chung), tỉ lệ nén so với float32 và
+    recall@1/@5 theo sản phẩm so với kết quả tìm kiếm chính xác trên float32.
+    Mỗi truy vấn là một vector trong mẫu, tìm trên phần còn lại của mẫu, như một
+    ảnh mới của sản phẩm đã có.
+
+    Huấn luyện codebook pq tốn vài giây đến vài chục giây tùy `sample_size` và số chiều.
+    """
+    model_id = _resolve_model_id(db, model_id)
+    if any(dim < 1 for dim in subvector_dim):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="subvector_dim must be positive.")
+    product_ids, sample = vector_compression.sample_product_vectors(db, model_id, sample_size)
+    if len(sample) < 2:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not enough vectors to evaluate.")
+    formats = vector_compression.evaluate_recall(
+        sample, product_ids, queries, subvector_dim or [settings.VECTOR_PQ_SUBVECTOR_DIM]
+    )
+    return {
+        "model_id": model_id,
+        "dim": sample.shape[1],
+        "sample_size": len(sample),
+        "queries": min(queries, len(sample)),
+        "formats": formats,
+    }
+
+
+@router.post(
+    "/search",
+    response_model=schemas.VectorSearchOut,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": schemas.VectorSearchRequest.model_json_schema()},
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                },
+            },
+        }
+    },
+)
+async def search_vectors(
+    request: Request,
+    top_k: int = Query(5, ge=1, le=100, description="Số sản phẩm trả về cho mỗi ảnh (chỉ dùng khi gửi ảnh)."),
+):
+    """
+    Tìm sản phẩm giống nhất theo vector của model embedding đang phục vụ.
+
+    Nhận một trong hai dạng body:
+    - `multipart/form-data` với `file` là ảnh: ảnh được chạy qua pipeline AI,
+      mỗi vật thể phát hiện được cho một phần tử trong `results`.
+    - `application/json` dạng `{"embeddings": [[...], ...], "top_k": 5}`: mỗi
+      embedding cho một phần tử trong `results`.
+
+    Mỗi phần tử của `results` là tối đa `top_k` sản phẩm, sắp xếp theo `score`
+    (cosine similarity, cao nhất trong các vector của sản phẩm) giảm dần.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Multipart body must contain an image `file`."
+            )
+        queries, model_id = await model_manager.predict_async(await file.read())
+    else:
+        try:
+            body = schemas.VectorSearchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        top_k = body.top_k
+        model_id = model_manager.embedding_model_id
+        try:
+            queries = np.array(body.embeddings, dtype=np.float32)
+        except ValueError:
+            queries = None
+        if queries is None or queries.ndim != 2:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="All embeddings must have the same length."
+            )
+
+    if model_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI model is not ready."
+        )
+    results = []
+    if len(queries):
+        try:
+            # Lần tìm đầu sau khi đổi model phải dựng lại index từ database
+            results = await asyncio.to_thread(vector_index.search, model_id, queries, top_k)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {
+        "model_id": model_id,
+        "index_size": vector_index.size,
+        "results": [{"matches": matches} for matches in results],
+    }
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -34,6 +36,116 @@ class Settings(BaseSettings):
     CLOUDFLARE_R2_BUCKET_NAME: str = "your_r2_bucket_name"
     CLOUDFLARE_R2_PUBLIC_URL: str = "https://pub-<YOUR_ACCOUNT_ID>.r2.dev/<YOUR_BUCKET_NAME>" # Example: https://pub-xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx.r2.dev/your-bucket-name
 
+    # --- AI Inference ---
+    # Number of TFLite interpreters created per model. Also bounds the thread pool
+    # that runs predictions, so each worker thread always has an interpreter free.
+    AI_INTERPRETER_POOL_SIZE: int = 2
+    # "thread" runs the pipeline on the interpreter pool above, inside the API process.
+    # "process" runs it in AI_PROCESS_POOL_SIZE worker processes that each load the
+    # models once, so NumPy/OpenCV work is not serialized by the GIL.
+    AI_INFERENCE_BACKEND: Literal["thread", "process"] = "thread"
+    AI_PROCESS_POOL_SIZE: int = 2
+    # Local on-disk cache of downloaded .tflite models. Restarts with unchanged models
+    # load from here without touching R2; least recently used versions are evicted
+    # once the cache grows past AI_MODEL_CACHE_MAX_BYTES.
+    AI_MODEL_CACHE_DIR: str = ".model_cache"
+    AI_MODEL_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2 GiB
+    # In-memory cache of predict results keyed by image content and model pair,
+    # so re-uploads and retried uploads skip inference. Set either value to 0 to disable.
+    AI_PREDICTION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64 MiB
+    AI_PREDICTION_CACHE_TTL_SECONDS: int = 600
+    # Micro-batching of embedding work across concurrent requests ("thread" backend):
+    # crops are collected for up to AI_EMBEDDING_BATCH_MAX_WAIT_MS or until
+    # AI_EMBEDDING_BATCH_MAX_SIZE crops are queued, then embedded in one invoke.
+    AI_EMBEDDING_MICRO_BATCHING: bool = True
+    AI_EMBEDDING_BATCH_MAX_SIZE: int = 32
+    AI_EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    # TFLite interpreter options per model. NUM_THREADS unset (None) leaves the
+    # TFLite default; "xnnpack" keeps the XNNPACK CPU delegate, "none" disables it.
+    AI_CROP_NUM_THREADS: int | None = None
+    AI_CROP_DELEGATE: Literal["xnnpack", "none"] = "xnnpack"
+    AI_EMBEDDING_NUM_THREADS: int | None = None
+    AI_EMBEDDING_DELEGATE: Literal["xnnpack", "none"] = "xnnpack"
+    # When enabled, every model load times AI_INTERPRETER_AUTOTUNE_RUNS invocations at
+    # several thread counts and keeps the fastest, for models whose NUM_THREADS is unset.
+    AI_INTERPRETER_AUTOTUNE: bool = False
+    AI_INTERPRETER_AUTOTUNE_RUNS: int = 5
+    # Per-stage pipeline timings and counters are always aggregated (GET /models/metrics);
+    # this additionally logs one JSON line per prediction.
+    AI_PIPELINE_TRACE_LOG: bool = True
+
+    # --- Bulk Product Image Ingestion ---
+    # Files processed concurrently (R2 upload + inference); together with the per-file
+    # size limit this bounds the memory used by a bulk request, whatever its size.
+    BULK_IMAGE_CONCURRENCY: int = 8
+    # Processed files buffered before their images and vectors are inserted in one commit.
+    BULK_IMAGE_DB_BATCH_SIZE: int = 64
+    BULK_IMAGE_MAX_FILE_BYTES: int = 20 * 1024 * 1024  # 20 MiB
+
+    # --- Re-embedding Jobs ---
+    # After a new embedding model is uploaded, every product image is re-embedded in
+    # batches of REEMBED_BATCH_SIZE images, REEMBED_CONCURRENCY at a time, pausing
+    # REEMBED_PAUSE_SECONDS between batches to leave room for live traffic.
+    REEMBED_BATCH_SIZE: int = 32
+    REEMBED_CONCURRENCY: int = 2
+    REEMBED_PAUSE_SECONDS: float = 0.5
+    # How long a job waits for its model to become active before failing.
+    REEMBED_MODEL_WAIT_SECONDS: float = 900
+
+    # --- Vector Storage & Search ---
+    # Format of newly written embeddings: float32, or int8 with a per-vector scale
+    # (4x smaller, roughly 0.4% relative error per component).
+    VECTOR_STORAGE_DTYPE: Literal["float32", "int8"] = "float32"
+    # Rows fetched per round trip when the in-memory search index is (re)built.
+    VECTOR_INDEX_LOAD_BATCH_SIZE: int = 2000
+    # Rows fetched from the server-side cursor and encoded per chunk by /vectors/download;
+    # bounds the export's memory use regardless of catalog size.
+    VECTOR_EXPORT_BATCH_SIZE: int = 500
+    # Delta sync (GET /vectors/delta): the returned cursor lags the database clock by this
+    # much, so rows written by transactions still open at sync time (created_at is the
+    # transaction start) are picked up by the next sync. Must exceed the longest write.
+    VECTOR_SYNC_SAFETY_LAG_SECONDS: int = 60
+    # Above this many added vectors a cart is told to download a full snapshot instead.
+    VECTOR_SYNC_MAX_VECTORS: int = 1000
+    # Deleted-vector tombstones are kept this long; carts whose cursor is older resync in full.
+    VECTOR_TOMBSTONE_RETENTION_DAYS: int = 30
+    # Prebuilt /vectors/download files (JSON, float32, int8 and pq snapshots) of the served model
+    # and of models carts ask for, rebuilt in the background when vectors change. Files are
+    # kept in VECTOR_SNAPSHOT_DIR (empty disables prebuilding) or uploaded to R2. The directory
+    # also holds the metadata and the builder lock, so all workers must share it: one worker
+    # builds, the others serve what it publishes.
+    VECTOR_SNAPSHOT_DIR: str = ".vector_snapshots"
+    VECTOR_SNAPSHOT_STORAGE: Literal["local", "r2"] = "local"
+    VECTOR_SNAPSHOT_REFRESH_SECONDS: float = 30.0
+    # Product-quantized snapshots (dtype=pq) split each vector into subvectors of
+    # VECTOR_PQ_SUBVECTOR_DIM dimensions, each stored as one byte indexing a 256-entry
+    # codebook trained with k-means on up to VECTOR_PQ_TRAIN_SAMPLE random vectors. Codebooks
+    # are versioned in the database and only trained through POST /vectors/codebook.
+    VECTOR_PQ_SUBVECTOR_DIM: int = 8
+    VECTOR_PQ_TRAIN_SAMPLE: int = 4096
+    # Exported vectors (/vectors/download, /vectors/delta) are projected to VECTOR_PROJECTION_DIMS
+    # dimensions with PCA fitted on up to VECTOR_PROJECTION_TRAIN_SAMPLE random vectors of the
+    # model; 0 exports full embeddings. Fitting only happens through POST /vectors/projection:
+    # until a version with these dimensions exists, full embeddings are exported.
+    # Carts fetch the matrix from GET /vectors/projection.
+    VECTOR_PROJECTION_DIMS: int = 0
+    VECTOR_PROJECTION_TRAIN_SAMPLE: int = 5000
+    # Vector compaction (POST /vectors/compaction): within each product, vectors whose cosine
+    # similarity to a kept one is at least VECTOR_COMPACTION_DUPLICATE_THRESHOLD are dropped, and
+    # the rest are reduced to at most VECTOR_COMPACTION_MAX_PER_PRODUCT cluster medoids.
+    VECTOR_COMPACTION_MAX_PER_PRODUCT: int = 8
+    VECTOR_COMPACTION_DUPLICATE_THRESHOLD: float = 0.98
+    # IVF index: vectors are clustered into VECTOR_INDEX_NLIST lists with k-means and a
+    # query scans the VECTOR_INDEX_NPROBE closest lists. Until there are enough vectors
+    # to train (about 39 per list), or with NLIST <= 1, search is exact.
+    VECTOR_INDEX_NLIST: int = 256
+    VECTOR_INDEX_NPROBE: int = 16
+    # Vectors sampled per list to train the k-means clustering.
+    VECTOR_INDEX_TRAIN_POINTS_PER_LIST: int = 64
+    # Directory where the index of each embedding model is saved, so workers start
+    # without rebuilding it; empty disables persistence.
+    VECTOR_INDEX_DIR: str = ".vector_index"
+
     # Pydantic settings configuration
     model_config = SettingsConfigDict(
         env_file=".env",  # Specifies the file to load environment variables from
@@ -3,3 +3,11 @@ from sqlmodel import create_engine
 from app.core.config import settings
 
 engine = create_engine(settings.DATABASE_URL, echo=False)
+
+# Exports read a table with several statements (count, then cursors); on PostgreSQL they
+# run in REPEATABLE READ so every statement sees the same snapshot of the data.
+export_engine = (
+    engine.execution_options(isolation_level="REPEATABLE READ")
+    if engine.dialect.name == "postgresql"
+    else engine
+)
@@ -0,0 +1,51 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+
+# Stored embedding formats: raw little-endian float32, or int8 with one float scale per vector.
+FLOAT32 = "float32"
+INT8 = "int8"
+DTYPES = {FLOAT32: np.dtype("<f4"), INT8: np.dtype("i1")}
+
+
+def encode_embedding(vector: np.ndarray, dtype: str = FLOAT32) -> Tuple[bytes, float | None]:
+    """
+    Packs an embedding into bytes. int8 uses symmetric per-vector quantization
+    (scale = max |x| / 127); the scale is returned alongside, None for float32.
+    """
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    if dtype == FLOAT32:
+        return vector.astype(DTYPES[FLOAT32], copy=False).tobytes(), None
+    if dtype == INT8:
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return quantized.tobytes(), scale
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+
+def embedding_view(data: bytes, dtype: str) -> np.ndarray:
+    """Read-only NumPy view over the stored bytes, in their stored dtype (no copy)."""
+    return np.frombuffer(data, dtype=DTYPES[dtype])
+
+
+def decode_embedding(data: bytes, dtype: str, scale: float | None) -> np.ndarray:
+    """The embedding as float32: a zero-copy view for float32, dequantized for int8."""
+    values = embedding_view(data, dtype)
+    if dtype == INT8:
+        return values.astype(np.float32) * np.float32(scale)
+    return values
+
+
+def decode_embeddings(rows: Iterable[Tuple[bytes, str, float | None]]) -> np.ndarray:
+    """
+    Stacks (data, dtype, scale) rows into an (n, dim) float32 matrix. Rows stored as
+    float32 are joined and viewed in one step instead of being decoded one by one.
+    """
+    rows = list(rows)
+    if not rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    if all(dtype == FLOAT32 for _, dtype, _ in rows):
+        matrix = np.frombuffer(b"".join(data for data, _, _ in rows), dtype=DTYPES[FLOAT32])
+        return matrix.reshape(len(rows), -1)
+    return np.stack([decode_embedding(data, dtype, scale) for data, dtype, scale in rows])
@@ -0,0 +1,83 @@
+"""
+Binary file of a PCA projection (`GET /vectors/projection`), used by carts to
+project query embeddings the same way as the exported vectors. All integers are
+little-endian:
+
+    offset 0    header (64 bytes):
+                  magic          8s   b"PVPROJ\\x00\\x01"
+                  version        u16  1
+                  reserved       u16
+                  source_dim     u32  dimension of the embedding model
+                  dims           u32  dimension of the projected vectors
+                  model_id       16s  UUID bytes of the embedding model
+                  projection_id  16s  UUID bytes of the projection version
+                  (zero padding up to 64 bytes)
+    offset 64   mean: source_dim x float32
+    then        components: dims x source_dim float32, row-major, starting at a
+                64-byte aligned offset
+
+An embedding x is projected as components @ (x / ||x|| - mean).
+"""
+import struct
+from dataclasses import dataclass
+from uuid import UUID
+
+import numpy as np
+
+MEDIA_TYPE = "application/octet-stream"
+MAGIC = b"PVPROJ\x00\x01"
+VERSION = 1
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+_HEADER = struct.Struct("<8sHHII16s16s")
+
+
+def _components_offset(source_dim: int) -> int:
+    return -(-(HEADER_SIZE + source_dim * 4) // ALIGNMENT) * ALIGNMENT
+
+
+@dataclass
+class Projection:
+    """A projection version. Arrays parsed from a file are views over its buffer."""
+    model_id: UUID
+    projection_id: UUID
+    mean: np.ndarray  # (source_dim,) float32
+    components: np.ndarray  # (dims, source_dim) float32
+
+    @property
+    def dims(self) -> int:
+        return self.components.shape[0]
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Projects (n, source_dim) embeddings to (n, dims) float32."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+        return ((vectors / norms - self.mean) @ self.components.T).astype(np.float32, copy=False)
+
+
+def encode_projection(projection: Projection) -> bytes:
+    dims, source_dim = projection.components.shape
+    header = _HEADER.pack(
+        MAGIC, VERSION, 0, source_dim, dims, projection.model_id.bytes, projection.projection_id.bytes
+    )
+    mean_data = np.ascontiguousarray(projection.mean, dtype="<f4").tobytes()
+    padding = bytes(_components_offset(source_dim) - HEADER_SIZE - len(mean_data))
+    components_data = np.ascontiguousarray(projection.components, dtype="<f4").tobytes()
+    return header.ljust(HEADER_SIZE, b"\x00") + mean_data + padding + components_data
+
+
+def read_projection(buffer) -> Projection:
+    """Parses a projection file from bytes or a memoryview, without copying the arrays."""
+    magic, version, _, source_dim, dims, model_bytes, projection_bytes = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a vector projection file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported projection version: {version}")
+    offset = _components_offset(source_dim)
+    if len(buffer) < offset + dims * source_dim * 4:
+        raise ValueError("Projection file is truncated.")
+    mean = np.frombuffer(buffer, dtype="<f4", count=source_dim, offset=HEADER_SIZE)
+    components = np.frombuffer(buffer, dtype="<f4", count=dims * source_dim, offset=offset).reshape(dims, source_dim)
+    return Projection(UUID(bytes=model_bytes), UUID(bytes=projection_bytes), mean, components)
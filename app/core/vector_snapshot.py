@@ -0,0 +1,270 @@
+"""
+Binary snapshot format for downloading product vectors (`GET /vectors/download`
+with `Accept: application/octet-stream`). All integers are little-endian:
+
+    offset 0    header (64 bytes):
+                  magic      8s   b"PVSNAP\\x00\\x01"
+                  version    u16  2
+                  dtype      u8   0 = float32, 1 = int8, 2 = pq
+                  reserved   u8
+                  dim        u32
+                  count      u64
+                  model_id   16s  UUID bytes of the embedding model
+                  subvectors     u32  pq only: M = ceil(dim / subvector_dim)
+                  subvector_dim  u32  pq only
+                  (zero padding up to offset 48)
+                  projection_id  16s  UUID bytes of the PCA projection the rows were
+                                      projected with (see app/core/vector_projection.py),
+                                      all zero if none; when set, dim is the projected
+                                      dimension
+    offset 64   vector ids: count x 16 bytes (UUID bytes), matched against
+                `deleted_ids` of GET /vectors/delta
+    then        product ids: count x 16 bytes (UUID bytes)
+    then        scales (int8 only): count x float32, value = int8 * scale
+    then        codebook (pq only): M x 256 x subvector_dim float32, starting at
+                a 64-byte aligned offset
+    then        matrix: count x dim float32 or int8, or count x M uint8 pq codes,
+                row-major, starting at a 64-byte aligned offset
+
+pq rows are L2-normalized vectors, zero-padded to M * subvector_dim dimensions;
+subvector m of a row is approximated by codebook[m, code[m]].
+
+Every section sits at an offset computable from the header, so a reader can
+memory-map the file and view the matrix without parsing or copying it.
+"""
+import mmap
+import struct
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+from uuid import UUID
+
+import numpy as np
+
+from app.core import vector_codec
+
+MEDIA_TYPE = "application/octet-stream"
+MAGIC = b"PVSNAP\x00\x01"
+VERSION = 2
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+PQ = "pq"
+PQ_CENTROIDS = 256
+
+_HEADER = struct.Struct("<8sHBBIQ16s")
+_PQ_HEADER = struct.Struct("<II")  # Follows _HEADER
+_PROJECTION_OFFSET = 48
+_DTYPE_CODES = {vector_codec.FLOAT32: 0, vector_codec.INT8: 1, PQ: 2}
+_CODE_DTYPES = {code: dtype for dtype, code in _DTYPE_CODES.items()}
+_MATRIX_DTYPES = {**vector_codec.DTYPES, PQ: np.dtype(np.uint8)}
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+@dataclass
+class SnapshotLayout:
+    """Byte offsets of the sections of a snapshot with the given shape."""
+    dtype: str
+    dim: int
+    count: int
+    vector_ids_offset: int
+    product_ids_offset: int
+    scales_offset: int | None
+    codebook_offset: int | None
+    matrix_offset: int
+    size: int
+    subvector_dim: int = 0
+
+    @property
+    def subvectors(self) -> int:
+        return -(-self.dim // self.subvector_dim) if self.subvector_dim else 0
+
+    @property
+    def row_width(self) -> int:
+        """Matrix columns: dim, or the number of pq codes."""
+        return self.subvectors if self.dtype == PQ else self.dim
+
+    @classmethod
+    def for_shape(cls, dtype: str, dim: int, count: int, subvector_dim: int = 0) -> "SnapshotLayout":
+        if dtype not in _DTYPE_CODES:
+            raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+        if (dtype == PQ) != (subvector_dim > 0):
+            raise ValueError("subvector_dim is required for pq snapshots and only for them.")
+        vector_ids_offset = HEADER_SIZE
+        product_ids_offset = vector_ids_offset + count * 16
+        end = product_ids_offset + count * 16
+        scales_offset = codebook_offset = None
+        if dtype == vector_codec.INT8:
+            scales_offset = end
+            end += count * 4
+        if dtype == PQ:
+            codebook_offset = _align(end)
+            end = codebook_offset + -(-dim // subvector_dim) * PQ_CENTROIDS * subvector_dim * 4
+        matrix_offset = _align(end)
+        layout = cls(
+            dtype, dim, count, vector_ids_offset, product_ids_offset, scales_offset, codebook_offset, matrix_offset, 0,
+            subvector_dim,
+        )
+        layout.size = matrix_offset + count * layout.row_width * _MATRIX_DTYPES[dtype].itemsize
+        return layout
+
+
+@dataclass
+class VectorSnapshot:
+    """A parsed snapshot. The arrays are views over the underlying buffer."""
+    model_id: UUID
+    vector_ids: np.ndarray  # (count, 16) uint8
+    product_ids: np.ndarray  # (count, 16) uint8
+    scales: np.ndarray | None  # (count,) float32, int8 snapshots only
+    matrix: np.ndarray  # (count, dim) float32 or int8, or (count, subvectors) uint8 pq codes
+    codebook: np.ndarray | None = None  # (subvectors, 256, subvector_dim) float32, pq snapshots only
+    dim: int = 0
+    projection_id: UUID | None = None
+
+    @property
+    def dtype(self) -> str:
+        if self.codebook is not None:
+            return PQ
+        return vector_codec.INT8 if self.scales is not None else vector_codec.FLOAT32
+
+    def vector_uuids(self) -> list[UUID]:
+        return [UUID(bytes=row.tobytes()) for row in self.vector_ids]
+
+    def product_uuids(self) -> list[UUID]:
+        return [UUID(bytes=row.tobytes()) for row in self.product_ids]
+
+    def embeddings(self) -> np.ndarray:
+        """
+        The matrix as float32 (the view itself for float32 snapshots). pq rows are
+        reconstructed from the codebook and are L2-normalized approximations.
+        """
+        if self.codebook is not None:
+            parts = self.codebook[np.arange(len(self.codebook)), self.matrix]
+            return parts.reshape(len(self.matrix), -1)[:, :self.dim]
+        if self.scales is None:
+            return self.matrix
+        return self.matrix.astype(np.float32) * self.scales[:, None]
+
+
+def encode_matrix(rows: list, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Converts stored (embedding_data, embedding_dtype, embedding_scale) rows to the
+    snapshot matrix and, for int8, the per-row scales. Rows already stored in the
+    requested dtype are copied as-is instead of being decoded and re-encoded.
+    """
+    if dtype == vector_codec.INT8 and all(stored_dtype == vector_codec.INT8 for _, stored_dtype, _ in rows):
+        matrix = np.frombuffer(b"".join(data for data, _, _ in rows), dtype=np.int8)
+        scales = np.array([scale for _, _, scale in rows], dtype="<f4")
+        return matrix.reshape(len(rows), -1), scales
+    return quantize_matrix(vector_codec.decode_embeddings(rows), dtype)
+
+
+def quantize_matrix(matrix: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Converts a float32 matrix to the snapshot matrix and, for int8, the per-row scales."""
+    if dtype == vector_codec.FLOAT32:
+        return matrix, None
+    encoded = [vector_codec.encode_embedding(vector, vector_codec.INT8) for vector in matrix]
+    quantized = np.frombuffer(b"".join(data for data, _ in encoded), dtype=np.int8)
+    return quantized.reshape(len(matrix), -1), np.array([scale for _, scale in encoded], dtype="<f4")
+
+
+def iter_snapshot_chunks(
+    model_id: UUID,
+    dtype: str,
+    dim: int,
+    count: int,
+    vector_id_chunks: Iterable[np.ndarray],
+    product_id_chunks: Iterable[np.ndarray],
+    matrix_chunks: Iterable[np.ndarray],
+    scale_chunks: Iterable[np.ndarray] | None = None,
+    codebook: np.ndarray | None = None,
+    projection_id: UUID | None = None,
+) -> Iterator[bytes]:
+    """
+    Yields a snapshot of `count` rows section by section, consuming each section's
+    chunks (e.g. one per database batch) as they come, so the whole snapshot is never
+    held in memory. pq snapshots take the (subvectors, 256, subvector_dim) `codebook`
+    and code chunks as `matrix_chunks`; rows projected with a PCA projection are
+    tagged with its `projection_id`. Raises RuntimeError if a section does not have
+    `count` rows.
+    """
+    subvector_dim = codebook.shape[2] if dtype == PQ else 0
+    layout = SnapshotLayout.for_shape(dtype, dim, count, subvector_dim)
+    header = _HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[dtype], 0, dim, count, model_id.bytes)
+    if dtype == PQ:
+        if codebook.shape != (layout.subvectors, PQ_CENTROIDS, subvector_dim):
+            raise RuntimeError(f"Codebook shape {codebook.shape} does not match {dim} dimensions.")
+        header += _PQ_HEADER.pack(layout.subvectors, subvector_dim)
+    header = header.ljust(_PROJECTION_OFFSET, b"\x00") + (projection_id.bytes if projection_id else bytes(16))
+    yield header
+
+    sections = [(vector_id_chunks, np.uint8, 16), (product_id_chunks, np.uint8, 16)]
+    if layout.scales_offset is not None:
+        sections.append((scale_chunks, np.dtype("<f4"), 1))
+    for index, (chunks, section_dtype, width) in enumerate(sections):
+        rows = 0
+        for chunk in chunks:
+            chunk = np.ascontiguousarray(chunk, dtype=section_dtype)
+            rows += chunk.size // width
+            yield chunk.tobytes()
+        if rows != count:
+            raise RuntimeError(f"Snapshot section {index} has {rows} rows, header says {count}.")
+
+    written = layout.product_ids_offset + count * 16 if layout.scales_offset is None else layout.scales_offset + count * 4
+    if layout.codebook_offset is not None:
+        yield bytes(layout.codebook_offset - written)
+        data = np.ascontiguousarray(codebook, dtype="<f4").tobytes()
+        yield data
+        written = layout.codebook_offset + len(data)
+    yield bytes(layout.matrix_offset - written)
+    rows = 0
+    for chunk in matrix_chunks:
+        chunk = np.ascontiguousarray(chunk, dtype=_MATRIX_DTYPES[dtype])
+        if len(chunk) and chunk.shape[1] != layout.row_width:
+            raise RuntimeError(f"Snapshot rows have {chunk.shape[1]} columns, header says {layout.row_width}.")
+        rows += len(chunk)
+        yield chunk.tobytes()
+    if rows != count:
+        raise RuntimeError(f"Snapshot matrix has {rows} rows, header says {count}.")
+
+
+def read_snapshot(buffer) -> VectorSnapshot:
+    """Parses a snapshot from bytes, a memoryview or an mmap, without copying the arrays."""
+    magic, version, dtype_code, _, dim, count, model_bytes = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a product vector snapshot.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported snapshot version: {version}")
+    if dtype_code not in _CODE_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype code: {dtype_code}")
+    dtype = _CODE_DTYPES[dtype_code]
+    subvector_dim = _PQ_HEADER.unpack_from(buffer, _HEADER.size)[1] if dtype == PQ else 0
+    layout = SnapshotLayout.for_shape(dtype, dim, count, subvector_dim)
+    if len(buffer) < layout.size:
+        raise ValueError("Snapshot is truncated.")
+
+    vector_ids = np.frombuffer(buffer, dtype=np.uint8, count=count * 16, offset=layout.vector_ids_offset).reshape(count, 16)
+    product_ids = np.frombuffer(buffer, dtype=np.uint8, count=count * 16, offset=layout.product_ids_offset).reshape(count, 16)
+    scales = None
+    if layout.scales_offset is not None:
+        scales = np.frombuffer(buffer, dtype="<f4", count=count, offset=layout.scales_offset)
+    codebook = None
+    if layout.codebook_offset is not None:
+        codebook = np.frombuffer(
+            buffer, dtype="<f4", count=layout.subvectors * PQ_CENTROIDS * subvector_dim, offset=layout.codebook_offset
+        ).reshape(layout.subvectors, PQ_CENTROIDS, subvector_dim)
+    matrix = np.frombuffer(
+        buffer, dtype=_MATRIX_DTYPES[dtype], count=count * layout.row_width, offset=layout.matrix_offset
+    ).reshape(count, layout.row_width)
+    projection_bytes = bytes(buffer[_PROJECTION_OFFSET:HEADER_SIZE])
+    projection_id = UUID(bytes=projection_bytes) if any(projection_bytes) else None
+    return VectorSnapshot(UUID(bytes=model_bytes), vector_ids, product_ids, scales, matrix, codebook, dim, projection_id)
+
+
+def open_snapshot(path: str) -> VectorSnapshot:
+    """Memory-maps a snapshot file; pages are loaded on access, so opening is O(1)."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_snapshot(mapped)
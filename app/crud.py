@@ -1,19 +1,23 @@
 from uuid import UUID, uuid4
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Tuple
 
+import numpy as np
+from sqlalchemy import delete, insert
 from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select, func
 
 # Import tất cả các model bạn đã định nghĩa
 from app.models import QRAuthToken
 from app import schemas
-from app.core import security
+from app.core import security, vector_codec
+from app.core.config import settings
 from app.models import (
     User, Product, ProductReview, UserFavoriteLink, ProductCategoryLink,
     Category, Promotion, PromotionProductLink, PromotionCategoryLink,
     OrderItem, ProductImage, Order, Notification, ShoppingSession, ShoppingSessionItem,
-    OrderCodeLookup, AIModel, AIModelType, ProductVector, Banner
+    OrderCodeLookup, AIModel, AIModelType, ProductVector, ProductVectorTombstone, Banner,
+    ReembeddingJob, ReembeddingJobStatus, VectorCodebook, VectorCompactionJob, VectorCompactionJobStatus, VectorProjection
 )
 from app.schemas import (
     ProductReviewCreate,
@@ -352,6 +356,17 @@ def get_product_by_barcode(session: Session, barcode: str) -> Product | None:
     statement = select(Product).where(Product.barcode == barcode)
     return session.exec(statement).first()
 
+def get_products_by_ids_or_barcodes(
+    session: Session, product_ids: list[UUID], barcodes: list[str]
+) -> list[Product]:
+    """Retrieves, in one query, all products whose ID or barcode is in the given lists."""
+    if not product_ids and not barcodes:
+        return []
+    statement = select(Product).where(
+        Product.id.in_(product_ids) | Product.barcode.in_(barcodes)
+    )
+    return session.exec(statement).all()
+
 def get_product_by_id_with_relations(session: Session, product_id: UUID) -> Product | None:
     """Retrieves a product by its ID, eagerly loading its images and categories."""
     statement = select(Product).where(Product.id == product_id).options(
@@ -427,8 +442,9 @@ def delete_product(session: Session, product_id: UUID):
     for item in session_items:
         session.delete(item)
 
-    # 7. Delete associated product vectors
+    # 7. Delete associated product vectors, leaving tombstones for cart delta sync
     product_vectors = session.exec(select(ProductVector).where(ProductVector.product_id == product_id)).all()
+    add_vector_tombstones(session, [(vector.id, vector.product_id, vector.model_id) for vector in product_vectors])
     for vector in product_vectors:
         session.delete(vector)
 
@@ -857,16 +873,17 @@ def create_product_vector(
     session: Session,
     product_id: UUID,
     model_id: UUID,
-    embedding: list[float],
+    embedding: np.ndarray,
     image_id: UUID | None = None # New parameter
 ) -> ProductVector:
     """
-    Creates a new product vector.
+    Creates a new product vector, stored in the configured VECTOR_STORAGE_DTYPE.
     """
-    db_vector = ProductVector(
+    db_vector = ProductVector.from_embedding(
+        embedding,
+        settings.VECTOR_STORAGE_DTYPE,
         product_id=product_id,
         model_id=model_id,
-        embedding=embedding,
         image_id=image_id # New field
     )
     session.add(db_vector)
@@ -874,16 +891,121 @@ def create_product_vector(
     session.refresh(db_vector)
     return db_vector
 
-def get_all_product_vectors(session: Session) -> list[ProductVector]:
-    """Retrieves all product vectors from the database."""
-    return session.exec(select(ProductVector)).all()
+def create_product_images_with_vectors(
+    session: Session,
+    images: list[ProductImage],
+    vectors: list[ProductVector],
+) -> None:
+    """
+    Inserts a batch of non-primary product images and their vectors in a single commit.
+    IDs are generated client-side, so vectors can reference their image before the flush;
+    the unit of work inserts the images first and batches the INSERT statements.
+    """
+    session.add_all(images)
+    session.add_all(vectors)
+    session.commit()
+
+def count_product_vectors(session: Session, model_id: UUID) -> int:
+    """Counts the vectors produced by a given embedding model."""
+    statement = select(func.count()).select_from(ProductVector).where(ProductVector.model_id == model_id)
+    return session.exec(statement).one()
+
+
+# Columns of the lightweight vector rows used to build search indexes
+VECTOR_ROW_COLUMNS = (
+    ProductVector.id,
+    ProductVector.product_id,
+    ProductVector.image_id,
+    ProductVector.embedding_data,
+    ProductVector.embedding_dtype,
+    ProductVector.embedding_scale,
+)
+
+
+def iter_product_vector_rows(
+    session: Session,
+    model_id: UUID | None,
+    batch_size: int = 2000,
+    columns: tuple = VECTOR_ROW_COLUMNS,
+):
+    """
+    Yields rows of `columns` for a model's vectors (all models if model_id is None) in
+    lists of up to batch_size, ordered by ID. The result is streamed from a server-side
+    cursor instead of materializing ORM objects, so memory does not grow with the table.
+    """
+    statement = select(*columns).order_by(ProductVector.id).execution_options(yield_per=batch_size)
+    if model_id is not None:
+        statement = statement.where(ProductVector.model_id == model_id)
+    for partition in session.exec(statement).partitions(batch_size):
+        yield partition
+
+
+def iter_product_vector_rows_by_product(session: Session, model_id: UUID, batch_size: int = 2000):
+    """
+    Yields VECTOR_ROW_COLUMNS rows of a model's vectors in lists of up to batch_size, ordered by
+    product and, within a product, newest first, streamed from a server-side cursor.
+    """
+    statement = (
+        select(*VECTOR_ROW_COLUMNS)
+        .where(ProductVector.model_id == model_id)
+        .order_by(ProductVector.product_id, ProductVector.created_at.desc(), ProductVector.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in session.exec(statement).partitions(batch_size):
+        yield partition
+
+
+def get_product_vector_dim(session: Session, model_id: UUID) -> int | None:
+    """Returns the embedding dimension of a model's vectors, or None if it has none."""
+    statement = (
+        select(ProductVector.embedding_data, ProductVector.embedding_dtype)
+        .where(ProductVector.model_id == model_id)
+        .limit(1)
+    )
+    row = session.exec(statement).first()
+    return len(vector_codec.embedding_view(*row)) if row else None
+
+
+def get_product_vector_fingerprint(session: Session, model_id: UUID) -> list:
+    """
+    A cheap, JSON-serializable summary of a model's vectors that changes whenever one is
+    added or deleted: [count, latest created_at, latest tombstone deleted_at].
+    """
+    count, latest_created = session.exec(
+        select(func.count(), func.max(ProductVector.created_at)).where(ProductVector.model_id == model_id)
+    ).one()
+    latest_deleted = session.exec(
+        select(func.max(ProductVectorTombstone.deleted_at)).where(ProductVectorTombstone.model_id == model_id)
+    ).one()
+    return [count, *(value.isoformat() if value else None for value in (latest_created, latest_deleted))]
+
 
+def get_product_vector_ids(session: Session, model_id: UUID) -> list[UUID]:
+    """Retrieves the IDs of all vectors produced by a given embedding model."""
+    return session.exec(select(ProductVector.id).where(ProductVector.model_id == model_id)).all()
 
-def get_latest_vector_timestamp(session: Session) -> datetime | None:
-    """Retrieves the creation timestamp of the most recent product vector."""
-    statement = select(ProductVector).order_by(ProductVector.created_at.desc()).limit(1)
-    latest_vector = session.exec(statement).first()
-    return latest_vector.created_at if latest_vector else None
+
+def get_random_product_vector_ids(session: Session, model_id: UUID, limit: int) -> list[UUID]:
+    """Retrieves up to `limit` randomly chosen vector IDs of a given embedding model."""
+    statement = (
+        select(ProductVector.id)
+        .where(ProductVector.model_id == model_id)
+        .order_by(func.random())
+        .limit(limit)
+    )
+    return session.exec(statement).all()
+
+
+def get_product_vector_rows_by_ids(session: Session, vector_ids: list[UUID]) -> list:
+    """Retrieves VECTOR_ROW_COLUMNS rows for the given vector IDs."""
+    statement = select(*VECTOR_ROW_COLUMNS).where(ProductVector.id.in_(vector_ids))
+    return session.exec(statement).all()
+
+
+def get_latest_vector_timestamp(session: Session, model_id: UUID) -> datetime | None:
+    """Retrieves the creation timestamp of the most recent product vector of a given embedding model."""
+    statement = select(func.max(ProductVector.created_at)).where(ProductVector.model_id == model_id)
+    return session.exec(statement).one()
 
 
 def delete_vectors_by_image_id(session: Session, image_id: UUID) -> int:
@@ -895,12 +1017,280 @@ def delete_vectors_by_image_id(session: Session, image_id: UUID) -> int:
         return 0
         
     count = len(vectors_to_delete)
+    add_vector_tombstones(session, [(vector.id, vector.product_id, vector.model_id) for vector in vectors_to_delete])
     for vector in vectors_to_delete:
         session.delete(vector)
     
     session.commit()
     return count
 
+
+def add_vector_tombstones(session: Session, vectors: list[tuple[UUID, UUID, UUID]]) -> None:
+    """
+    Records (vector_id, product_id, model_id) of vectors being deleted, in the caller's
+    transaction, so carts can remove them through the delta sync.
+    """
+    session.add_all(
+        ProductVectorTombstone(vector_id=vector_id, product_id=product_id, model_id=model_id)
+        for vector_id, product_id, model_id in vectors
+    )
+
+
+def delete_product_vectors(session: Session, vector_ids: list[UUID]) -> int:
+    """Deletes the given product vectors, leaving tombstones, and returns the count."""
+    deleted = session.exec(
+        delete(ProductVector)
+        .where(ProductVector.id.in_(vector_ids))
+        .returning(ProductVector.id, ProductVector.product_id, ProductVector.model_id)
+    ).all()
+    add_vector_tombstones(session, deleted)
+    session.commit()
+    return len(deleted)
+
+
+def purge_vector_tombstones(session: Session, before: datetime) -> int:
+    """Deletes tombstones recorded before `before` and returns the count."""
+    result = session.exec(delete(ProductVectorTombstone).where(ProductVectorTombstone.deleted_at < before))
+    session.commit()
+    return result.rowcount
+
+
+def get_database_time(session: Session) -> datetime:
+    """The database's current timestamp, the clock that created_at / deleted_at are set from."""
+    now = session.exec(select(func.now())).one()
+    # SQLite's CURRENT_TIMESTAMP is naive UTC
+    return now if now.tzinfo is not None else now.replace(tzinfo=timezone.utc)
+
+
+def get_product_vector_changes(
+    session: Session, model_id: UUID, since: datetime, limit: int
+) -> tuple[list, list[UUID]]:
+    """
+    Returns the (id, product_id, embedding_data, embedding_dtype, embedding_scale) rows of a
+    model's vectors created after `since` (at most `limit`, oldest first) and the IDs of its
+    vectors deleted after `since`.
+    """
+    added = session.exec(
+        select(
+            ProductVector.id,
+            ProductVector.product_id,
+            ProductVector.embedding_data,
+            ProductVector.embedding_dtype,
+            ProductVector.embedding_scale,
+        )
+        .where(ProductVector.model_id == model_id, ProductVector.created_at > since)
+        .order_by(ProductVector.created_at)
+        .limit(limit)
+    ).all()
+    deleted = session.exec(
+        select(ProductVectorTombstone.vector_id).where(
+            ProductVectorTombstone.model_id == model_id,
+            ProductVectorTombstone.deleted_at > since,
+        )
+    ).all()
+    return added, deleted
+
+# --- Vector Projection CRUD ---
+
+def create_vector_projection(session: Session, projection: VectorProjection) -> VectorProjection:
+    """Saves a newly fitted projection as the latest version for its model."""
+    session.add(projection)
+    session.commit()
+    session.refresh(projection)
+    return projection
+
+def get_vector_projection_by_id(session: Session, projection_id: UUID) -> VectorProjection | None:
+    """Retrieves a projection version by its ID."""
+    return session.get(VectorProjection, projection_id)
+
+def get_latest_vector_projection_id(session: Session, model_id: UUID, dims: int | None = None) -> UUID | None:
+    """
+    Retrieves the ID of the most recently fitted projection of a model, optionally of a
+    given dimension, without loading its matrices.
+    """
+    statement = select(VectorProjection.id).where(VectorProjection.model_id == model_id)
+    if dims is not None:
+        statement = statement.where(VectorProjection.dims == dims)
+    return session.exec(statement.order_by(VectorProjection.created_at.desc())).first()
+
+# --- Vector Codebook CRUD ---
+
+def create_vector_codebook(session: Session, codebook: VectorCodebook) -> VectorCodebook:
+    """Saves a newly trained codebook as the latest version for its model."""
+    session.add(codebook)
+    session.commit()
+    session.refresh(codebook)
+    return codebook
+
+def get_vector_codebook_by_id(session: Session, codebook_id: UUID) -> VectorCodebook | None:
+    """Retrieves a codebook version by its ID."""
+    return session.get(VectorCodebook, codebook_id)
+
+def get_latest_vector_codebook_id(session: Session, model_id: UUID, projection_id: UUID | None) -> UUID | None:
+    """
+    Retrieves the ID of the most recently trained codebook of a model for vectors projected
+    with `projection_id` (unprojected vectors if None), without loading its centroids.
+    """
+    statement = select(VectorCodebook.id).where(
+        VectorCodebook.model_id == model_id,
+        VectorCodebook.projection_id.is_(None) if projection_id is None else VectorCodebook.projection_id == projection_id,
+    )
+    return session.exec(statement.order_by(VectorCodebook.created_at.desc())).first()
+
+# --- Re-embedding Job CRUD ---
+
+def create_reembedding_job(session: Session, model_id: UUID) -> ReembeddingJob:
+    """
+    Creates a re-embedding job for a new embedding model. Unfinished jobs for older
+    models are marked as superseded: their vectors would be retired by this job anyway.
+    """
+    unfinished = session.exec(
+        select(ReembeddingJob).where(
+            ReembeddingJob.status.in_([ReembeddingJobStatus.PENDING, ReembeddingJobStatus.RUNNING])
+        )
+    ).all()
+    for job in unfinished:
+        job.status = ReembeddingJobStatus.SUPERSEDED
+        session.add(job)
+
+    db_job = ReembeddingJob(model_id=model_id)
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+def get_reembedding_job_by_id(session: Session, job_id: UUID) -> ReembeddingJob | None:
+    """Retrieves a re-embedding job by its ID."""
+    return session.get(ReembeddingJob, job_id)
+
+def get_reembedding_jobs(session: Session, limit: int = 20) -> list[ReembeddingJob]:
+    """Retrieves the most recent re-embedding jobs, newest first."""
+    statement = select(ReembeddingJob).order_by(ReembeddingJob.created_at.desc()).limit(limit)
+    return session.exec(statement).all()
+
+def get_next_reembedding_job(session: Session) -> ReembeddingJob | None:
+    """Retrieves the oldest job still to be run or resumed."""
+    statement = (
+        select(ReembeddingJob)
+        .where(ReembeddingJob.status.in_([ReembeddingJobStatus.PENDING, ReembeddingJobStatus.RUNNING]))
+        .order_by(ReembeddingJob.created_at)
+        .limit(1)
+    )
+    return session.exec(statement).first()
+
+def update_reembedding_job(session: Session, job: ReembeddingJob, **fields) -> ReembeddingJob:
+    """Updates the given fields of a re-embedding job."""
+    for key, value in fields.items():
+        setattr(job, key, value)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+def count_product_images(session: Session) -> int:
+    """Counts all product images."""
+    return session.exec(select(func.count()).select_from(ProductImage)).one()
+
+def get_product_images_after(session: Session, after_id: UUID | None, limit: int) -> list[ProductImage]:
+    """Retrieves up to `limit` product images with an ID greater than `after_id`, in ID order (keyset pagination)."""
+    statement = select(ProductImage).order_by(ProductImage.id).limit(limit)
+    if after_id is not None:
+        statement = statement.where(ProductImage.id > after_id)
+    return session.exec(statement).all()
+
+def save_reembedding_batch(
+    session: Session,
+    job: ReembeddingJob,
+    image_ids: list[UUID],
+    vectors: list[ProductVector],
+    last_image_id: UUID,
+    failed_images: int,
+) -> ReembeddingJob:
+    """
+    Writes the vectors of one batch of images and advances the job checkpoint in the same commit,
+    so a restart never loses or duplicates a batch. Vectors the job's model may already hold for
+    these images (e.g. an upload racing the job) are replaced, leaving tombstones.
+    """
+    if image_ids:
+        replaced = session.exec(
+            delete(ProductVector)
+            .where(
+                ProductVector.image_id.in_(image_ids),
+                ProductVector.model_id == job.model_id,
+            )
+            .returning(ProductVector.id, ProductVector.product_id, ProductVector.model_id)
+        ).all()
+        add_vector_tombstones(session, replaced)
+    session.add_all(vectors)
+    job.last_image_id = last_image_id
+    job.processed_images += len(image_ids)
+    job.failed_images += failed_images
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+def retire_vectors_of_other_models(session: Session, model_id: UUID) -> int:
+    """
+    Deletes the product vectors not produced by `model_id`, leaving tombstones, and returns
+    the count. Vectors of images that have no vector of `model_id` (the job could not process
+    them) are kept, so those images are not left without any vector; vectors without an image
+    cannot be regenerated and are always retired. Tombstones are copied set-based inside the
+    database, so retiring a whole catalog does not load it into memory.
+    """
+    regenerated_images = select(ProductVector.image_id).where(
+        ProductVector.model_id == model_id, ProductVector.image_id.is_not(None)
+    )
+    retired = (ProductVector.model_id != model_id) & (
+        ProductVector.image_id.is_(None) | ProductVector.image_id.in_(regenerated_images)
+    )
+    session.exec(
+        insert(ProductVectorTombstone).from_select(
+            ["vector_id", "product_id", "model_id"],
+            select(ProductVector.id, ProductVector.product_id, ProductVector.model_id).where(retired),
+        )
+    )
+    result = session.exec(delete(ProductVector).where(retired))
+    session.commit()
+    return result.rowcount
+
+# --- Vector Compaction Job CRUD ---
+
+def create_vector_compaction_job(session: Session, job: VectorCompactionJob) -> VectorCompactionJob:
+    """Queues a vector compaction job."""
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+def get_vector_compaction_job_by_id(session: Session, job_id: UUID) -> VectorCompactionJob | None:
+    """Retrieves a vector compaction job by its ID."""
+    return session.get(VectorCompactionJob, job_id)
+
+def get_vector_compaction_jobs(session: Session, limit: int = 20) -> list[VectorCompactionJob]:
+    """Retrieves the most recent vector compaction jobs, newest first."""
+    statement = select(VectorCompactionJob).order_by(VectorCompactionJob.created_at.desc()).limit(limit)
+    return session.exec(statement).all()
+
+def get_next_vector_compaction_job(session: Session) -> VectorCompactionJob | None:
+    """Retrieves the oldest compaction job still to be run or re-run after an interruption."""
+    statement = (
+        select(VectorCompactionJob)
+        .where(VectorCompactionJob.status.in_([VectorCompactionJobStatus.PENDING, VectorCompactionJobStatus.RUNNING]))
+        .order_by(VectorCompactionJob.created_at)
+        .limit(1)
+    )
+    return session.exec(statement).first()
+
+def update_vector_compaction_job(session: Session, job: VectorCompactionJob, **fields) -> VectorCompactionJob:
+    """Updates the given fields of a vector compaction job."""
+    for key, value in fields.items():
+        setattr(job, key, value)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
 # --- ShoppingSessionItem CRUD ---
 
 def get_session_item_by_product_and_session(
@@ -1,9 +1,24 @@
 import asyncio
 from contextlib import asynccontextmanager
+from datetime import timedelta
 from fastapi import FastAPI
+from sqlmodel import Session
 
+from app import crud
 from app.api import auth, sessions, favorites, reviews, categories, promotions, products,notifications,orders, checkout, debug, models, vectors, banners
+from app.core.config import settings
+from app.core.database import engine
 from app.services.ai_service import model_manager
+from app.services.reembedding import reembedding_runner
+from app.services.vector_compaction import vector_compaction_runner
+from app.services.vector_index import vector_index
+from app.services.vector_snapshots import snapshot_store
+
+def purge_expired_vector_tombstones():
+    """Xóa tombstone quá VECTOR_TOMBSTONE_RETENTION_DAYS; cart có cursor cũ hơn sẽ tải lại toàn bộ."""
+    with Session(engine) as session:
+        before = crud.get_database_time(session) - timedelta(days=settings.VECTOR_TOMBSTONE_RETENTION_DAYS)
+        crud.purge_vector_tombstones(session, before)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -11,12 +26,23 @@ async def lifespan(app: FastAPI):
     # Lên lịch cho việc tải model AI chạy ở chế độ nền
     # Server sẽ không chờ tác vụ này hoàn thành
     asyncio.create_task(model_manager.load_models_background())
+    # Tiếp tục các job tạo lại vector bị dừng giữa chừng (chờ model tải xong)
+    asyncio.create_task(reembedding_runner.run_pending())
+    # Chạy lại các job thu gọn vector bị dừng giữa chừng
+    asyncio.create_task(vector_compaction_runner.run_pending())
+    asyncio.create_task(asyncio.to_thread(purge_expired_vector_tombstones))
+    # Dựng sẵn file tải vector ở chế độ nền, làm mới khi vector thay đổi
+    snapshot_task = asyncio.create_task(snapshot_store.run())
 
     print("Startup complete. Server is now online and accepting requests.")
     print("AI models are being loaded in the background...")
     yield
     # Đây là phần shutdown, nếu muốn thêm logic shutdown thì đặt ở đây
     print("Application shutdown...")
+    snapshot_task.cancel()
+    model_manager.shutdown()
+    # Lưu index vector để lần khởi động sau không phải dựng lại từ database
+    await asyncio.to_thread(vector_index.save)
 
 app = FastAPI(
     title="Smart Cart Backend API",
@@ -4,9 +4,12 @@ from datetime import datetime
 from decimal import Decimal
 from typing import Optional
 
-from sqlalchemy import JSON
+import numpy as np
+from sqlalchemy import JSON, Index, LargeBinary
 from sqlmodel import Column, DateTime, Field, Relationship, SQLModel, String, Text, func
 
+from app.core import vector_codec
+
 
 # --- Link Models for Many-to-Many Relationships ---
 
@@ -257,13 +260,18 @@ class AIModel(SQLModel, table=True):
 
 class ProductVector(SQLModel, table=True):
     __tablename__ = "product_vectors"
+    # Exports, delta sync and /last-updated all filter by model and range/sort by creation time
+    __table_args__ = (Index("ix_product_vectors_model_id_created_at", "model_id", "created_at"),)
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     product_id: uuid.UUID = Field(foreign_key="products.id", index=True)
-    model_id: uuid.UUID = Field(foreign_key="ai_models.id", index=True)
+    model_id: uuid.UUID = Field(foreign_key="ai_models.id")
     image_id: uuid.UUID | None = Field(default=None, foreign_key="product_images.id", index=True)
 
-    embedding: list = Field(sa_column=Column(JSON))
+    # Packed embedding (see app.core.vector_codec): little-endian float32, or int8 with a per-vector scale
+    embedding_data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    embedding_dtype: str = Field(default=vector_codec.FLOAT32, sa_column=Column(String(10), nullable=False))
+    embedding_scale: float | None = Field(default=None)
     created_at: datetime | None = Field(
         default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
     )
@@ -272,6 +280,141 @@ class ProductVector(SQLModel, table=True):
     model: "AIModel" = Relationship()
     image: Optional["ProductImage"] = Relationship()
 
+    @classmethod
+    def from_embedding(cls, embedding: np.ndarray, dtype: str = vector_codec.FLOAT32, **fields) -> "ProductVector":
+        """Builds a vector row, packing `embedding` in the given storage dtype."""
+        data, scale = vector_codec.encode_embedding(embedding, dtype)
+        return cls(embedding_data=data, embedding_dtype=dtype, embedding_scale=scale, **fields)
+
+    @property
+    def embedding(self) -> np.ndarray:
+        """The embedding as float32 (a read-only view of `embedding_data` when stored as float32)."""
+        return vector_codec.decode_embedding(self.embedding_data, self.embedding_dtype, self.embedding_scale)
+
+    @property
+    def embedding_raw(self) -> np.ndarray:
+        """Read-only view of `embedding_data` in its stored dtype, without copying or dequantizing."""
+        return vector_codec.embedding_view(self.embedding_data, self.embedding_dtype)
+
+class ProductVectorTombstone(SQLModel, table=True):
+    """Records a deleted product vector so carts can drop it in a delta sync."""
+    __tablename__ = "product_vector_tombstones"
+    __table_args__ = (Index("ix_product_vector_tombstones_model_id_deleted_at", "model_id", "deleted_at"),)
+
+    vector_id: uuid.UUID = Field(primary_key=True)
+    product_id: uuid.UUID = Field(index=True)
+    model_id: uuid.UUID
+    deleted_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    )
+
+class VectorProjection(SQLModel, table=True):
+    """
+    PCA projection of an embedding model's vectors to fewer dimensions. Every fit is a new
+    version; exports use the latest one with the configured dimension.
+    """
+    __tablename__ = "vector_projections"
+    __table_args__ = (Index("ix_vector_projections_model_id_created_at", "model_id", "created_at"),)
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    model_id: uuid.UUID = Field(foreign_key="ai_models.id")
+    source_dim: int
+    dims: int
+    fitted_vectors: int  # Size of the sample the projection was fitted on
+    explained_variance: float  # Fraction of the sample's variance kept by the components
+    # Little-endian float32: mean (source_dim) and components (dims x source_dim), see app.core.vector_projection
+    mean_data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    components_data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+
+class VectorCodebook(SQLModel, table=True):
+    """
+    Product-quantization codebook of an embedding model's vectors (projected with `projection_id`
+    if set). Every training is a new version; pq exports use the latest one matching the export
+    projection.
+    """
+    __tablename__ = "vector_codebooks"
+    __table_args__ = (Index("ix_vector_codebooks_model_id_created_at", "model_id", "created_at"),)
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    model_id: uuid.UUID = Field(foreign_key="ai_models.id")
+    projection_id: uuid.UUID | None = Field(default=None, foreign_key="vector_projections.id")
+    dim: int  # Dimension of the (projected) vectors the codebook encodes
+    subvector_dim: int
+    trained_vectors: int  # Size of the sample the codebook was trained on
+    # Little-endian float32 centroids: subvectors x 256 x subvector_dim, see app.core.vector_snapshot
+    codebook_data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+
+class ReembeddingJobStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    SUPERSEDED = "SUPERSEDED"
+
+class ReembeddingJob(SQLModel, table=True):
+    """Regenerates vectors of every product image with a new embedding model; resumable from `last_image_id`."""
+    __tablename__ = "reembedding_jobs"
+
+    id: uuid.UUID | None = Field(default_factory=uuid.uuid4, primary_key=True)
+    model_id: uuid.UUID = Field(foreign_key="ai_models.id", index=True)
+    status: ReembeddingJobStatus = Field(
+        sa_column=Column(String(20), nullable=False, index=True),
+        default=ReembeddingJobStatus.PENDING
+    )
+    # Checkpoint: images are processed in ascending ID order, up to and including this one
+    last_image_id: uuid.UUID | None = Field(default=None)
+    total_images: int = Field(default=0)
+    processed_images: int = Field(default=0)
+    failed_images: int = Field(default=0)
+    retired_vectors: int = Field(default=0)
+    error: str | None = Field(default=None, sa_column=Column(Text))
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    updated_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), onupdate=func.now())
+    )
+    completed_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+
+class VectorCompactionJobStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+class VectorCompactionJob(SQLModel, table=True):
+    """
+    Compacts one embedding model's vectors in the background (see app.services.vector_compaction);
+    an interrupted job is run again from the start.
+    """
+    __tablename__ = "vector_compaction_jobs"
+
+    id: uuid.UUID | None = Field(default_factory=uuid.uuid4, primary_key=True)
+    model_id: uuid.UUID = Field(foreign_key="ai_models.id", index=True)
+    status: VectorCompactionJobStatus = Field(
+        sa_column=Column(String(20), nullable=False, index=True),
+        default=VectorCompactionJobStatus.PENDING
+    )
+    max_per_product: int
+    duplicate_threshold: float
+    queries: int  # Random vectors used as queries to measure recall
+    dry_run: bool = Field(default=False)
+    report: dict | None = Field(default=None, sa_column=Column(JSON))  # Set on completion
+    error: str | None = Field(default=None, sa_column=Column(Text))
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    updated_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), onupdate=func.now())
+    )
+    completed_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+
 # --- Promotions & Auth ---
 
 class Promotion(SQLModel, table=True):
@@ -2,8 +2,9 @@ from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
 from decimal import Decimal
+from typing import Literal
 
-from app.models import AIModelType
+from app.models import AIModelType, ReembeddingJobStatus, VectorCompactionJobStatus
 
 # ----- Auth Schemas ----
 
@@ -235,6 +236,27 @@ class ProductImageListResponse(BaseModel):
     """Schema for listing multiple product images."""
     images: list[ProductImageOut]
 
+class BulkImageResultOut(BaseModel):
+    """Schema for the outcome of one file in a bulk image ingestion."""
+    filename: str
+    product_key: str | None = Field(..., description="Product ID or barcode the file was mapped to.")
+    product_id: UUID | None = None
+    status: Literal["created", "failed"]
+    image_id: UUID | None = None
+    vector_count: int = 0
+    error: str | None = None
+
+class BulkImageIngestOut(BaseModel):
+    """Schema for the summary of a bulk image ingestion."""
+    total: int
+    created: int
+    failed: int
+    vectors_created: int
+    bytes_processed: int
+    elapsed_seconds: float
+    files_per_second: float
+    results: list[BulkImageResultOut]
+
 class BestSellerProductOut(BaseModel):
     """Schema for returning a best-selling product."""
     id: UUID
@@ -396,12 +418,208 @@ class AIModelListResponse(BaseModel):
     """Schema for listing multiple AI models."""
     models: list[AIModelOut]
 
+class PredictionCacheStatsOut(BaseModel):
+    """Schema for the prediction result cache counters."""
+    entries: int
+    size_bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+
+class EmbeddingBatcherStatsOut(BaseModel):
+    """Schema for the embedding micro-batcher metrics."""
+    queued_requests: int = Field(..., description="Requests waiting to be batched.")
+    queued_crops: int = Field(..., description="Crops waiting to be batched.")
+    batches: int
+    batched_crops: int
+    avg_batch_size: float
+    max_batch_size: int
+    max_wait_ms: float
+    batch_size_histogram: dict[int, int] = Field(..., description="Number of batches run, by batch size (in crops).")
+
+class InterpreterOptionsOut(BaseModel):
+    """Schema for the TFLite interpreter configuration of one model."""
+    num_threads: int | None = Field(..., description="Threads per interpreter; null means the TFLite default.")
+    delegate: str
+    autotune_timings_ms: dict[int, float] | None = Field(
+        None, description="Median invoke time by thread count, when the thread count was auto-tuned."
+    )
+
+class ReembeddingJobOut(BaseModel):
+    """Schema for returning the progress of a re-embedding job."""
+    id: UUID
+    model_id: UUID = Field(..., description="EMBEDDING model the vectors are regenerated with.")
+    status: ReembeddingJobStatus
+    last_image_id: UUID | None = Field(None, description="Checkpoint: last product image processed, in ID order.")
+    total_images: int
+    processed_images: int
+    failed_images: int
+    retired_vectors: int = Field(
+        ..., description="Vectors of other models deleted (with tombstones) on completion; images that failed keep theirs."
+    )
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    completed_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class AIModelStatusOut(BaseModel):
+    """Schema for the serving state of the AI models."""
+    is_ready: bool
+    backend: str
+    active_crop_model_id: UUID | None
+    active_embedding_model_id: UUID | None
+    pending_crop_model_id: UUID | None = Field(None, description="CROP model currently being loaded, if any.")
+    pending_embedding_model_id: UUID | None = Field(None, description="EMBEDDING model currently being loaded, if any.")
+    prediction_cache: PredictionCacheStatsOut
+    embedding_batcher: EmbeddingBatcherStatsOut | None = None
+    crop_interpreter: InterpreterOptionsOut | None = None
+    embedding_interpreter: InterpreterOptionsOut | None = None
+
+
+class HistogramOut(BaseModel):
+    """Schema for a fixed-bucket histogram; percentiles are bucket upper bounds."""
+    count: int
+    sum: float
+    max: float
+    p50: float | None
+    p95: float | None
+    p99: float | None
+    buckets: dict[str, int] = Field(..., description="Observations per bucket, keyed by inclusive upper bound.")
+
+class PipelineMetricsOut(BaseModel):
+    """Schema for the aggregated per-stage metrics of the prediction pipeline."""
+    requests: int = Field(..., description="Pipeline runs, excluding prediction cache hits.")
+    errors: int
+    stages_ms: dict[str, HistogramOut] = Field(..., description="Latency per stage in milliseconds.")
+    counts: dict[str, HistogramOut] = Field(..., description="Per-image bytes decoded, boxes before/after NMS and crops embedded.")
+
 
 # --- Schema for get lastest updated time of product vector table --
 class LastUpdatedOut(BaseModel):
     """Schema for returning the last updated timestamp."""
     last_updated: datetime | None
 
+class VectorSearchRequest(BaseModel):
+    """Schema for searching products by raw embeddings of the active embedding model."""
+    embeddings: list[list[float]] = Field(..., min_length=1, max_length=64)
+    top_k: int = Field(5, ge=1, le=100)
+
+class VectorSearchMatchOut(BaseModel):
+    """Schema for one matching product, scored by cosine similarity."""
+    product_id: UUID
+    score: float
+
+class VectorSearchResultOut(BaseModel):
+    """Schema for the matches of one query embedding (or one detected object)."""
+    matches: list[VectorSearchMatchOut]
+
+class VectorSearchOut(BaseModel):
+    """Schema for vector search results, one entry per query embedding."""
+    model_id: UUID
+    index_size: int
+    results: list[VectorSearchResultOut]
+
+class VectorDeltaItemOut(BaseModel):
+    """Schema for one vector added since the cart's last sync."""
+    id: UUID
+    product_id: UUID
+    embedding: list[float]
+
+class VectorDeltaOut(BaseModel):
+    """
+    Schema for the vector changes of one embedding model since a sync cursor. When
+    `full_resync` is true the cart must download a full snapshot (GET /vectors/download)
+    and the change lists are empty.
+    """
+    model_id: UUID
+    projection_id: UUID | None = Field(None, description="PCA projection the embeddings are projected with, if any.")
+    full_resync: bool
+    cursor: datetime | None
+    vectors: list[VectorDeltaItemOut]
+    deleted_ids: list[UUID]
+
+class VectorProjectionOut(BaseModel):
+    """Schema for returning a fitted PCA projection version (without its matrices)."""
+    id: UUID
+    model_id: UUID
+    source_dim: int
+    dims: int
+    fitted_vectors: int
+    explained_variance: float = Field(..., description="Fraction of the sample's variance kept by the components.")
+    created_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class VectorCodebookOut(BaseModel):
+    """Schema for returning a trained product-quantization codebook version (without its centroids)."""
+    id: UUID
+    model_id: UUID
+    projection_id: UUID | None = Field(None, description="Projection of the vectors the codebook encodes, if any.")
+    dim: int
+    subvector_dim: int
+    trained_vectors: int
+    created_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class VectorCompactionReportOut(BaseModel):
+    """
+    Schema for the result of compacting one embedding model's vectors to a bounded set of
+    representatives per product, with the product-level recall of search on the compacted set
+    against the full set, measured on `queries` random vectors.
+    """
+    products: int
+    compacted_products: int = Field(..., description="Products that lost at least one vector.")
+    vectors_before: int
+    vectors_after: int
+    removed_duplicates: int
+    removed_by_cap: int
+    shrinkage: float = Field(..., description="Fraction of the vectors removed.")
+    index_bytes_before: int
+    index_bytes_after: int
+    queries: int
+    recall_at_1: float
+    recall_at_5: float
+
+class VectorCompactionJobOut(BaseModel):
+    """Schema for returning a vector compaction job, with its report once completed."""
+    id: UUID
+    model_id: UUID
+    status: VectorCompactionJobStatus
+    max_per_product: int
+    duplicate_threshold: float
+    queries: int
+    dry_run: bool
+    report: VectorCompactionReportOut | None = None
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    completed_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class VectorCompressionFormatOut(BaseModel):
+    """Schema for the size and product-level recall of one vector format against float32."""
+    format: str
+    bytes_per_vector: int
+    compression_ratio: float
+    recall_at_1: float
+    recall_at_5: float
+
+class VectorCompressionReportOut(BaseModel):
+    """Schema for the recall of compressed vector formats, measured on a sample of one model's vectors."""
+    model_id: UUID
+    dim: int
+    sample_size: int
+    queries: int
+    formats: list[VectorCompressionFormatOut]
+
 
 # --- New Schemas for Shopping Session Items ---
 
@@ -1,6 +1,13 @@
 import asyncio
 import logging
-from typing import List, Any, Tuple
+import multiprocessing
+import os
+import queue
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Any, Iterator, Tuple
 from uuid import UUID
 import cv2
 
@@ -13,41 +20,753 @@ from sqlmodel import Session
 
 # Giả lập sự tồn tại của module crud và schemas
 from app import crud
+from app.core.config import settings
 # Thêm các import cần thiết cho việc tạo session độc lập
 from app.core.database import engine
 
+from app.models import AIModel
+from app.services.model_cache import ModelFileCache, model_file_cache
+from app.services.pipeline_metrics import PipelineMetrics, PipelineTrace, pipeline_metrics
+from app.services.prediction_cache import CacheKey, PredictionCache, prediction_cache
 from app.services.r2_service import r2_service
 
 # --- Các giá trị Placeholder sẽ được thay thế bằng dữ liệu từ DB --- #
 EMBEDDING_OUTPUT_DIMS = 6912
 # 320x320 -> yolov8-crop
 
+CONFIDENCE_THRESHOLD = 0.7
+IOU_THRESHOLD = 0.4
+
 logging.basicConfig(level=logging.INFO)
 
+
+def decode_yolo_output(
+    output_data: np.ndarray, w_orig: int, h_orig: int, confidence_threshold: float = CONFIDENCE_THRESHOLD
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Giải mã output YOLOv8 (mỗi hàng: x_c, y_c, w, h, score, ...) bằng NumPy.
+
+    Trả về (boxes, scores): boxes là mảng int32 (N, 4) dạng [x_min, y_min, w, h]
+    theo pixel của ảnh gốc, scores là mảng float32 (N,), chỉ gồm các hàng có
+    score vượt ngưỡng. Kết quả có thể truyền thẳng vào `cv2.dnn.NMSBoxes`.
+    """
+    scores = output_data[:, 4]
+    mask = scores > confidence_threshold
+    rows = output_data[mask]
+
+    x_c, y_c, w_box, h_box = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+    boxes = np.empty((rows.shape[0], 4), dtype=np.int32)
+    # astype(int32) cắt phần thập phân về phía 0, giống hệt int() trong vòng lặp cũ
+    boxes[:, 0] = ((x_c - w_box / 2) * w_orig).astype(np.int32)
+    boxes[:, 1] = ((y_c - h_box / 2) * h_orig).astype(np.int32)
+    boxes[:, 2] = (w_box * w_orig).astype(np.int32)
+    boxes[:, 3] = (h_box * h_orig).astype(np.int32)
+    return boxes, scores[mask].astype(np.float32)
+
+
+def clip_boxes_to_image(boxes: np.ndarray, w_orig: int, h_orig: int) -> np.ndarray:
+    """
+    Chuyển box [x_min, y_min, w, h] sang [x_min, y_min, x_max, y_max] và kẹp
+    trong biên ảnh, tránh việc tọa độ âm bị hiểu là chỉ số âm khi cắt ảnh.
+    """
+    clipped = np.empty_like(boxes)
+    clipped[:, 0] = np.clip(boxes[:, 0], 0, w_orig)
+    clipped[:, 1] = np.clip(boxes[:, 1], 0, h_orig)
+    clipped[:, 2] = np.clip(boxes[:, 0] + boxes[:, 2], 0, w_orig)
+    clipped[:, 3] = np.clip(boxes[:, 1] + boxes[:, 3], 0, h_orig)
+    return clipped
+
+
+def _copy_crop_to_int8(src: np.ndarray, dst: np.ndarray):
+    """Ghi crop RGB uint8 vào tensor int8 tại chỗ: x - 128, giống (x.astype(float32) - 128).astype(int8)."""
+    np.subtract(src, 128, out=dst, dtype=np.int16, casting="unsafe")
+
+
+def run_embedding_batch(model: "PreparedInterpreter", crops: List[np.ndarray]) -> np.ndarray:
+    """
+    Chạy embedding model cho cả batch crop RGB uint8 (đã resize đúng kích thước
+    input), trả về mảng (B, D) theo đúng thứ tự đầu vào.
+
+    Crop được ghi thẳng vào buffer input của interpreter, không tạo batch tạm.
+    Nếu model có batch dimension động thì resize input về B và invoke một lần;
+    nếu batch dimension cố định thì chạy theo từng khối đúng kích thước đó,
+    khối cuối được đệm thêm số 0 và phần đệm bị bỏ khỏi kết quả.
+    """
+    batch_size = len(crops)
+
+    if model.batch_is_dynamic:
+        model.resize_batch(batch_size)
+        input_view = model.input_tensor()
+        for i, crop in enumerate(crops):
+            _copy_crop_to_int8(crop, input_view[i])
+        del input_view  # Interpreter không cho invoke khi còn view trỏ vào buffer nội bộ
+        model.interpreter.invoke()
+        return model.interpreter.get_tensor(model.output_index).reshape(batch_size, -1)
+
+    chunk_size = int(model.input_shape[0])
+    result = np.empty((batch_size, model.output_size), dtype=model.output_dtype)
+    for start in range(0, batch_size, chunk_size):
+        chunk = crops[start:start + chunk_size]
+        input_view = model.input_tensor()
+        for i, crop in enumerate(chunk):
+            _copy_crop_to_int8(crop, input_view[i])
+        input_view[len(chunk):] = 0
+        del input_view
+        model.interpreter.invoke()
+        output_view = model.output_tensor()
+        result[start:start + len(chunk)] = output_view.reshape(chunk_size, -1)[:len(chunk)]
+        del output_view
+    return result
+
+
+class InterpreterOptions:
+    """
+    Tùy chọn dựng `tf.lite.Interpreter` cho một model: số luồng và delegate.
+    `autotune_timings_ms` (thời gian invoke trung vị theo số luồng) chỉ có khi
+    số luồng được chọn bằng auto-tune.
+    """
+    def __init__(
+        self,
+        num_threads: int | None = None,
+        delegate: str = "xnnpack",
+        autotune_timings_ms: dict[int, float] | None = None,
+    ):
+        self.num_threads = num_threads
+        self.delegate = delegate
+        self.autotune_timings_ms = autotune_timings_ms
+
+    def interpreter_kwargs(self) -> dict:
+        kwargs: dict[str, Any] = {"num_threads": self.num_threads}
+        if self.delegate == "none":
+            # Resolver mặc định tự áp XNNPACK; bản này giữ kernel builtin thuần
+            kwargs["experimental_op_resolver_type"] = (
+                tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+            )
+        return kwargs
+
+    def to_dict(self) -> dict:
+        return {
+            "num_threads": self.num_threads,
+            "delegate": self.delegate,
+            "autotune_timings_ms": self.autotune_timings_ms,
+        }
+
+
+class PreparedInterpreter:
+    """
+    Interpreter TFLite kèm metadata tensor đã cache sẵn.
+
+    `get_input_details()`/`get_output_details()` tạo dict mới mỗi lần gọi, nên
+    chỉ được đọc lại khi kích thước tensor thay đổi. `input_tensor()` và
+    `output_tensor()` trả về view NumPy trỏ thẳng vào buffer của interpreter;
+    view phải được bỏ đi trước khi gọi `invoke()`.
+    """
+    def __init__(self, interpreter: Any):
+        self.interpreter = interpreter
+        self._resize_buffer: np.ndarray | None = None
+        self._refresh()
+
+    @classmethod
+    def from_path(cls, model_path: str, options: InterpreterOptions | None = None) -> "PreparedInterpreter":
+        options = options or InterpreterOptions()
+        interpreter = tf.lite.Interpreter(model_path=model_path, **options.interpreter_kwargs())
+        interpreter.allocate_tensors()
+        return cls(interpreter)
+
+    def _refresh(self):
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.input_shape = tuple(int(d) for d in input_details['shape'])
+        self.input_dtype = input_details['dtype']
+        self.batch_is_dynamic = input_details['shape_signature'][0] == -1
+        self.output_index = output_details['index']
+        self.output_dtype = output_details['dtype']
+        self.output_size = int(np.prod(output_details['shape'][1:]))
+        self.input_tensor = self.interpreter.tensor(self.input_index)
+        self.output_tensor = self.interpreter.tensor(self.output_index)
+
+    def resize_batch(self, batch_size: int):
+        """Đổi batch dimension của input (chỉ cấp phát lại khi kích thước thực sự đổi)."""
+        if self.input_shape[0] != batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, (batch_size, *self.input_shape[1:]))
+            self.interpreter.allocate_tensors()
+            self._refresh()
+
+    def resize_buffer(self, height: int, width: int, channels: int) -> np.ndarray:
+        """Buffer uint8 dùng lại giữa các request làm đích cho `cv2.resize`."""
+        shape = (height, width, channels)
+        if self._resize_buffer is None or self._resize_buffer.shape != shape:
+            self._resize_buffer = np.empty(shape, dtype=np.uint8)
+        return self._resize_buffer
+
+    def warm_up(self):
+        """Chạy thử một lần với input toàn số 0 để lần invoke đầu tiên không rơi vào request thật."""
+        input_view = self.input_tensor()
+        input_view.fill(0)
+        del input_view
+        self.interpreter.invoke()
+
+
+class InterpreterPool:
+    """
+    Nhóm N interpreter TFLite dựng từ cùng một file model.
+
+    Một `tf.lite.Interpreter` không dùng đồng thời được từ nhiều luồng, nên mỗi
+    request mượn riêng một interpreter qua `checkout()` và trả lại khi xong.
+    """
+    def __init__(self, model_path: str, size: int, options: InterpreterOptions | None = None):
+        self.size = size
+        self.options = options or InterpreterOptions()
+        self._available: queue.Queue = queue.Queue()
+        for _ in range(size):
+            model = PreparedInterpreter.from_path(model_path, self.options)
+            model.warm_up()
+            self._available.put(model)
+        # Metadata không phụ thuộc batch dimension, giống nhau cho mọi interpreter trong pool
+        self.input_shape = model.input_shape
+        self.output_size = model.output_size
+        self.output_dtype = model.output_dtype
+
+    @contextmanager
+    def checkout(self) -> Iterator[PreparedInterpreter]:
+        """Mượn một interpreter rảnh (chờ nếu tất cả đang bận) và trả lại khi xong."""
+        model = self._available.get()
+        try:
+            yield model
+        finally:
+            self._available.put(model)
+
+
+def autotune_thread_candidates(concurrency: int) -> List[int]:
+    """
+    Các số luồng được thử khi auto-tune: 1, các lũy thừa của 2 và số CPU chia
+    đều cho `concurrency` interpreter chạy song song, để cả pool không dùng
+    nhiều luồng hơn số CPU.
+    """
+    limit = max(1, (os.cpu_count() or 1) // max(1, concurrency))
+    candidates = {limit}
+    threads = 1
+    while threads < limit:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def autotune_interpreter_options(
+    model_path: str, delegate: str, thread_candidates: List[int], runs: int
+) -> InterpreterOptions:
+    """
+    Đo thời gian invoke trung vị của model với từng số luồng (sau một lần làm
+    nóng) và trả về tùy chọn nhanh nhất kèm toàn bộ số đo. Model có batch
+    dimension động được đo với batch 1.
+    """
+    timings_ms: dict[int, float] = {}
+    for num_threads in thread_candidates:
+        model = PreparedInterpreter.from_path(model_path, InterpreterOptions(num_threads, delegate))
+        model.warm_up()
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.interpreter.invoke()
+            samples.append(time.perf_counter() - start)
+        timings_ms[num_threads] = round(float(np.median(samples)) * 1000, 3)
+
+    best = min(timings_ms, key=timings_ms.get)
+    logging.info(f"Auto-tune {model_path}: {timings_ms} ms -> {best} luồng.")
+    return InterpreterOptions(best, delegate, timings_ms)
+
+
+@contextmanager
+def _pipeline_errors() -> Iterator[None]:
+    """Ghi log và chuyển mọi lỗi trong pipeline thành HTTP 500."""
+    try:
+        yield
+    except Exception as e:
+        logging.error(f"Lỗi trong pipeline dự đoán: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý AI: {e}")
+
+
+def decode_image(image_data: bytes) -> np.ndarray:
+    """Giải mã bytes ảnh thành frame BGR uint8; báo 400 nếu không đọc được."""
+    nparr = np.frombuffer(image_data, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise HTTPException(status_code=400, detail="Không đọc được ảnh từ dữ liệu input.")
+    return frame
+
+
+def detect_boxes(crop_model: PreparedInterpreter, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Chạy YOLO trên frame và giải mã output thành (boxes, scores) theo pixel ảnh gốc, trước NMS."""
+    h_orig, w_orig, _ = frame.shape
+
+    # Resize input cho YOLO, ghi thẳng vào buffer input của interpreter
+    input_shape_yolo = crop_model.input_shape
+    resize_buffer = crop_model.resize_buffer(input_shape_yolo[2], input_shape_yolo[1], input_shape_yolo[3])
+    img_resized = cv2.resize(frame, (input_shape_yolo[1], input_shape_yolo[2]), dst=resize_buffer)
+    input_view = crop_model.input_tensor()
+    np.divide(img_resized, np.float32(255.0), out=input_view[0])
+    del input_view
+    crop_model.interpreter.invoke()
+    output_data = crop_model.interpreter.get_tensor(crop_model.output_index)[0].T
+
+    # Giải mã output YOLO thành box & score cho NMS (vector hóa)
+    return decode_yolo_output(output_data, w_orig, h_orig)
+
+
+def select_boxes(boxes: np.ndarray, scores: np.ndarray, w_orig: int, h_orig: int) -> np.ndarray:
+    """NMS với OpenCV, trả về các box còn lại dạng [x_min, y_min, x_max, y_max] đã kẹp trong ảnh."""
+    surviving_indices = cv2.dnn.NMSBoxes(boxes, scores, CONFIDENCE_THRESHOLD, IOU_THRESHOLD)
+    if surviving_indices is None or len(surviving_indices) == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    surviving_indices = np.array(surviving_indices).flatten()
+    return clip_boxes_to_image(boxes[surviving_indices], w_orig, h_orig)
+
+
+def crop_and_resize(frame: np.ndarray, crop_boxes: np.ndarray, input_shape_emb: Tuple[int, ...]) -> List[np.ndarray]:
+    """Cắt từng box khỏi frame, đổi BGR->RGB và resize về kích thước input của embedding model."""
+    crops = []
+    for x_min, y_min, x_max, y_max in crop_boxes:
+        crop = frame[y_min:y_max, x_min:x_max]
+        if crop.size == 0:
+            continue
+
+        # Resize + convert BGR->RGB
+        img_pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+        img_resized = img_pil.resize((input_shape_emb[1], input_shape_emb[2]))
+        crops.append(np.asarray(img_resized))
+    return crops
+
+
+def extract_crops(
+    crop_model: PreparedInterpreter,
+    input_shape_emb: Tuple[int, ...],
+    image_data: bytes,
+    trace: PipelineTrace | None = None,
+) -> List[np.ndarray]:
+    """
+    Giai đoạn phát hiện của pipeline: giải mã ảnh, chạy YOLO, NMS rồi cắt và
+    resize từng vùng về kích thước input của embedding model. Trả về danh sách
+    crop RGB uint8 sẵn sàng cho `run_embedding_batch`. Thời gian từng giai đoạn
+    và số box được ghi vào `trace` nếu có.
+    """
+    logging.info("Bắt đầu pipeline dự đoán...")
+    trace = trace or PipelineTrace()
+
+    with _pipeline_errors():
+        # 1️⃣ Đọc ảnh với OpenCV
+        trace.count("bytes_decoded", len(image_data))
+        with trace.stage("decode"):
+            frame = decode_image(image_data)
+        h_orig, w_orig, _ = frame.shape
+
+        # 2️⃣ + 3️⃣ YOLO và giải mã output
+        with trace.stage("yolo"):
+            boxes_for_nms, scores_for_nms = detect_boxes(crop_model, frame)
+        trace.count("boxes_before_nms", len(boxes_for_nms))
+
+        # 4️⃣ NMS với OpenCV
+        with trace.stage("nms"):
+            crop_boxes = select_boxes(boxes_for_nms, scores_for_nms, w_orig, h_orig)
+        trace.count("boxes_after_nms", len(crop_boxes))
+
+        # 5️⃣ Crop & resize cho embedding
+        with trace.stage("crop_resize"):
+            return crop_and_resize(frame, crop_boxes, input_shape_emb)
+
+
+def run_pipeline(
+    crop_model: PreparedInterpreter,
+    embedding_model: PreparedInterpreter,
+    image_data: bytes,
+    trace: PipelineTrace | None = None,
+) -> np.ndarray:
+    """
+    Chạy pipeline AI trên một cặp interpreter mà luồng/tiến trình gọi đang giữ riêng.
+    Trả về mảng vector (số crop, D); chỉ chuyển sang list khi lưu vào database.
+    """
+    trace = trace or PipelineTrace()
+    crops = extract_crops(crop_model, embedding_model.input_shape, image_data, trace)
+    trace.count("crops_embedded", len(crops))
+    if not crops:
+        return np.empty((0, embedding_model.output_size), dtype=embedding_model.output_dtype)
+    # 6️⃣ Embedding (gộp tất cả crop thành một batch)
+    with _pipeline_errors(), trace.stage("embedding"):
+        return run_embedding_batch(embedding_model, crops)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batcher asyncio đặt trước embedding model (backend "thread").
+
+    Crop của các request đồng thời được gom lại trong tối đa `max_wait_ms`
+    hoặc tới khi đủ `max_batch_size` crop, chạy chung một lần invoke trên một
+    interpreter của pool, rồi kết quả được chia lại cho từng request theo đúng
+    thứ tự. Crop của một request không bao giờ bị tách sang hai batch. Số batch
+    chạy song song không vượt quá số interpreter; khi tất cả đều bận, hàng đợi
+    dài ra và batch kế tiếp tự nhiên lớn hơn.
+
+    Sau `close()` (khi cặp model bị thay), request vẫn giữ cặp cũ gọi `embed`
+    chạy thẳng trên pool của cặp đó thay vì xếp hàng sau tín hiệu dừng.
+    """
+    def __init__(self, pool: InterpreterPool, executor: ThreadPoolExecutor, max_batch_size: int, max_wait_ms: float):
+        self.pool = pool
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self._closed = False
+        # Số liệu để tinh chỉnh khi chạy tải
+        self.queued_requests = 0
+        self.queued_crops = 0
+        self.batches = 0
+        self.batched_crops = 0
+        self.batch_size_counts: Counter = Counter()
+
+    async def embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Đưa crop của một request vào hàng đợi và chờ vector tương ứng."""
+        if not crops:
+            return np.empty((0, self.pool.output_size), dtype=self.pool.output_dtype)
+        if self._closed:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._run_batch, crops)
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.pool.size)
+            self._task = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        self.queued_requests += 1
+        self.queued_crops += len(crops)
+        self._queue.put_nowait((crops, future))
+        return await future
+
+    def close(self):
+        """Dừng vòng gom batch sau khi các request đã xếp hàng được xử lý xong."""
+        self._closed = True
+        if self._queue is not None:
+            self._queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "queued_requests": self.queued_requests,
+            "queued_crops": self.queued_crops,
+            "batches": self.batches,
+            "batched_crops": self.batched_crops,
+            "avg_batch_size": self.batched_crops / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size_histogram": dict(sorted(self.batch_size_counts.items())),
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[List[np.ndarray], asyncio.Future]] = []
+        try:
+            closing = False
+            while not closing:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = loop.time() + self.max_wait
+                await self._slots.acquire()
+
+                size = len(item[0])
+                while size < self.max_batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self._queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append(item)
+                    size += len(item[0])
+                self._dispatch(batch)
+                batch = []
+
+            # Request còn trong hàng đợi sau tín hiệu dừng vẫn được chạy, mỗi request một batch
+            for item in self._drain():
+                batch = [item]
+                await self._slots.acquire()
+                self._dispatch(batch)
+                batch = []
+        finally:
+            # Vòng gom bị hủy giữa chừng (ví dụ event loop dừng): báo lỗi thay vì để request chờ mãi
+            self._fail(batch + self._drain(), HTTPException(status_code=503, detail="Micro-batcher embedding đã dừng."))
+
+    def _drain(self) -> List[Tuple[List[np.ndarray], asyncio.Future]]:
+        items = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                items.append(item)
+        return items
+
+    def _dispatch(self, batch: List[Tuple[List[np.ndarray], asyncio.Future]]):
+        size = sum(len(request_crops) for request_crops, _ in batch)
+        self.queued_requests -= len(batch)
+        self.queued_crops -= size
+        self.batches += 1
+        self.batched_crops += size
+        self.batch_size_counts[size] += 1
+
+        task = asyncio.create_task(self._execute(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[List[np.ndarray], asyncio.Future]], error: BaseException):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _execute(self, batch: List[Tuple[List[np.ndarray], asyncio.Future]]):
+        try:
+            crops = [crop for request_crops, _ in batch for crop in request_crops]
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(self.executor, self._run_batch, crops)
+        except asyncio.CancelledError:
+            self._fail(batch, HTTPException(status_code=503, detail="Micro-batcher embedding đã dừng."))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+        else:
+            offset = 0
+            for request_crops, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(request_crops)])
+                offset += len(request_crops)
+        finally:
+            self._slots.release()
+
+    def _run_batch(self, crops: List[np.ndarray]) -> np.ndarray:
+        with _pipeline_errors(), self.pool.checkout() as model:
+            return run_embedding_batch(model, crops)
+
+
+class _WorkerHTTPError(Exception):
+    """HTTPException không pickle được, nên tiến trình con gửi lỗi về dưới dạng này."""
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# Trạng thái riêng của mỗi tiến trình con: (crop interpreter, embedding interpreter, embedding model id)
+_worker_models: Tuple[PreparedInterpreter, PreparedInterpreter, UUID | None] | None = None
+
+
+def _init_process_worker(
+    crop_path: str,
+    crop_options: InterpreterOptions,
+    embedding_path: str,
+    embedding_options: InterpreterOptions,
+    embedding_model_id: UUID | None,
+):
+    """Initializer của tiến trình con: dựng interpreter một lần cho cả vòng đời tiến trình."""
+    global _worker_models
+    crop_model = PreparedInterpreter.from_path(crop_path, crop_options)
+    embedding_model = PreparedInterpreter.from_path(embedding_path, embedding_options)
+    crop_model.warm_up()
+    embedding_model.warm_up()
+    _worker_models = (crop_model, embedding_model, embedding_model_id)
+
+
+def _process_worker_ready() -> UUID | None:
+    """Tác vụ rỗng dùng để chờ tiến trình con khởi tạo xong model."""
+    return _worker_models[2]
+
+
+def _process_worker_predict(image_data: bytes) -> Tuple[np.ndarray, UUID | None, PipelineTrace]:
+    """
+    Chạy pipeline trong tiến trình con, trả về (vectors, embedding_model_id, trace)
+    với model id của chính tiến trình đó.
+    """
+    crop_model, embedding_model, embedding_model_id = _worker_models
+    trace = PipelineTrace()
+    try:
+        return run_pipeline(crop_model, embedding_model, image_data, trace), embedding_model_id, trace
+    except HTTPException as e:
+        raise _WorkerHTTPError(e.status_code, e.detail) from None
+
+
+class ProcessInferenceBackend:
+    """
+    Chạy pipeline AI trong một nhóm tiến trình con để tiền/hậu xử lý NumPy/OpenCV
+    không tranh GIL với event loop và với nhau.
+
+    Mỗi lần `load` dựng một nhóm tiến trình mới với model mới rồi mới thay thế
+    nhóm cũ; các request đã gửi cho nhóm cũ vẫn chạy xong trên model cũ.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def load(
+        self,
+        crop_path: str,
+        crop_options: InterpreterOptions,
+        embedding_path: str,
+        embedding_options: InterpreterOptions,
+        embedding_model_id: UUID | None,
+    ):
+        executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            # TensorFlow không an toàn khi fork, nên luôn dùng spawn
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process_worker,
+            initargs=(crop_path, crop_options, embedding_path, embedding_options, embedding_model_id),
+        )
+        try:
+            # Chờ một tiến trình khởi tạo xong để lỗi model lộ ra ngay lúc tải
+            await asyncio.wrap_future(executor.submit(_process_worker_ready))
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+        old_executor, self._executor = self._executor, executor
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+    def submit(self, image_data: bytes) -> Future:
+        if self._executor is None:
+            raise HTTPException(status_code=503, detail="Model AI chưa sẵn sàng hoặc bị lỗi.")
+        return self._executor.submit(_process_worker_predict, image_data)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ModelSet:
+    """
+    Một cặp model crop + embedding đã được tải và làm nóng hoàn chỉnh.
+
+    ModelManager chỉ thay cả cặp bằng một phép gán duy nhất, nên mỗi request
+    luôn thấy một cặp nhất quán và chạy xong trên cặp nó đã lấy, kể cả khi
+    một cặp mới được kích hoạt giữa chừng. Với backend "process" các pool để
+    trống vì interpreter nằm trong tiến trình con.
+    """
+    def __init__(
+        self,
+        crop_model_id: UUID | None,
+        embedding_model_id: UUID | None,
+        crop_pool: InterpreterPool | None = None,
+        embedding_pool: InterpreterPool | None = None,
+        batcher: EmbeddingBatcher | None = None,
+        crop_options: InterpreterOptions | None = None,
+        embedding_options: InterpreterOptions | None = None,
+    ):
+        self.crop_model_id = crop_model_id
+        self.embedding_model_id = embedding_model_id
+        self.crop_pool = crop_pool
+        self.embedding_pool = embedding_pool
+        self.batcher = batcher
+        self.crop_options = crop_options
+        self.embedding_options = embedding_options
+
+
 class ModelManager:
     """
     Quản lý vòng đời và thực thi của các model TFLite.
     Model được tải về từ URL trong database.
+
+    Model được giữ theo kiểu double-buffer: cặp đang phục vụ (`active`) và cặp
+    đang được tải (`pending`). Cặp mới được tải và làm nóng hoàn toàn ngoài
+    luồng xử lý request rồi mới được thay vào một cách nguyên tử.
     """
-    def __init__(self):
-        self.crop_model: Any = None
-        self.embedding_model: Any = None
-        self.embedding_model_id: UUID | None = None # LƯU LẠI ID CỦA MODEL EMBEDDING
-        self.is_ready: bool = False
-        self._lock = asyncio.Lock() # Lock để xử lý truy cập đa luồng
+    def __init__(
+        self,
+        pool_size: int = settings.AI_INTERPRETER_POOL_SIZE,
+        backend: str = settings.AI_INFERENCE_BACKEND,
+        process_pool_size: int = settings.AI_PROCESS_POOL_SIZE,
+        model_cache: ModelFileCache = model_file_cache,
+        result_cache: PredictionCache = prediction_cache,
+        crop_options: InterpreterOptions | None = None,
+        embedding_options: InterpreterOptions | None = None,
+        autotune: bool = settings.AI_INTERPRETER_AUTOTUNE,
+        metrics: PipelineMetrics = pipeline_metrics,
+    ):
+        self._active: ModelSet | None = None
+        self._pending: ModelSet | None = None
+        self.pool_size = pool_size
+        self.model_cache = model_cache
+        self.prediction_cache = result_cache
+        self.metrics = metrics
+        self.crop_options = crop_options or InterpreterOptions(settings.AI_CROP_NUM_THREADS, settings.AI_CROP_DELEGATE)
+        self.embedding_options = embedding_options or InterpreterOptions(
+            settings.AI_EMBEDDING_NUM_THREADS, settings.AI_EMBEDDING_DELEGATE
+        )
+        self.autotune = autotune
+        self._lock = asyncio.Lock() # Chỉ một lượt tải model chạy tại một thời điểm
+        # Số luồng bằng số interpreter mỗi model, nên không luồng nào phải chờ interpreter
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="ai-predict")
+        # Backend "process": pipeline chạy trong tiến trình con thay vì trong các interpreter ở trên
+        self.backend = backend
+        self._process_backend = (
+            ProcessInferenceBackend(process_pool_size) if backend == "process" else None
+        )
 
-    async def _load_model_from_url(self, model_url: str) -> Any:
-        """Hàm nội bộ để tải một model .tflite từ URL."""
+    @property
+    def is_ready(self) -> bool:
+        return self._active is not None
+
+    @property
+    def embedding_model_id(self) -> UUID | None:
+        """ID của model embedding đang phục vụ."""
+        active = self._active
+        return active.embedding_model_id if active is not None else None
+
+    def status(self) -> dict:
+        """Trạng thái model: backend, cặp model đang phục vụ và cặp đang được tải (nếu có)."""
+        active, pending = self._active, self._pending
+        return {
+            "is_ready": active is not None,
+            "backend": self.backend,
+            "active_crop_model_id": active.crop_model_id if active else None,
+            "active_embedding_model_id": active.embedding_model_id if active else None,
+            "pending_crop_model_id": pending.crop_model_id if pending else None,
+            "pending_embedding_model_id": pending.embedding_model_id if pending else None,
+            "prediction_cache": self.prediction_cache.stats(),
+            "embedding_batcher": active.batcher.stats() if active and active.batcher else None,
+            "crop_interpreter": active.crop_options.to_dict() if active and active.crop_options else None,
+            "embedding_interpreter": (
+                active.embedding_options.to_dict() if active and active.embedding_options else None
+            ),
+        }
+
+    async def _fetch_model(self, model_info: AIModel) -> str:
+        """
+        Hàm nội bộ trả về đường dẫn file .tflite của model trong cache đĩa,
+        chỉ tải từ R2 khi model chưa có trong cache hoặc file cache bị hỏng.
+        """
+        cached_path = self.model_cache.get(model_info.id, model_info.file_path)
+        if cached_path is not None:
+            logging.info(f"Dùng model {model_info.id} từ cache: {cached_path}")
+            return cached_path
+
+        model_url = r2_service.get_public_url(model_info.file_path)
         async with httpx.AsyncClient() as client:
             try:
                 logging.info(f"Đang tải model từ: {model_url}")
-                response = await client.get(model_url, timeout=300)
-                response.raise_for_status()
-                model_content = response.content
-                interpreter = tf.lite.Interpreter(model_content=model_content)
-                interpreter.allocate_tensors()
-                logging.info(f"Đã tải và khởi tạo model từ {model_url} thành công.")
-                return interpreter
+                async with client.stream("GET", model_url, timeout=300) as response:
+                    response.raise_for_status()
+                    with self.model_cache.writer(model_info.id, model_info.file_path) as f:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                logging.info(f"Đã tải model từ {model_url} vào cache thành công.")
+                return self.model_cache.path_for(model_info.id, model_info.file_path)
             except httpx.HTTPStatusError as e:
                 logging.error(f"Lỗi HTTP khi tải model từ {model_url}: {e}")
                 raise
@@ -56,7 +775,10 @@ class ModelManager:
                 raise
 
     async def load_models(self, db: Session):
-        """Tải các model AI mới nhất từ thông tin trong database."""
+        """
+        Tải cặp model AI mới nhất từ thông tin trong database và kích hoạt nó.
+        Nếu có lỗi, cặp đang phục vụ (nếu có) được giữ nguyên.
+        """
         logging.info("Bắt đầu tải các model AI từ database...")
         try:
             latest_crop_model_info = crud.get_latest_model(db, model_type="CROP")
@@ -65,27 +787,95 @@ class ModelManager:
             if not latest_crop_model_info or not latest_embedding_model_info:
                 raise FileNotFoundError("Không tìm thấy thông tin model CROP hoặc EMBEDDING trong database.")
 
-            crop_model_url = r2_service.get_public_url(latest_crop_model_info.file_path)
-            embedding_model_url = r2_service.get_public_url(latest_embedding_model_info.file_path)
+            active = self._active
+            if (
+                active is not None
+                and active.crop_model_id == latest_crop_model_info.id
+                and active.embedding_model_id == latest_embedding_model_info.id
+            ):
+                logging.info("Models mới nhất đã đang phục vụ, không cần tải lại.")
+                return
+
+            self._pending = ModelSet(latest_crop_model_info.id, latest_embedding_model_info.id)
+            crop_path = await self._fetch_model(latest_crop_model_info)
+            embedding_path = await self._fetch_model(latest_embedding_model_info)
+            self.model_cache.evict(keep={crop_path, embedding_path})
 
-            self.crop_model = await self._load_model_from_url(crop_model_url)
-            self.embedding_model = await self._load_model_from_url(embedding_model_url)
-            self.embedding_model_id = latest_embedding_model_info.id # Lưu lại ID
-            
-            self.is_ready = True
+            await self.load_model_files(
+                latest_crop_model_info.id, crop_path,
+                latest_embedding_model_info.id, embedding_path,
+            )
             logging.info("Tải model AI từ database thành công!")
 
         except Exception as e:
-            self.is_ready = False
             logging.error(f"LỖI KHI TẢI MODEL TỪ DATABASE: {e}", exc_info=True)
+        finally:
+            self._pending = None
+
+    async def load_model_files(
+        self,
+        crop_model_id: UUID | None,
+        crop_path: str,
+        embedding_model_id: UUID | None,
+        embedding_path: str,
+    ):
+        """
+        Dựng và làm nóng một cặp model từ file cục bộ ngoài event loop, sau đó
+        thay cặp đang phục vụ bằng một phép gán duy nhất.
+        """
+        self._pending = ModelSet(crop_model_id, embedding_model_id)
+        try:
+            crop_options = await asyncio.to_thread(self._resolve_options, crop_path, self.crop_options)
+            embedding_options = await asyncio.to_thread(self._resolve_options, embedding_path, self.embedding_options)
+            if self._process_backend is not None:
+                await self._process_backend.load(
+                    crop_path, crop_options, embedding_path, embedding_options, embedding_model_id
+                )
+                new_set = ModelSet(
+                    crop_model_id, embedding_model_id,
+                    crop_options=crop_options, embedding_options=embedding_options,
+                )
+                logging.info(f"Đã đẩy model mới sang {self._process_backend.size} tiến trình con.")
+            else:
+                crop_pool = await asyncio.to_thread(InterpreterPool, crop_path, self.pool_size, crop_options)
+                embedding_pool = await asyncio.to_thread(
+                    InterpreterPool, embedding_path, self.pool_size, embedding_options
+                )
+                batcher = None
+                if settings.AI_EMBEDDING_MICRO_BATCHING:
+                    batcher = EmbeddingBatcher(
+                        embedding_pool, self._executor,
+                        settings.AI_EMBEDDING_BATCH_MAX_SIZE, settings.AI_EMBEDDING_BATCH_MAX_WAIT_MS,
+                    )
+                new_set = ModelSet(
+                    crop_model_id, embedding_model_id, crop_pool, embedding_pool, batcher,
+                    crop_options, embedding_options,
+                )
+                logging.info(f"Đã khởi tạo và làm nóng {self.pool_size} interpreter cho mỗi model.")
+
+            old_set, self._active = self._active, new_set
+            if old_set is not None and old_set.batcher is not None:
+                old_set.batcher.close()
+            # Kết quả cache của cặp cũ không bao giờ khớp khóa nữa, giải phóng ngay
+            self.prediction_cache.clear()
+            logging.info(f"Đã kích hoạt cặp model crop={crop_model_id}, embedding={embedding_model_id}.")
+        finally:
+            self._pending = None
+
+    def _resolve_options(self, model_path: str, configured: InterpreterOptions) -> InterpreterOptions:
+        """Tùy chọn interpreter cho model: cấu hình sẵn, hoặc số luồng auto-tune nếu chưa cấu hình."""
+        if not self.autotune or configured.num_threads is not None:
+            return configured
+        concurrency = self._process_backend.size if self._process_backend is not None else self.pool_size
+        return autotune_interpreter_options(
+            model_path, configured.delegate,
+            autotune_thread_candidates(concurrency), settings.AI_INTERPRETER_AUTOTUNE_RUNS,
+        )
 
     async def load_models_background(self):
         """Hàm này được thiết kế để chạy ở chế độ nền (background task)."""
         logging.info("Tác vụ nền: Bắt đầu tải model AI.")
         async with self._lock:
-            if self.is_ready:
-                logging.info("Tác vụ nền: Models đã sẵn sàng, không cần tải lại.")
-                return
             try:
                 with Session(engine) as db:
                     await self.load_models(db=db)
@@ -99,82 +889,113 @@ class ModelManager:
         asyncio.create_task(self.load_models_background())
         logging.info("Đã lên lịch cho việc tải lại model ở chế độ nền.")
 
-    def predict(self, image_data: bytes) -> Tuple[List[List[float]], UUID | None]:
+    async def predict_async(self, image_data: bytes) -> Tuple[np.ndarray, UUID | None]:
+        """
+        Chạy pipeline không chặn event loop: trong thread pool giới hạn, qua
+        micro-batcher embedding nếu được bật, hoặc trong tiến trình con nếu
+        dùng backend "process".
+        """
+        loop = asyncio.get_running_loop()
+        active = self._require_active()
+        if self._process_backend is None and active.batcher is None:
+            return await loop.run_in_executor(self._executor, self.predict, image_data)
+
+        cache_key = self.prediction_cache.make_key(image_data, active.crop_model_id, active.embedding_model_id)
+        cached = self.prediction_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        with self._traced() as trace:
+            if self._process_backend is not None:
+                result = self._unpack_worker_result(
+                    await self._await_worker(self._process_backend.submit(image_data)), trace
+                )
+            else:
+                crops = await loop.run_in_executor(self._executor, self._extract_crops, active, image_data, trace)
+                trace.count("crops_embedded", len(crops))
+                # Gồm cả thời gian chờ gom batch, đúng với độ trễ request thực chịu
+                with trace.stage("embedding"):
+                    result = await active.batcher.embed(crops), active.embedding_model_id
+        self._remember(cache_key, result)
+        return result
+
+    @staticmethod
+    def _extract_crops(active: ModelSet, image_data: bytes, trace: PipelineTrace) -> List[np.ndarray]:
+        with active.crop_pool.checkout() as crop_model:
+            return extract_crops(crop_model, active.embedding_pool.input_shape, image_data, trace)
+
+    def predict(self, image_data: bytes) -> Tuple[np.ndarray, UUID | None]:
         """
         Hàm đồng bộ thực hiện pipeline AI và trả về (vectors, model_id).
+        Kết quả được cache theo nội dung ảnh và cặp model đang phục vụ.
         """
-        if not self.is_ready or self.crop_model is None or self.embedding_model is None:
-            raise HTTPException(status_code=503, detail="Model AI chưa sẵn sàng hoặc bị lỗi.")
+        # Lấy cặp model một lần duy nhất: request này chạy trọn trên cặp đó
+        active = self._require_active()
+        cache_key = self.prediction_cache.make_key(image_data, active.crop_model_id, active.embedding_model_id)
+        cached = self.prediction_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        logging.info("Bắt đầu pipeline dự đoán...")
+        with self._traced() as trace:
+            if self._process_backend is not None:
+                try:
+                    worker_result = self._process_backend.submit(image_data).result()
+                except _WorkerHTTPError as e:
+                    raise HTTPException(status_code=e.status_code, detail=e.detail)
+                result = self._unpack_worker_result(worker_result, trace)
+            else:
+                with active.crop_pool.checkout() as crop_model, active.embedding_pool.checkout() as embedding_model:
+                    result = run_pipeline(crop_model, embedding_model, image_data, trace), active.embedding_model_id
+        self._remember(cache_key, result)
+        return result
 
+    @contextmanager
+    def _traced(self) -> Iterator[PipelineTrace]:
+        """Trace cho một lần chạy pipeline (không tính cache hit), ghi vào metrics khi xong kể cả khi lỗi."""
+        trace = PipelineTrace()
         try:
-            # 1️⃣ Đọc ảnh với OpenCV
-            nparr = np.frombuffer(image_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if frame is None:
-                raise HTTPException(status_code=400, detail="Không đọc được ảnh từ dữ liệu input.")
-            h_orig, w_orig, _ = frame.shape
-            
-            # 2️⃣ Resize input cho YOLO
-            input_shape_yolo = self.crop_model.get_input_details()[0]['shape']
-            img_resized = cv2.resize(frame, (input_shape_yolo[1], input_shape_yolo[2]))
-            img_input = np.expand_dims(img_resized.astype(np.float32)/255.0, axis=0)
-            self.crop_model.set_tensor(self.crop_model.get_input_details()[0]['index'], img_input)
-            self.crop_model.invoke()
-            output_data = self.crop_model.get_tensor(self.crop_model.get_output_details()[0]['index'])[0].T
-
-            # 3️⃣ Chuẩn bị box & score cho NMS
-            boxes_for_nms, scores_for_nms = [], []
-            CONFIDENCE_THRESHOLD = 0.7
-            IOU_THRESHOLD = 0.4
-
-            for row in output_data:
-                score = float(row[4])
-                if score > CONFIDENCE_THRESHOLD:
-                    x_c, y_c, w_box, h_box = row[0:4]
-                    x_min = int((x_c - w_box/2) * w_orig)
-                    y_min = int((y_c - h_box/2) * h_orig)
-                    box_w = int(w_box * w_orig)
-                    box_h = int(h_box * h_orig)
-                    boxes_for_nms.append([x_min, y_min, box_w, box_h])
-                    scores_for_nms.append(score)
-
-            # 4️⃣ NMS với OpenCV
-            surviving_indices = cv2.dnn.NMSBoxes(boxes_for_nms, scores_for_nms, CONFIDENCE_THRESHOLD, IOU_THRESHOLD)
-
-            # 5️⃣ Crop & Embedding
-            all_vectors = []
-            input_shape_emb = self.embedding_model.get_input_details()[0]['shape']
-
-            if surviving_indices is not None and len(surviving_indices) > 0:
-                surviving_indices = np.array(surviving_indices).flatten()
-                
-                for idx in surviving_indices:
-                    x_min, y_min, box_w, box_h = boxes_for_nms[idx]
-                    x_max, y_max = x_min + box_w, y_min + box_h
-                    crop = frame[y_min:y_max, x_min:x_max]
-                    if crop.size == 0:
-                        continue
-
-                    # Resize + convert BGR->RGB
-                    img_pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
-                    img_resized = img_pil.resize((input_shape_emb[1], input_shape_emb[2]))
-                    input_data = np.expand_dims(np.array(img_resized), axis=0)
-                    input_data = (input_data.astype(np.float32) - 128).astype(np.int8)
-
-                    # Embedding
-                    self.embedding_model.set_tensor(self.embedding_model.get_input_details()[0]['index'], input_data)
-                    self.embedding_model.invoke()
-                    vector = self.embedding_model.get_tensor(self.embedding_model.get_output_details()[0]['index'])
-                    all_vectors.append(vector.flatten().tolist())
-
-            return all_vectors, self.embedding_model_id
+            yield trace
+        except BaseException:
+            trace.finish(failed=True)
+            self.metrics.record(trace)
+            raise
+        trace.finish()
+        self.metrics.record(trace)
 
-        except Exception as e:
-            logging.error(f"Lỗi trong pipeline dự đoán: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Lỗi xử lý AI: {e}")
+    @staticmethod
+    async def _await_worker(future: Future) -> Tuple[np.ndarray, UUID | None, PipelineTrace]:
+        try:
+            return await asyncio.wrap_future(future)
+        except _WorkerHTTPError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    @staticmethod
+    def _unpack_worker_result(
+        worker_result: Tuple[np.ndarray, UUID | None, PipelineTrace], trace: PipelineTrace
+    ) -> Tuple[np.ndarray, UUID | None]:
+        vectors, model_id, worker_trace = worker_result
+        trace.merge(worker_trace)
+        return vectors, model_id
+
+    def _require_active(self) -> ModelSet:
+        active = self._active
+        if active is None:
+            raise HTTPException(status_code=503, detail="Model AI chưa sẵn sàng hoặc bị lỗi.")
+        return active
 
+    def _remember(self, cache_key: CacheKey, result: Tuple[np.ndarray, UUID | None]):
+        # Tiến trình con có thể đã chạy trên cặp model mới hơn cặp dùng để tạo khóa
+        vectors, model_id = result
+        if model_id == cache_key[2]:
+            self.prediction_cache.put(cache_key, vectors, model_id)
 
+    def shutdown(self):
+        """Dừng thread pool và các tiến trình con (gọi khi ứng dụng tắt)."""
+        active = self._active
+        if active is not None and active.batcher is not None:
+            active.batcher.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._process_backend is not None:
+            self._process_backend.shutdown()
 
 model_manager = ModelManager()
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+from typing import Iterable, List, Tuple
+from uuid import UUID
+
+import numpy as np
+
+# Số điểm huấn luyện tối thiểu cho mỗi cụm; ít hơn thì k-means không đáng tin cậy
+MIN_POINTS_PER_LIST = 39
+# Số hàng ứng viên lấy thêm cho mỗi kết quả trước khi gộp theo nhãn
+_OVERFETCH = 8
+# Số hàng được gán cụm mỗi lần, để giới hạn bộ nhớ của ma trận điểm tạm
+_ASSIGN_CHUNK = 4096
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa L2 từng hàng sang float32; hàng toàn 0 được giữ nguyên."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+    return vectors / norms
+
+
+def uuids_to_array(values: Iterable[UUID | None]) -> np.ndarray:
+    """Mảng (n, 16) uint8 để lưu UUID bằng NumPy; None được lưu thành 16 byte 0."""
+    data = b"".join(value.bytes if value is not None else bytes(16) for value in values)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+
+
+def array_to_uuids(array: np.ndarray) -> List[UUID | None]:
+    return [UUID(bytes=row.tobytes()) if row.any() else None for row in array]
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Chỉ số centroid gần nhất (cosine) của từng vector đã chuẩn hóa."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = vectors[start:start + _ASSIGN_CHUNK]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    K-means cầu (spherical k-means) trên các vector đã chuẩn hóa: centroid là
+    trung bình của cụm được chuẩn hóa lại, nên gán cụm theo tích vô hướng
+    tương đương theo cosine. Cụm rỗng được khởi tạo lại bằng một điểm ngẫu nhiên.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        centroids[non_empty] = np.add.reduceat(vectors[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def top_labels(scores: np.ndarray, labels: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `top_k` nhãn có điểm cao nhất, điểm của một nhãn là điểm cao nhất trong các
+    hàng mang nhãn đó. Thường chỉ cần xét vài hàng điểm cao nhất; chỉ khi chúng
+    thuộc quá ít nhãn khác nhau mới sắp xếp toàn bộ.
+    """
+    candidates = min(len(scores), top_k * _OVERFETCH)
+    if candidates == 0:
+        return labels[:0], scores[:0]
+    rows = np.argpartition(-scores, candidates - 1)[:candidates]
+    unique_labels = np.unique(labels[rows])
+    if len(unique_labels) < top_k and candidates < len(scores):
+        rows = np.arange(len(scores))
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    _, first = np.unique(labels[rows], return_index=True)
+    best = rows[np.sort(first)[:top_k]]
+    return labels[best], scores[best]
+
+
+class InvertedList:
+    """
+    Các vector của một cụm, trong một ma trận liên tục để tính điểm bằng một
+    phép nhân ma trận. Thêm vào cuối (dung lượng tăng gấp đôi khi đầy), xóa
+    bằng cách chuyển hàng cuối vào chỗ trống.
+    """
+    def __init__(self, dim: int, vectors: np.ndarray | None = None, labels: np.ndarray | None = None, keys: List[UUID] | None = None):
+        self.matrix = vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        self.labels = labels if labels is not None else np.zeros(0, dtype=np.int32)
+        self.keys: List[UUID] = keys if keys is not None else []
+        self.size = len(self.keys)
+
+    def append(self, keys: List[UUID], labels: np.ndarray, vectors: np.ndarray) -> int:
+        """Thêm các hàng mới, trả về chỉ số hàng đầu tiên."""
+        start, end = self.size, self.size + len(keys)
+        if end > len(self.matrix):
+            capacity = max(end, 2 * len(self.matrix))
+            matrix = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+            matrix[:start] = self.matrix[:start]
+            labels_array = np.zeros(capacity, dtype=np.int32)
+            labels_array[:start] = self.labels[:start]
+            self.matrix, self.labels = matrix, labels_array
+        self.matrix[start:end] = vectors
+        self.labels[start:end] = labels
+        self.keys.extend(keys)
+        self.size = end
+        return start
+
+    def remove(self, row: int) -> UUID | None:
+        """Xóa một hàng; trả về khóa của hàng cuối được chuyển vào chỗ đó (nếu có)."""
+        last = self.size - 1
+        moved = None
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.labels[row] = self.labels[last]
+            self.keys[row] = moved = self.keys[last]
+        self.keys.pop()
+        self.size = last
+        return moved
+
+
+class IVFIndex:
+    """
+    Index IVF (inverted file) cho tìm kiếm xấp xỉ theo cosine trên vector đã
+    chuẩn hóa L2. Không gian vector được chia thành `nlist` cụm bằng k-means;
+    mỗi vector nằm trong danh sách của centroid gần nhất. Một truy vấn chỉ quét
+    `nprobe` danh sách có centroid gần nó nhất, nên chi phí giảm khoảng
+    `nlist / nprobe` lần so với quét toàn bộ, đổi lại có thể bỏ sót vài kết quả.
+
+    Khi chưa huấn luyện (`centroids` là None) index chỉ có một danh sách và tìm
+    kiếm là chính xác. Mỗi hàng có một khóa (ID vector) để thêm/xóa tăng dần và
+    một nhãn số nguyên (sản phẩm) để gộp kết quả. Không tự khóa: chủ sở hữu
+    (`VectorIndex`) khóa bên ngoài.
+    """
+    def __init__(self, dim: int, centroids: np.ndarray | None = None, trained_size: int = 0):
+        self.dim = dim
+        self.centroids = centroids
+        self.trained_size = trained_size  # Số vector lúc huấn luyện, để biết khi nào nên huấn luyện lại
+        self.lists = [InvertedList(dim) for _ in range(self.nlist)]
+        self.size = 0
+        self._location: dict[UUID, Tuple[int, int]] = {}
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids) if self.centroids is not None else 1
+
+    def __contains__(self, key: UUID) -> bool:
+        return key in self._location
+
+    def keys(self) -> Iterable[UUID]:
+        return self._location.keys()
+
+    def add(self, keys: List[UUID], labels: np.ndarray, vectors: np.ndarray):
+        """Thêm các vector (đã chuẩn hóa); khóa đã có trong index bị bỏ qua."""
+        new = np.array([i for i, key in enumerate(keys) if key not in self._location], dtype=np.intp)
+        if len(new) == 0:
+            return
+        vectors = vectors[new]
+        labels = np.asarray(labels, dtype=np.int32)[new]
+        if self.centroids is None:
+            assignments = np.zeros(len(new), dtype=np.int32)
+        else:
+            assignments = nearest_centroids(vectors, self.centroids)
+        for list_no in np.unique(assignments):
+            selected = np.flatnonzero(assignments == list_no)
+            list_keys = [keys[new[i]] for i in selected]
+            start = self.lists[list_no].append(list_keys, labels[selected], vectors[selected])
+            for offset, key in enumerate(list_keys):
+                self._location[key] = (int(list_no), start + offset)
+        self.size += len(new)
+
+    def remove(self, keys: Iterable[UUID]) -> List[UUID]:
+        """Xóa theo khóa; trả về các khóa thực sự có trong index."""
+        removed = []
+        for key in keys:
+            location = self._location.pop(key, None)
+            if location is None:
+                continue
+            list_no, row = location
+            moved = self.lists[list_no].remove(row)
+            if moved is not None:
+                self._location[moved] = (list_no, row)
+            removed.append(key)
+        self.size -= len(removed)
+        return removed
+
+    def remove_label(self, label: int) -> List[UUID]:
+        keys = [
+            inverted_list.keys[row]
+            for inverted_list in self.lists
+            for row in np.flatnonzero(inverted_list.labels[:inverted_list.size] == label)
+        ]
+        return self.remove(keys)
+
+    def sample(self, count: int, seed: int = 0) -> np.ndarray:
+        """Tối đa `count` vector ngẫu nhiên (bản sao), dùng để huấn luyện lại."""
+        rng = np.random.default_rng(seed)
+        picks = np.sort(rng.choice(self.size, min(count, self.size), replace=False))
+        offsets = np.cumsum([0] + [inverted_list.size for inverted_list in self.lists])
+        parts = []
+        for list_no, inverted_list in enumerate(self.lists):
+            rows = picks[(picks >= offsets[list_no]) & (picks < offsets[list_no + 1])] - offsets[list_no]
+            parts.append(inverted_list.matrix[rows])
+        return np.concatenate(parts) if parts else np.zeros((0, self.dim), dtype=np.float32)
+
+    def retrained(self, centroids: np.ndarray) -> "IVFIndex":
+        """
+        Index mới với `centroids`, chứa các vector của index này. Từng danh sách
+        cũ được giải phóng ngay khi đã chuyển xong, nên bộ nhớ chỉ tăng khoảng
+        một danh sách thay vì gấp đôi.
+        """
+        index = IVFIndex(self.dim, centroids, trained_size=self.size)
+        for list_no, inverted_list in enumerate(self.lists):
+            size = inverted_list.size
+            index.add(inverted_list.keys[:size], inverted_list.labels[:size], inverted_list.matrix[:size])
+            self.lists[list_no] = InvertedList(self.dim)
+        self._location.clear()
+        self.size = 0
+        return index
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Với mỗi truy vấn (đã chuẩn hóa), trả về (nhãn, điểm) của tối đa `top_k`
+        nhãn tốt nhất trong `nprobe` danh sách gần nhất. `nprobe >= nlist` là
+        tìm kiếm chính xác.
+        """
+        if nprobe >= self.nlist:
+            probes = np.broadcast_to(np.arange(self.nlist), (len(queries), self.nlist))
+        else:
+            probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        scores: List[List[np.ndarray]] = [[] for _ in range(len(queries))]
+        labels: List[List[np.ndarray]] = [[] for _ in range(len(queries))]
+        for list_no in np.unique(probes):
+            inverted_list = self.lists[list_no]
+            if inverted_list.size == 0:
+                continue
+            # Các truy vấn cùng quét một danh sách được tính chung một phép nhân ma trận
+            query_rows = np.flatnonzero((probes == list_no).any(axis=1))
+            list_scores = queries[query_rows] @ inverted_list.matrix[:inverted_list.size].T
+            for query_row, row_scores in zip(query_rows, list_scores):
+                scores[query_row].append(row_scores)
+                labels[query_row].append(inverted_list.labels[:inverted_list.size])
+
+        results = []
+        for query_scores, query_labels in zip(scores, labels):
+            if not query_scores:
+                results.append((np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)))
+                continue
+            results.append(top_labels(np.concatenate(query_scores), np.concatenate(query_labels), top_k))
+        return results
+
+    def save(self, path: str, extra: dict[str, np.ndarray]):
+        """
+        Ghi index (cùng các mảng `extra` của chủ sở hữu) ra một file `.npz`. Mỗi
+        danh sách được ghi thành mảng riêng nên không phải ghép toàn bộ vector
+        trong bộ nhớ. File được ghi tạm rồi đổi tên để không bao giờ đọc phải
+        file ghi dở.
+        """
+        arrays = {
+            "dim": np.array(self.dim),
+            "trained_size": np.array(self.trained_size),
+            "centroids": self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32),
+            **extra,
+        }
+        for list_no, inverted_list in enumerate(self.lists):
+            arrays[f"vectors_{list_no}"] = inverted_list.matrix[:inverted_list.size]
+            arrays[f"labels_{list_no}"] = inverted_list.labels[:inverted_list.size]
+            arrays[f"keys_{list_no}"] = uuids_to_array(inverted_list.keys)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["IVFIndex", "np.lib.npyio.NpzFile"]:
+        """Đọc index đã lưu; trả về index và file `.npz` để chủ sở hữu đọc các mảng `extra`."""
+        data = np.load(path)
+        centroids = data["centroids"]
+        index = cls(int(data["dim"]), centroids if len(centroids) else None, int(data["trained_size"]))
+        for list_no in range(index.nlist):
+            keys = array_to_uuids(data[f"keys_{list_no}"])
+            index.lists[list_no] = InvertedList(index.dim, data[f"vectors_{list_no}"], data[f"labels_{list_no}"], keys)
+            for row, key in enumerate(keys):
+                index._location[key] = (list_no, row)
+            index.size += len(keys)
+        return index, data
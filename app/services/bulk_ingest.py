@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import mimetypes
+import time
+import zipfile
+from typing import Awaitable, Callable, List
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException, UploadFile
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.models import ProductImage, ProductVector
+from app.services.ai_service import ModelManager
+from app.services.r2_service import r2_service
+from app.services.vector_index import VectorBatch, vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class BulkImageSource:
+    """
+    Một file ảnh trong yêu cầu nhập hàng loạt. Nội dung chỉ được đọc qua
+    `read()` khi tới lượt xử lý, nên danh sách nguồn không giữ bytes ảnh.
+    """
+    def __init__(
+        self,
+        filename: str,
+        product_key: str | None,
+        content_type: str | None,
+        read: Callable[[], Awaitable[bytes]],
+        size: int | None = None,
+    ):
+        self.filename = filename
+        self.product_key = product_key
+        self.content_type = content_type
+        self.read = read
+        self.size = size
+
+
+def sources_from_uploads(files: List[UploadFile], product_keys: List[str]) -> List[BulkImageSource]:
+    """Nguồn từ multipart: file thứ i thuộc sản phẩm `product_keys[i]` (ID hoặc barcode)."""
+    return [
+        BulkImageSource(file.filename or f"file-{i}", key, file.content_type, file.read, file.size)
+        for i, (file, key) in enumerate(zip(files, product_keys))
+    ]
+
+
+def sources_from_zip(archive: zipfile.ZipFile) -> List[BulkImageSource]:
+    """
+    Nguồn từ file zip: mỗi ảnh nằm trong thư mục mang tên ID hoặc barcode của
+    sản phẩm (`<product_key>/<ảnh>`). Ảnh nằm ngay gốc zip không có sản phẩm
+    và sẽ bị báo lỗi. Thư mục ẩn và metadata của macOS bị bỏ qua.
+    """
+    sources = []
+    for info in archive.infolist():
+        parts = info.filename.split("/")
+        if info.is_dir() or parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts):
+            continue
+        product_key = parts[0] if len(parts) > 1 else None
+        content_type, _ = mimetypes.guess_type(info.filename)
+        # Giải nén nằm ngoài event loop; `read` chỉ được gọi tuần tự nên ZipFile không bị dùng song song
+        sources.append(BulkImageSource(
+            info.filename, product_key, content_type,
+            lambda info=info: asyncio.to_thread(archive.read, info), info.file_size,
+        ))
+    return sources
+
+
+class BulkImageIngestor:
+    """
+    Nhập hàng loạt ảnh sản phẩm: với mỗi file, upload lên R2 song song với chạy
+    model (các request đồng thời được micro-batcher gộp batch embedding), rồi
+    ghi ảnh và vector theo lô `db_batch_size` file trong một commit.
+
+    Bộ nhớ bị chặn bởi `concurrency` file đang xử lý cộng với vector của tối đa
+    `db_batch_size` file chờ ghi, bất kể yêu cầu có bao nhiêu file: nội dung
+    file chỉ được đọc khi có worker rảnh. Lỗi của một file không làm hỏng các
+    file khác; file đã upload mà không ghi được DB sẽ bị xóa khỏi R2.
+    """
+    def __init__(
+        self,
+        session: Session,
+        model_manager: ModelManager,
+        concurrency: int = settings.BULK_IMAGE_CONCURRENCY,
+        db_batch_size: int = settings.BULK_IMAGE_DB_BATCH_SIZE,
+        max_file_bytes: int = settings.BULK_IMAGE_MAX_FILE_BYTES,
+    ):
+        self.session = session
+        self.model_manager = model_manager
+        self.concurrency = concurrency
+        self.db_batch_size = db_batch_size
+        self.max_file_bytes = max_file_bytes
+        self._pending: list[tuple[dict, ProductImage, list[ProductVector]]] = []
+        self._db_lock = asyncio.Lock()
+
+    async def ingest(self, sources: List[BulkImageSource]) -> dict:
+        start = time.perf_counter()
+        product_ids = self._resolve_products(sources)
+        results = [
+            {
+                "filename": source.filename,
+                "product_key": source.product_key,
+                "product_id": product_ids.get(source.product_key),
+                "status": "failed",
+                "image_id": None,
+                "vector_count": 0,
+                "error": None,
+            }
+            for source in sources
+        ]
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        bytes_processed = 0
+        try:
+            for source, result in zip(sources, results):
+                if result["product_id"] is None:
+                    result["error"] = "Missing product key." if source.product_key is None else "Product not found."
+                    continue
+                if source.size is not None and source.size > self.max_file_bytes:
+                    result["error"] = f"File exceeds {self.max_file_bytes} bytes."
+                    continue
+                # Hàng đợi có giới hạn: chỉ đọc file tiếp theo khi có chỗ trống
+                data = await source.read()
+                bytes_processed += len(data)
+                await queue.put((source, result, data))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        await self._flush()
+
+        elapsed = time.perf_counter() - start
+        created = sum(1 for result in results if result["status"] == "created")
+        logger.info(f"Nhập hàng loạt: {created}/{len(results)} ảnh trong {elapsed:.2f}s.")
+        return {
+            "total": len(results),
+            "created": created,
+            "failed": len(results) - created,
+            "vectors_created": sum(result["vector_count"] for result in results if result["status"] == "created"),
+            "bytes_processed": bytes_processed,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else 0.0,
+            "results": results,
+        }
+
+    def _resolve_products(self, sources: List[BulkImageSource]) -> dict[str, UUID]:
+        """Ánh xạ mỗi khóa (ID hoặc barcode) sang product ID, bằng một truy vấn duy nhất."""
+        keys = {source.product_key for source in sources if source.product_key}
+        ids, barcodes = [], []
+        for key in keys:
+            try:
+                ids.append(UUID(key))
+            except ValueError:
+                barcodes.append(key)
+        products = crud.get_products_by_ids_or_barcodes(self.session, ids, barcodes)
+
+        resolved = {}
+        for product in products:
+            if product.barcode in keys:
+                resolved[product.barcode] = product.id
+            if str(product.id) in keys:
+                resolved[str(product.id)] = product.id
+        return resolved
+
+    async def _worker(self, queue: asyncio.Queue):
+        while (item := await queue.get()) is not None:
+            source, result, data = item
+            try:
+                await self._process(source, result, data)
+            except Exception as e:
+                logger.error(f"Nhập ảnh {source.filename} thất bại: {e}", exc_info=True)
+                result["error"] = "Unexpected error while processing the file."
+
+    async def _process(self, source: BulkImageSource, result: dict, data: bytes):
+        if len(data) > self.max_file_bytes:
+            result["error"] = f"File exceeds {self.max_file_bytes} bytes."
+            return
+        file_extension = mimetypes.guess_extension(source.content_type) if source.content_type else None
+        if not file_extension or not source.content_type.startswith("image/"):
+            result["error"] = "Could not determine image file type."
+            return
+
+        object_key = f"images/products/{uuid4()}{file_extension}"
+        upload, prediction = await asyncio.gather(
+            asyncio.to_thread(r2_service.upload_file, data, object_key, source.content_type),
+            self.model_manager.predict_async(data),
+            return_exceptions=True,
+        )
+        del data
+
+        error = None
+        if isinstance(prediction, HTTPException):
+            error = str(prediction.detail)
+        elif isinstance(prediction, BaseException):
+            error = "Inference failed."
+        elif prediction[1] is None:
+            error = "AI model is not ready or failed to provide a model ID."
+        if not upload or isinstance(upload, BaseException):
+            error = error or "Failed to upload image to storage."
+        if error:
+            if upload and not isinstance(upload, BaseException):
+                await asyncio.to_thread(r2_service.delete_file, object_key)
+            result["error"] = error
+            return
+
+        vectors, model_id = prediction
+        image = ProductImage(product_id=result["product_id"], image_url=object_key, is_primary=False)
+        db_vectors = [
+            ProductVector.from_embedding(
+                vector, settings.VECTOR_STORAGE_DTYPE,
+                product_id=result["product_id"], model_id=model_id, image_id=image.id,
+            )
+            for vector in vectors
+        ]
+        self._pending.append((result, image, db_vectors))
+        if len(self._pending) >= self.db_batch_size:
+            await self._flush()
+
+    async def _flush(self):
+        """Ghi các file đã xử lý xong trong một commit; chỉ một lượt ghi chạy tại một thời điểm."""
+        async with self._db_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            images = [image for _, image, _ in batch]
+            vectors = [vector for _, _, db_vectors in batch for vector in db_vectors]
+            # Chụp dữ liệu cho index trước commit, khi các object chưa bị expire
+            index_model_id = vector_index.model_id
+            index_batch = VectorBatch.from_models(
+                index_model_id, [vector for vector in vectors if vector.model_id == index_model_id]
+            )
+            try:
+                await asyncio.to_thread(crud.create_product_images_with_vectors, self.session, images, vectors)
+            except Exception as e:
+                logger.error(f"Ghi lô {len(batch)} ảnh vào database thất bại: {e}", exc_info=True)
+                self.session.rollback()
+                for result, image, _ in batch:
+                    await asyncio.to_thread(r2_service.delete_file, image.image_url)
+                    result["error"] = "Failed to save image to database."
+                return
+
+            vector_index.add(index_batch)
+            for result, image, db_vectors in batch:
+                result.update(status="created", image_id=image.id, vector_count=len(db_vectors))
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+from uuid import UUID
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_SUFFIX = ".tflite"
+CHECKSUM_SUFFIX = ".sha256"
+
+
+class ModelFileCache:
+    """
+    Cache model .tflite trên đĩa cục bộ, khóa theo (model id, file_path).
+
+    Mỗi file model có một file `.sha256` đi kèm chứa checksum nội dung, được
+    kiểm tra lại mỗi lần lấy từ cache; file hỏng hoặc ghi dở sẽ bị xóa và tải
+    lại. Interpreter được dựng bằng `model_path` trỏ vào file trong cache nên
+    các worker uvicorn dùng chung page cache của hệ điều hành.
+
+    Tổng dung lượng được giới hạn bởi `max_bytes`; khi vượt, các phiên bản ít
+    được dùng gần đây nhất (theo mtime) bị xóa trước.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, model_id: UUID, file_path: str) -> str:
+        """Đường dẫn file cache của một model; file_path được băm để đổi phiên bản là đổi khóa."""
+        file_path_hash = hashlib.sha256(file_path.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{model_id}-{file_path_hash}{MODEL_SUFFIX}")
+
+    def get(self, model_id: UUID, file_path: str) -> str | None:
+        """Trả về đường dẫn file đã cache và checksum khớp, hoặc None nếu phải tải lại."""
+        model_path = self.path_for(model_id, file_path)
+        checksum_path = model_path + CHECKSUM_SUFFIX
+        if not os.path.exists(model_path) or not os.path.exists(checksum_path):
+            return None
+
+        with open(checksum_path, "r", encoding="utf-8") as f:
+            expected = f.read().strip()
+        with open(model_path, "rb") as f:
+            actual = hashlib.file_digest(f, "sha256").hexdigest()
+        if actual != expected:
+            logger.warning(f"Checksum của {model_path} không khớp, xóa khỏi cache.")
+            self._remove(model_path)
+            return None
+
+        os.utime(model_path)  # Đánh dấu vừa được dùng cho LRU
+        return model_path
+
+    @contextmanager
+    def writer(self, model_id: UUID, file_path: str) -> Iterator["_HashingWriter"]:
+        """
+        Ghi một model mới vào cache. Nội dung được ghi ra file tạm rồi mới
+        `os.replace` vào vị trí cuối, nên tiến trình khác không bao giờ thấy
+        file ghi dở; nếu có lỗi giữa chừng file tạm bị xóa.
+        """
+        model_path = self.path_for(model_id, file_path)
+        tmp_path = f"{model_path}.{os.getpid()}.tmp"
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                yield _HashingWriter(f, digest)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(tmp_path + CHECKSUM_SUFFIX, "w", encoding="utf-8") as f:
+                f.write(digest.hexdigest())
+            os.replace(tmp_path + CHECKSUM_SUFFIX, model_path + CHECKSUM_SUFFIX)
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            for path in (tmp_path, tmp_path + CHECKSUM_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+    def evict(self, keep: set[str]):
+        """
+        Xóa các model ít dùng gần đây nhất cho tới khi tổng dung lượng không vượt
+        `max_bytes`, không bao giờ xóa các file trong `keep`. Xóa file đang được
+        interpreter khác mmap là an toàn: vùng nhớ đã map vẫn còn hiệu lực.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(MODEL_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            logger.info(f"Xóa model cũ khỏi cache: {path}")
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(model_path: str):
+        for path in (model_path, model_path + CHECKSUM_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class _HashingWriter:
+    """File-like chỉ ghi, vừa ghi vừa cập nhật checksum."""
+    def __init__(self, f: BinaryIO, digest):
+        self._f = f
+        self._digest = digest
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        return self._f.write(data)
+
+
+model_file_cache = ModelFileCache(settings.AI_MODEL_CACHE_DIR, settings.AI_MODEL_CACHE_MAX_BYTES)
@@ -0,0 +1,153 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Các giai đoạn của pipeline dự đoán, theo thứ tự chạy
+STAGES = ("decode", "yolo", "nms", "crop_resize", "embedding", "total")
+# Các đại lượng đếm theo từng ảnh
+COUNTS = ("bytes_decoded", "boxes_before_nms", "boxes_after_nms", "crops_embedded")
+
+# Biên trên (bao gồm) của các bucket; giá trị lớn hơn rơi vào bucket "+Inf"
+TIMING_BUCKETS_MS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BYTES_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(8))  # 16 KiB .. 256 MiB
+
+
+class Histogram:
+    """
+    Histogram bucket cố định, cộng dồn không giới hạn thời gian. Ghi một giá trị
+    chỉ là một `bisect` trên tuple nhỏ, đủ rẻ để bật thường trực. Phân vị được
+    ước lượng bằng biên trên của bucket chứa nó. Không tự khóa: chủ sở hữu
+    (`PipelineMetrics`) khóa bên ngoài.
+    """
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        labels = [str(bound) for bound in self.bounds] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.bucket_counts)),
+        }
+
+
+class PipelineTrace:
+    """
+    Số đo của một lần chạy pipeline: thời gian (ms) từng giai đoạn và các số
+    đếm. Được tạo cho mỗi request và truyền xuống các hàm của pipeline; với
+    backend "process" trace được pickle gửi về tiến trình chính.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages_ms: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.failed = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name: str, value: int):
+        self.counts[name] = value
+
+    def merge(self, other: "PipelineTrace"):
+        """Gộp số đo từ trace của tiến trình con (trừ tổng thời gian, do tiến trình chính đo)."""
+        self.stages_ms.update(other.stages_ms)
+        self.counts.update(other.counts)
+
+    def finish(self, failed: bool = False):
+        self.stages_ms["total"] = (time.perf_counter() - self.started) * 1000
+        self.failed = failed
+
+
+class PipelineMetrics:
+    """
+    Tổng hợp các `PipelineTrace` thành histogram theo giai đoạn và theo số
+    đếm, đọc qua `snapshot()` (endpoint `/models/metrics`). Mỗi trace cũng
+    được ghi thành một dòng log JSON nếu bật `log_traces`. An toàn khi gọi từ
+    nhiều luồng.
+    """
+    def __init__(self, log_traces: bool):
+        self.log_traces = log_traces
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.stages = {stage: Histogram(TIMING_BUCKETS_MS) for stage in STAGES}
+            self.counts = {
+                name: Histogram(BYTES_BUCKETS if name == "bytes_decoded" else COUNT_BUCKETS) for name in COUNTS
+            }
+
+    def record(self, trace: PipelineTrace):
+        with self._lock:
+            self.requests += 1
+            if trace.failed:
+                self.errors += 1
+            for stage, elapsed_ms in trace.stages_ms.items():
+                if stage in self.stages:
+                    self.stages[stage].observe(elapsed_ms)
+            for name, value in trace.counts.items():
+                if name in self.counts:
+                    self.counts[name].observe(value)
+
+        if self.log_traces:
+            logger.info(json.dumps({
+                "event": "pipeline_trace",
+                "failed": trace.failed,
+                "stages_ms": {stage: round(ms, 3) for stage, ms in trace.stages_ms.items()},
+                **trace.counts,
+            }))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "stages_ms": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+                "counts": {name: histogram.snapshot() for name, histogram in self.counts.items()},
+            }
+
+
+pipeline_metrics = PipelineMetrics(settings.AI_PIPELINE_TRACE_LOG)
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.core.config import settings
+
+# (sha256 của ảnh, crop model id, embedding model id)
+CacheKey = Tuple[str, UUID | None, UUID | None]
+
+
+class PredictionCache:
+    """
+    Cache LRU + TTL cho kết quả `ModelManager.predict`, giới hạn theo tổng số
+    byte của các vector đang giữ.
+
+    Khóa gồm cả id của cặp model nên kết quả của model cũ không bao giờ được
+    trả lại sau khi đổi model; ModelManager vẫn gọi `clear()` khi đổi cặp để
+    giải phóng bộ nhớ ngay. An toàn khi gọi từ nhiều luồng.
+    """
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[CacheKey, Tuple[np.ndarray, UUID | None, float]] = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(image_data: bytes, crop_model_id: UUID | None, embedding_model_id: UUID | None) -> CacheKey:
+        return hashlib.sha256(image_data).hexdigest(), crop_model_id, embedding_model_id
+
+    def get(self, key: CacheKey) -> Tuple[np.ndarray, UUID | None] | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        vectors, model_id, _ = entry
+        return vectors, model_id
+
+    def put(self, key: CacheKey, vectors: np.ndarray, model_id: UUID | None):
+        if not self.enabled:
+            return
+        if vectors.nbytes > self.max_bytes:
+            return
+        # Mảng được trả lại nguyên cho mọi lần hit, nên khóa ghi để không ai sửa được
+        vectors.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (vectors, model_id, time.monotonic() + self.ttl_seconds)
+            self._size_bytes += vectors.nbytes
+            while self._size_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _pop(self, key: CacheKey):
+        array, _, _ = self._entries.pop(key)
+        self._size_bytes -= array.nbytes
+
+
+prediction_cache = PredictionCache(
+    settings.AI_PREDICTION_CACHE_MAX_BYTES, settings.AI_PREDICTION_CACHE_TTL_SECONDS
+)
@@ -48,6 +48,50 @@ class R2Service:
             logger.error(f"An unexpected error occurred during R2 upload: {e}")
             return None
 
+    def upload_path(self, path: str, file_name: str, content_type: str) -> str | None:
+        """
+        Uploads a local file to Cloudflare R2, streaming it in parts instead of reading
+        it into memory (for large files such as vector snapshots).
+        :param path: The local path of the file.
+        :param file_name: The desired name of the file in the R2 bucket.
+        :param content_type: The MIME type of the file.
+        :return: The object key (file name) if successful, None otherwise.
+        """
+        try:
+            self.s3_client.upload_file(
+                Filename=path,
+                Bucket=self.bucket_name,
+                Key=file_name,
+                ExtraArgs={"ContentType": content_type}
+            )
+            logger.info(f"File {file_name} uploaded successfully to R2.")
+            return file_name
+        except ClientError as e:
+            logger.error(f"Failed to upload file {file_name} to R2: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during R2 upload: {e}")
+            return None
+
+    def download_file(self, file_name: str) -> bytes | None:
+        """
+        Downloads a file from Cloudflare R2.
+        :param file_name: The name of the file (object key) to download.
+        :return: The file content as bytes if successful, None otherwise.
+        """
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=file_name
+            )
+            return response["Body"].read()
+        except ClientError as e:
+            logger.error(f"Failed to download file {file_name} from R2: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during R2 download: {e}")
+            return None
+
     def delete_file(self, file_name: str) -> bool:
         """
         Deletes a file from Cloudflare R2.
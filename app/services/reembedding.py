@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.database import engine
+from app.models import AIModelType, ProductImage, ProductVector, ReembeddingJob, ReembeddingJobStatus
+from app.services.ai_service import ModelManager, model_manager
+from app.services.r2_service import r2_service
+from app.services.vector_index import VectorBatch, vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelNotActive(Exception):
+    """Model đích của job không (hoặc không còn) là model embedding đang phục vụ."""
+
+
+class ReembeddingRunner:
+    """
+    Chạy các job tạo lại vector cho toàn bộ ảnh sản phẩm bằng model embedding mới.
+
+    Ảnh được duyệt theo thứ tự ID, mỗi lô `batch_size` ảnh: tải từ R2, chạy
+    model (tối đa `concurrency` ảnh cùng lúc, embedding được micro-batcher gộp
+    batch), rồi ghi vector mới cùng checkpoint trong một commit. Sau khi khởi
+    động lại, job tiếp tục từ ảnh sau checkpoint. Giữa các lô job nghỉ
+    `pause_seconds` để nhường tài nguyên cho request thật.
+
+    Vector của các model khác chỉ bị xóa (kèm tombstone) khi đã duyệt hết ảnh;
+    ảnh không tải hoặc không xử lý được được đếm vào `failed_images`, bỏ qua và
+    giữ lại vector cũ của nó. Nếu một model embedding mới hơn được tải lên
+    trong lúc chạy, job bị đánh dấu SUPERSEDED.
+    """
+    def __init__(
+        self,
+        manager: ModelManager,
+        batch_size: int = settings.REEMBED_BATCH_SIZE,
+        concurrency: int = settings.REEMBED_CONCURRENCY,
+        pause_seconds: float = settings.REEMBED_PAUSE_SECONDS,
+        model_wait_seconds: float = settings.REEMBED_MODEL_WAIT_SECONDS,
+    ):
+        self.model_manager = manager
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.pause_seconds = pause_seconds
+        self.model_wait_seconds = model_wait_seconds
+        self._lock = asyncio.Lock()  # Chỉ một job chạy tại một thời điểm
+
+    async def schedule(self):
+        """Lên lịch chạy các job đang chờ ở chế độ nền, không chờ kết thúc."""
+        asyncio.create_task(self.run_pending())
+
+    async def run_pending(self):
+        """Chạy (hoặc tiếp tục) lần lượt các job PENDING/RUNNING cho tới khi hết."""
+        async with self._lock:
+            while True:
+                with Session(engine) as session:
+                    job = crud.get_next_reembedding_job(session)
+                    if job is None:
+                        return
+                    try:
+                        await self._run_job(session, job)
+                    except Exception as e:
+                        logger.error(f"Job tạo lại vector {job.id} thất bại: {e}", exc_info=True)
+                        session.rollback()
+                        crud.update_reembedding_job(session, job, status=ReembeddingJobStatus.FAILED, error=str(e))
+
+    async def _run_job(self, session: Session, job: ReembeddingJob):
+        logger.info(f"Bắt đầu job tạo lại vector {job.id} cho model {job.model_id} (checkpoint {job.last_image_id}).")
+        if not await self._wait_for_model(session, job):
+            return
+        crud.update_reembedding_job(
+            session, job, status=ReembeddingJobStatus.RUNNING, total_images=crud.count_product_images(session)
+        )
+
+        while images := crud.get_product_images_after(session, job.last_image_id, self.batch_size):
+            if self.model_manager.embedding_model_id != job.model_id and not await self._wait_for_model(session, job):
+                return
+            started = time.perf_counter()
+            try:
+                vectors, failed = await self._embed_images(images, job.model_id)
+            except _ModelNotActive:
+                continue  # Model đổi giữa lô: chờ lại model rồi làm lại lô này
+            image_ids = [image.id for image in images]
+            index_batch = VectorBatch.from_models(job.model_id, vectors)
+            job = await asyncio.to_thread(
+                crud.save_reembedding_batch, session, job, image_ids, vectors, images[-1].id, failed,
+            )
+            if vector_index.model_id == job.model_id:
+                # Lô vừa ghi thay thế vector cũ của cùng model cho các ảnh này
+                vector_index.remove_images(image_ids)
+                vector_index.add(index_batch)
+            logger.info(
+                f"Job {job.id}: {job.processed_images}/{job.total_images} ảnh "
+                f"({len(images)} ảnh trong {time.perf_counter() - started:.2f}s)."
+            )
+            await asyncio.sleep(self.pause_seconds)
+
+        retired = await asyncio.to_thread(crud.retire_vectors_of_other_models, session, job.model_id)
+        vector_index.retain_model(job.model_id)
+        crud.update_reembedding_job(
+            session, job,
+            status=ReembeddingJobStatus.COMPLETED,
+            retired_vectors=retired,
+            completed_at=datetime.now(timezone.utc),
+        )
+        logger.info(f"Job {job.id} hoàn tất: đã xóa {retired} vector của model cũ.")
+
+    async def _wait_for_model(self, session: Session, job: ReembeddingJob) -> bool:
+        """
+        Chờ model đích được kích hoạt. Trả về False (và cập nhật trạng thái job)
+        nếu đã có model embedding mới hơn hoặc chờ quá `model_wait_seconds`.
+        """
+        deadline = time.monotonic() + self.model_wait_seconds
+        while self.model_manager.embedding_model_id != job.model_id:
+            latest = crud.get_latest_model(session, model_type=AIModelType.EMBEDDING)
+            if latest is not None and latest.id != job.model_id:
+                crud.update_reembedding_job(session, job, status=ReembeddingJobStatus.SUPERSEDED)
+                logger.info(f"Job {job.id} bị thay thế bởi model embedding mới hơn {latest.id}.")
+                return False
+            if time.monotonic() > deadline:
+                crud.update_reembedding_job(
+                    session, job, status=ReembeddingJobStatus.FAILED,
+                    error=f"Embedding model {job.model_id} did not become active.",
+                )
+                return False
+            await asyncio.sleep(1)
+        return True
+
+    async def _embed_images(self, images: list[ProductImage], model_id: UUID) -> tuple[list[ProductVector], int]:
+        """Tải và chạy model cho một lô ảnh; trả về vector mới và số ảnh lỗi."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed(image: ProductImage) -> list[ProductVector] | None:
+            async with semaphore:
+                data = await asyncio.to_thread(r2_service.download_file, image.image_url)
+                if data is None:
+                    return None
+                try:
+                    vectors, vectors_model_id = await self.model_manager.predict_async(data)
+                except HTTPException as e:
+                    logger.warning(f"Không tạo được vector cho ảnh {image.id}: {e.detail}")
+                    return None
+            if vectors_model_id != model_id:
+                raise _ModelNotActive()
+            return [
+                ProductVector.from_embedding(
+                    vector, settings.VECTOR_STORAGE_DTYPE,
+                    product_id=image.product_id, model_id=model_id, image_id=image.id,
+                )
+                for vector in vectors
+            ]
+
+        results = await asyncio.gather(*[embed(image) for image in images])
+        vectors = [vector for result in results if result is not None for vector in result]
+        return vectors, sum(1 for result in results if result is None)
+
+
+reembedding_runner = ReembeddingRunner(model_manager)
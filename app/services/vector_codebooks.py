@@ -0,0 +1,82 @@
+import logging
+from uuid import UUID
+
+import numpy as np
+from sqlmodel import Session
+
+from app import crud
+from app.core.vector_projection import Projection
+from app.core.vector_snapshot import PQ_CENTROIDS
+from app.models import VectorCodebook
+from app.services import vector_projections
+from app.services.vector_compression import ProductQuantizer, sample_product_vectors
+
+logger = logging.getLogger(__name__)
+
+# Codebook của các phiên bản đã tải, theo id (6912 chiều là khoảng 7 MiB mỗi phiên bản)
+_CACHE_SIZE = 4
+_cache: dict[UUID, ProductQuantizer] = {}
+
+
+def to_quantizer(row: VectorCodebook) -> ProductQuantizer:
+    """Quantizer của một phiên bản codebook lưu trong database."""
+    subvectors = -(-row.dim // row.subvector_dim)
+    codebooks = np.frombuffer(row.codebook_data, dtype="<f4").reshape(subvectors, PQ_CENTROIDS, row.subvector_dim)
+    return ProductQuantizer(row.dim, codebooks, row.id)
+
+
+def train_vector_codebook(session: Session, model_id: UUID, subvector_dim: int, sample_size: int) -> VectorCodebook:
+    """
+    Huấn luyện codebook pq trên tối đa `sample_size` vector ngẫu nhiên của model,
+    đã chiếu bằng projection xuất vector hiện tại nếu có, và lưu thành phiên bản mới.
+    """
+    projection = vector_projections.get_export_projection(session, model_id)
+    _, sample = sample_product_vectors(session, model_id, sample_size)
+    if not len(sample):
+        raise ValueError(f"Model {model_id} chưa có vector để huấn luyện codebook")
+    if projection is not None:
+        sample = projection.project(sample)
+    quantizer = ProductQuantizer.train(sample, subvector_dim)
+    codebook = crud.create_vector_codebook(session, VectorCodebook(
+        model_id=model_id,
+        projection_id=projection.projection_id if projection else None,
+        dim=sample.shape[1],
+        subvector_dim=subvector_dim,
+        trained_vectors=len(sample),
+        codebook_data=quantizer.codebooks.astype("<f4").tobytes(),
+    ))
+    logger.info(
+        f"Đã huấn luyện codebook pq {quantizer.subvectors} x {subvector_dim} chiều cho model {model_id} "
+        f"trên {len(sample)} vector (phiên bản {codebook.id})"
+    )
+    return codebook
+
+
+def load_codebook(session: Session, codebook_id: UUID) -> ProductQuantizer | None:
+    """Quantizer của một phiên bản codebook, giữ trong bộ nhớ vì phiên bản không đổi sau khi lưu."""
+    quantizer = _cache.get(codebook_id)
+    if quantizer is None:
+        row = crud.get_vector_codebook_by_id(session, codebook_id)
+        if row is None:
+            return None
+        quantizer = to_quantizer(row)
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        _cache[codebook_id] = quantizer
+    return quantizer
+
+
+def get_export_codebook(session: Session, model_id: UUID, projection: Projection | None) -> ProductQuantizer | None:
+    """
+    Codebook dùng cho snapshot pq của model: phiên bản mới nhất đã lưu được huấn
+    luyện trên vector chiếu bằng `projection` (vector nguyên chiều nếu None).
+    None khi chưa có, kể cả khi PCA vừa được fit lại; khi đó không xuất được pq.
+
+    Hàm chỉ đọc, không bao giờ huấn luyện: phiên bản mới chỉ được tạo qua
+    `POST /vectors/codebook`, nên các worker và các lần dựng snapshot dùng cùng
+    một codebook và file pq giữ nguyên nội dung (và ETag) khi vector không đổi.
+    """
+    codebook_id = crud.get_latest_vector_codebook_id(session, model_id, projection.projection_id if projection else None)
+    if codebook_id is None:
+        return None
+    return load_codebook(session, codebook_id)
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from itertools import chain, groupby
+from typing import Iterable, List, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.database import engine
+from app.core.vector_codec import decode_embeddings
+from app.models import VectorCompactionJob, VectorCompactionJobStatus
+from app.services.ann_index import nearest_centroids, normalize_rows, train_centroids
+from app.services.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
+
+# Số ID mỗi truy vấn IN / DELETE
+_ID_CHUNK = 1000
+
+
+def select_representatives(vectors: np.ndarray, max_vectors: int, duplicate_threshold: float) -> Tuple[np.ndarray, int]:
+    """
+    Chỉ số các vector giữ lại của một sản phẩm (`vectors` đã chuẩn hóa, ưu tiên
+    theo thứ tự, ví dụ mới nhất trước). Vector có cosine với một vector đã giữ
+    từ `duplicate_threshold` trở lên bị bỏ; nếu còn hơn `max_vectors`, chúng được
+    chia `max_vectors` cụm bằng k-means cầu và mỗi cụm giữ medoid (vector gần
+    tâm cụm nhất), nên vector giữ lại luôn là vector thật của sản phẩm. Trả về
+    (chỉ số giữ lại tăng dần, số vector còn lại sau khi bỏ trùng).
+    """
+    similarities = vectors @ vectors.T
+    kept: List[int] = []
+    for i in range(len(vectors)):
+        if not kept or similarities[i, kept].max() < duplicate_threshold:
+            kept.append(i)
+    unique = np.array(kept, dtype=np.int64)
+    if len(unique) <= max_vectors:
+        return unique, len(unique)
+    candidates = vectors[unique]
+    centroids = train_centroids(candidates, max_vectors)
+    assignments = nearest_centroids(candidates, centroids)
+    closeness = np.einsum("ij,ij->i", candidates, centroids[assignments])
+    medoids = [
+        unique[members[np.argmax(closeness[members])]]
+        for members in (np.flatnonzero(assignments == cluster) for cluster in np.unique(assignments))
+    ]
+    return np.sort(np.array(medoids, dtype=np.int64)), len(unique)
+
+
+def compact_groups(
+    groups: Iterable[Tuple[List[UUID], np.ndarray]],
+    query_ids: List[UUID],
+    queries: np.ndarray,
+    max_per_product: int,
+    duplicate_threshold: float,
+    top_ks: Tuple[int, ...] = (1, 5),
+) -> Tuple[List[UUID], dict]:
+    """
+    Chọn vector giữ lại cho từng nhóm (vector id, ma trận) của một sản phẩm và
+    đo ảnh hưởng lên tìm kiếm: với mỗi truy vấn (vector của catalog, `query_ids`),
+    điểm của một sản phẩm là cosine cao nhất trong các vector của nó, trừ chính
+    truy vấn (như một ảnh mới của sản phẩm đã có); recall@k là tỉ lệ sản phẩm
+    trong top-k trên toàn bộ vector cũng có trong top-k trên tập đã thu gọn.
+    Chỉ giữ điểm theo sản phẩm (truy vấn x sản phẩm) nên không cần cả catalog
+    trong bộ nhớ. Trả về (id các vector bị bỏ, báo cáo).
+    """
+    queries = normalize_rows(queries) if query_ids else queries
+    query_position = {vector_id: i for i, vector_id in enumerate(query_ids)}
+    full_columns, kept_columns, removed = [], [], []
+    report = {"products": 0, "compacted_products": 0, "vectors_before": 0, "removed_duplicates": 0, "removed_by_cap": 0}
+    dim = 0
+    for vector_ids, embeddings in groups:
+        vectors = normalize_rows(embeddings)
+        dim = vectors.shape[1]
+        keep, unique = select_representatives(vectors, max_per_product, duplicate_threshold)
+        mask = np.zeros(len(vectors), dtype=bool)
+        mask[keep] = True
+        removed.extend(vector_id for vector_id, is_kept in zip(vector_ids, mask) if not is_kept)
+        report["products"] += 1
+        report["vectors_before"] += len(vectors)
+        report["removed_duplicates"] += len(vectors) - unique
+        report["removed_by_cap"] += unique - len(keep)
+        report["compacted_products"] += int(len(keep) < len(vectors))
+
+        if query_ids:
+            scores = queries @ vectors.T
+            for column, vector_id in enumerate(vector_ids):
+                row = query_position.get(vector_id)
+                if row is not None:
+                    scores[row, column] = -np.inf
+            full_columns.append(scores.max(axis=1))
+            kept_columns.append(scores[:, mask].max(axis=1))
+
+    report["vectors_after"] = report["vectors_before"] - len(removed)
+    report["shrinkage"] = len(removed) / report["vectors_before"] if report["vectors_before"] else 0.0
+    report["index_bytes_before"] = report["vectors_before"] * dim * 4
+    report["index_bytes_after"] = report["vectors_after"] * dim * 4
+    report["queries"] = len(query_ids)
+    if full_columns:
+        full, kept = np.stack(full_columns, axis=1), np.stack(kept_columns, axis=1)
+        for k in top_ks:
+            depth = min(k, full.shape[1])
+            expected = np.argsort(-full, axis=1, kind="stable")[:, :depth]
+            found = np.argsort(-kept, axis=1, kind="stable")[:, :depth]
+            report[f"recall_at_{k}"] = float(np.mean([
+                len(set(e.tolist()) & set(f.tolist())) / depth for e, f in zip(expected, found)
+            ]))
+    else:
+        report.update({f"recall_at_{k}": 1.0 for k in top_ks})
+    return removed, report
+
+
+def _product_groups(session: Session, model_id: UUID, batch_size: int) -> Iterable[Tuple[List[UUID], np.ndarray]]:
+    rows = chain.from_iterable(crud.iter_product_vector_rows_by_product(session, model_id, batch_size))
+    for _, group in groupby(rows, key=lambda row: row[1]):
+        group = list(group)
+        yield [row[0] for row in group], decode_embeddings(row[3:] for row in group)
+
+
+def compact_product_vectors(
+    session: Session,
+    model_id: UUID,
+    max_per_product: int = settings.VECTOR_COMPACTION_MAX_PER_PRODUCT,
+    duplicate_threshold: float = settings.VECTOR_COMPACTION_DUPLICATE_THRESHOLD,
+    num_queries: int = 200,
+    dry_run: bool = False,
+    batch_size: int = settings.VECTOR_INDEX_LOAD_BATCH_SIZE,
+) -> dict:
+    """
+    Thu gọn vector của từng sản phẩm của một model (xem `select_representatives`)
+    và trả về báo cáo số vector, kích thước index và recall trước/sau, đo trên
+    `num_queries` vector ngẫu nhiên. Vector bị bỏ được xóa khỏi database kèm
+    tombstone (cart xóa qua `/vectors/delta`, snapshot được dựng lại) và khỏi
+    index tìm kiếm; `dry_run` chỉ trả về báo cáo.
+
+    Vector giữ lại vẫn gắn với ảnh của nó: xóa ảnh đó sau này cũng xóa vector
+    đại diện, các ảnh khác của sản phẩm chỉ có lại vector khi được xử lý lại.
+    """
+    started = time.perf_counter()
+    query_ids = crud.get_random_product_vector_ids(session, model_id, num_queries)
+    query_rows = [
+        row for start in range(0, len(query_ids), _ID_CHUNK)
+        for row in crud.get_product_vector_rows_by_ids(session, query_ids[start:start + _ID_CHUNK])
+    ]
+    removed, report = compact_groups(
+        _product_groups(session, model_id, batch_size),
+        [row[0] for row in query_rows],
+        decode_embeddings(row[3:] for row in query_rows),
+        max_per_product,
+        duplicate_threshold,
+    )
+    if not dry_run:
+        for start in range(0, len(removed), _ID_CHUNK):
+            crud.delete_product_vectors(session, removed[start:start + _ID_CHUNK])
+        vector_index.remove_vectors(removed)
+    logger.info(
+        f"{'Thử thu gọn' if dry_run else 'Đã thu gọn'} vector của model {model_id}: "
+        f"{report['vectors_before']} -> {report['vectors_after']} vector ({report['shrinkage']:.1%}), "
+        f"recall@1 {report['recall_at_1']:.3f}, recall@5 {report['recall_at_5']:.3f}, "
+        f"{time.perf_counter() - started:.1f}s"
+    )
+    return report
+
+
+class VectorCompactionRunner:
+    """
+    Chạy các job thu gọn vector (`POST /vectors/compaction`) ở chế độ nền, lần
+    lượt từng job: đọc toàn bộ vector của model có thể mất vài phút, nên không
+    chạy trong request. Việc tính toán chạy trên luồng riêng để không chặn event
+    loop. Job bị dừng giữa chừng (khởi động lại) được chạy lại từ đầu; thu gọn
+    tập đã thu gọn một phần cho cùng kết quả.
+    """
+    def __init__(self):
+        self._lock = asyncio.Lock()  # Chỉ một job chạy tại một thời điểm
+
+    async def schedule(self):
+        """Lên lịch chạy các job đang chờ ở chế độ nền, không chờ kết thúc."""
+        asyncio.create_task(self.run_pending())
+
+    async def run_pending(self):
+        """Chạy (hoặc chạy lại) lần lượt các job PENDING/RUNNING cho tới khi hết."""
+        async with self._lock:
+            while True:
+                with Session(engine) as session:
+                    job = crud.get_next_vector_compaction_job(session)
+                    if job is None:
+                        return
+                    try:
+                        await self._run_job(session, job)
+                    except Exception as e:
+                        logger.error(f"Job thu gọn vector {job.id} thất bại: {e}", exc_info=True)
+                        session.rollback()
+                        crud.update_vector_compaction_job(session, job, status=VectorCompactionJobStatus.FAILED, error=str(e))
+
+    async def _run_job(self, session: Session, job: VectorCompactionJob):
+        job = crud.update_vector_compaction_job(session, job, status=VectorCompactionJobStatus.RUNNING)
+        report = await asyncio.to_thread(
+            compact_product_vectors,
+            session, job.model_id, job.max_per_product, job.duplicate_threshold, job.queries, job.dry_run,
+        )
+        crud.update_vector_compaction_job(
+            session, job,
+            status=VectorCompactionJobStatus.COMPLETED,
+            report=report,
+            completed_at=datetime.now(timezone.utc),
+        )
+
+
+vector_compaction_runner = VectorCompactionRunner()
@@ -0,0 +1,190 @@
+from typing import Iterable, List, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlmodel import Session
+
+from app import crud
+from app.core import vector_codec
+from app.core.vector_snapshot import PQ_CENTROIDS
+from app.services.ann_index import normalize_rows, top_labels
+
+# Số không gian con xử lý cùng lúc khi huấn luyện/mã hóa, để giới hạn bộ nhớ tạm
+_SUBSPACE_GROUP = 16
+# Số hàng mã hóa mỗi lần
+_ENCODE_CHUNK = 4096
+# Số ID mỗi truy vấn IN khi đọc mẫu vector
+_SAMPLE_ID_CHUNK = 1000
+
+
+class ProductQuantizer:
+    """
+    Product quantization: vector (đã chuẩn hóa L2, đệm 0 cho đủ chiều) được chia
+    thành `subvectors` đoạn `subvector_dim` chiều; mỗi đoạn được thay bằng chỉ số
+    (1 byte) của centroid gần nhất trong codebook của đoạn đó. Tích vô hướng với
+    một truy vấn được tính gần đúng bằng bảng tra (asymmetric distance): tổng
+    tích của từng đoạn truy vấn với centroid được chọn.
+    """
+    def __init__(self, dim: int, codebooks: np.ndarray, codebook_id: UUID | None = None):
+        self.dim = dim
+        self.codebooks = np.ascontiguousarray(codebooks, dtype=np.float32)  # (subvectors, 256, subvector_dim)
+        self.codebook_id = codebook_id  # Phiên bản codebook đã lưu (xem app/services/vector_codebooks.py)
+
+    @property
+    def subvectors(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def subvector_dim(self) -> int:
+        return self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, subvector_dim: int, iterations: int = 10, seed: int = 0) -> "ProductQuantizer":
+        """Huấn luyện codebook bằng k-means (Euclid) trên từng không gian con của mẫu `vectors`."""
+        dim = vectors.shape[1]
+        subvectors = -(-dim // subvector_dim)
+        rng = np.random.default_rng(seed)
+        quantizer = cls(dim, np.zeros((subvectors, PQ_CENTROIDS, subvector_dim), dtype=np.float32))
+        if len(vectors) == 0:
+            return quantizer
+        parts = quantizer._split(vectors)  # (subvectors, n, subvector_dim)
+        # Ít hơn 256 vector: centroid trùng nhau, vòng lặp sẽ gieo lại các cụm rỗng
+        initial = rng.choice(len(vectors), PQ_CENTROIDS, replace=len(vectors) < PQ_CENTROIDS)
+        codebooks = parts[:, initial].copy()
+        for _ in range(iterations):
+            for start in range(0, subvectors, _SUBSPACE_GROUP):
+                group = slice(start, start + _SUBSPACE_GROUP)
+                codebooks[group] = _kmeans_step(parts[group], codebooks[group], rng)
+        quantizer.codebooks = codebooks
+        return quantizer
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (subvectors, n, subvector_dim), chuẩn hóa L2 và đệm 0."""
+        vectors = normalize_rows(vectors)
+        padded = self.subvectors * self.subvector_dim
+        if padded != self.dim:
+            vectors = np.pad(vectors, ((0, 0), (0, padded - self.dim)))
+        return np.ascontiguousarray(vectors.reshape(len(vectors), self.subvectors, self.subvector_dim).transpose(1, 0, 2))
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Mã (n, subvectors) uint8 của các vector."""
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for row in range(0, len(vectors), _ENCODE_CHUNK):
+            parts = self._split(vectors[row:row + _ENCODE_CHUNK])
+            for start in range(0, self.subvectors, _SUBSPACE_GROUP):
+                group = slice(start, start + _SUBSPACE_GROUP)
+                codes[row:row + _ENCODE_CHUNK, group] = _nearest(parts[group], self.codebooks[group]).T
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Vector (n, dim) float32 dựng lại từ mã (đã chuẩn hóa, xấp xỉ)."""
+        parts = self.codebooks[np.arange(self.subvectors), codes]  # (n, subvectors, subvector_dim)
+        return parts.reshape(len(codes), -1)[:, :self.dim]
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Cosine gần đúng (q, n) giữa các truy vấn và vector đã mã hóa, qua bảng tra."""
+        tables = np.einsum("mqd,mkd->qmk", self._split(queries), self.codebooks)  # (q, subvectors, 256)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for subvector in range(self.subvectors):
+            scores += tables[:, subvector, codes[:, subvector]]
+        return scores
+
+
+def _nearest(parts: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """Chỉ số centroid gần nhất (g, n) cho từng không gian con của nhóm."""
+    # ||x - c||^2 = ||x||^2 - (2 x.c - ||c||^2); ||x||^2 không đổi theo c, tính tại chỗ để bớt mảng tạm
+    scores = np.matmul(parts, codebooks.transpose(0, 2, 1))
+    scores *= 2
+    scores -= np.einsum("gkd,gkd->gk", codebooks, codebooks)[:, None, :]
+    return np.argmax(scores, axis=2)
+
+
+def _kmeans_step(parts: np.ndarray, codebooks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Một vòng Lloyd cho một nhóm không gian con; centroid rỗng lấy một điểm ngẫu nhiên."""
+    group, n, subvector_dim = parts.shape
+    assignments = _nearest(parts, codebooks) + (np.arange(group) * PQ_CENTROIDS)[:, None]
+    flat = assignments.ravel()
+    counts = np.bincount(flat, minlength=group * PQ_CENTROIDS).reshape(group, PQ_CENTROIDS)
+    sums = np.stack(
+        [np.bincount(flat, weights=parts[..., d].ravel(), minlength=group * PQ_CENTROIDS) for d in range(subvector_dim)],
+        axis=-1,
+    ).reshape(group, PQ_CENTROIDS, subvector_dim)
+    updated = np.where(counts[..., None] > 0, sums / np.maximum(counts, 1)[..., None], codebooks).astype(np.float32)
+    empty_group, empty_centroid = np.nonzero(counts == 0)
+    if len(empty_group):
+        updated[empty_group, empty_centroid] = parts[empty_group, rng.integers(0, n, len(empty_group))]
+    return updated
+
+
+def sample_product_vectors(session: Session, model_id: UUID, limit: int) -> Tuple[List[UUID], np.ndarray]:
+    """
+    Tối đa `limit` vector ngẫu nhiên của một model: (product id, ma trận float32),
+    theo thứ tự id để cùng một tập vector luôn cho cùng kết quả huấn luyện.
+    """
+    ids = sorted(crud.get_random_product_vector_ids(session, model_id, limit))
+    rows = sorted(
+        (
+            row for start in range(0, len(ids), _SAMPLE_ID_CHUNK)
+            for row in crud.get_product_vector_rows_by_ids(session, ids[start:start + _SAMPLE_ID_CHUNK])
+        ),
+        key=lambda row: row[0],
+    )
+    return [row[1] for row in rows], vector_codec.decode_embeddings(row[3:] for row in rows)
+
+
+def evaluate_recall(
+    vectors: np.ndarray,
+    labels: np.ndarray,
+    num_queries: int,
+    pq_subvector_dims: Iterable[int],
+    top_ks: Tuple[int, ...] = (1, 5),
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Recall@k theo sản phẩm của các dạng nén so với float32. Truy vấn là
+    `num_queries` vector lấy ngẫu nhiên trong `vectors` (loại chính nó khỏi ứng
+    viên, như một ảnh mới của sản phẩm đã có); recall@k là tỉ lệ sản phẩm trong
+    top-k chính xác cũng có trong top-k tính trên vector đã nén. Trả về một dòng
+    cho mỗi dạng: float32, int8 và pq với từng `subvector_dim`.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    dim = vectors.shape[1]
+    query_rows = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = normalize_rows(vectors[query_rows])
+
+    def ranked(scores: np.ndarray) -> List[np.ndarray]:
+        scores[np.arange(len(query_rows)), query_rows] = -np.inf
+        return [top_labels(row, labels, max(top_ks))[0] for row in scores]
+
+    int8 = np.stack([
+        vector_codec.decode_embedding(data, vector_codec.INT8, scale)
+        for data, scale in (vector_codec.encode_embedding(vector, vector_codec.INT8) for vector in vectors)
+    ])
+    candidates = [
+        ("float32", dim * 4, lambda: queries @ normalize_rows(vectors).T),
+        ("int8", dim + 4, lambda: queries @ normalize_rows(int8).T),
+    ]
+    for subvector_dim in pq_subvector_dims:
+        quantizer = ProductQuantizer.train(vectors, subvector_dim, seed=seed)
+        codes = quantizer.encode(vectors)
+        candidates.append((
+            f"pq{subvector_dim}",
+            quantizer.subvectors,
+            lambda quantizer=quantizer, codes=codes: quantizer.scores(queries, codes),
+        ))
+
+    truth = None
+    report = []
+    for name, bytes_per_vector, score in candidates:
+        found = ranked(score())
+        if truth is None:
+            truth = found
+        row = {"format": name, "bytes_per_vector": bytes_per_vector, "compression_ratio": dim * 4 / bytes_per_vector}
+        for k in top_ks:
+            row[f"recall_at_{k}"] = float(np.mean([
+                len(set(expected[:k].tolist()) & set(got[:k].tolist())) / max(min(k, len(expected)), 1)
+                for expected, got in zip(truth, found)
+            ]))
+        report.append(row)
+    return report
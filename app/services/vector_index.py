@@ -0,0 +1,323 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, List
+from uuid import UUID
+
+import numpy as np
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.database import engine
+from app.core.vector_codec import decode_embeddings
+from app.models import ProductVector
+from app.services.ann_index import (
+    MIN_POINTS_PER_LIST,
+    IVFIndex,
+    array_to_uuids,
+    normalize_rows,
+    train_centroids,
+    uuids_to_array,
+)
+
+logger = logging.getLogger(__name__)
+
+# Huấn luyện lại khi số vector đã tăng gấp bấy nhiêu lần so với lúc huấn luyện
+_RETRAIN_GROWTH = 4
+
+
+class VectorBatch:
+    """
+    Ảnh chụp một nhóm ProductVector để đưa vào index sau khi commit: sau commit
+    các object bị expire và đọc lại `embedding` sẽ tốn một truy vấn mỗi vector.
+    """
+    def __init__(
+        self,
+        model_id: UUID | None,
+        vector_ids: List[UUID],
+        product_ids: List[UUID],
+        image_ids: List[UUID | None],
+        embeddings: np.ndarray,
+    ):
+        self.model_id = model_id
+        self.vector_ids = vector_ids
+        self.product_ids = product_ids
+        self.image_ids = image_ids
+        self.embeddings = embeddings
+
+    @classmethod
+    def from_models(cls, model_id: UUID | None, vectors: List[ProductVector]) -> "VectorBatch":
+        return cls(
+            model_id,
+            [vector.id for vector in vectors],
+            [vector.product_id for vector in vectors],
+            [vector.image_id for vector in vectors],
+            decode_embeddings((vector.embedding_data, vector.embedding_dtype, vector.embedding_scale) for vector in vectors),
+        )
+
+
+class VectorIndex:
+    """
+    Index tìm kiếm vector trong bộ nhớ cho model embedding đang phục vụ.
+
+    Vector được chuẩn hóa L2 (điểm = cosine similarity) và lưu trong một
+    `IVFIndex`: khi đủ vector, chúng được chia cụm bằng k-means và mỗi truy vấn
+    chỉ quét `nprobe` cụm gần nhất; khi chưa đủ (hoặc `nlist <= 1`) tìm kiếm là
+    chính xác. Kết quả được gộp theo sản phẩm.
+
+    Index được dựng khi cần tìm kiếm với một model mới: đọc file đã lưu trong
+    `storage_dir` rồi đồng bộ phần chênh lệch với database, hoặc dựng lại từ
+    đầu nếu chưa có file. Sau đó nó được cập nhật tăng dần khi vector được thêm
+    hoặc xóa qua tiến trình này, và được huấn luyện lại ở luồng nền khi số
+    vector tăng nhiều. An toàn khi gọi từ nhiều luồng.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] | None,
+        nlist: int = settings.VECTOR_INDEX_NLIST,
+        nprobe: int = settings.VECTOR_INDEX_NPROBE,
+        train_points_per_list: int = settings.VECTOR_INDEX_TRAIN_POINTS_PER_LIST,
+        storage_dir: str = settings.VECTOR_INDEX_DIR,
+        load_batch_size: int = settings.VECTOR_INDEX_LOAD_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_points_per_list = train_points_per_list
+        self.storage_dir = storage_dir
+        self.load_batch_size = load_batch_size
+        self._lock = threading.RLock()
+        self._training = False
+        self.model_id: UUID | None = None
+        self._reset(0)
+
+    def _reset(self, dim: int):
+        self._ivf = IVFIndex(dim)
+        # Sản phẩm được đánh số (nhãn của IVFIndex) để gộp kết quả bằng NumPy
+        self._products: List[UUID] = []
+        self._product_number: dict[UUID, int] = {}
+        self._image_of: dict[UUID, UUID] = {}
+        self._vectors_of_image: dict[UUID, set[UUID]] = {}
+
+    @property
+    def size(self) -> int:
+        return self._ivf.size
+
+    @property
+    def dim(self) -> int:
+        return self._ivf.dim
+
+    def _path(self, model_id: UUID) -> str | None:
+        return os.path.join(self.storage_dir, f"{model_id}.npz") if self.storage_dir else None
+
+    def ensure_model(self, model_id: UUID):
+        """Dựng index cho `model_id` nếu nó đang giữ vector của model khác."""
+        with self._lock:
+            if self.model_id == model_id:
+                return
+            start = time.perf_counter()
+            self._reset(0)
+            self.model_id = model_id
+            with self.session_factory() as session:
+                loaded = self._load_saved(session, model_id)
+                if not loaded:
+                    self._build(session, model_id)
+            if not loaded:
+                self.save()
+            logger.info(
+                f"Đã {'đọc' if loaded else 'dựng'} index vector cho model {model_id}: {self.size} vector, "
+                f"{self._ivf.nlist} cụm, trong {time.perf_counter() - start:.2f}s."
+            )
+
+    def _build(self, session: Session, model_id: UUID):
+        total = crud.count_product_vectors(session, model_id)
+        if self.nlist > 1 and total >= self.nlist * MIN_POINTS_PER_LIST:
+            # Huấn luyện trên một mẫu ngẫu nhiên trước, để mỗi vector chỉ được đọc và gán cụm một lần
+            sample_ids = crud.get_random_product_vector_ids(session, model_id, self.nlist * self.train_points_per_list)
+            sample = decode_embeddings(
+                row[3:] for ids in self._chunks(sample_ids) for row in crud.get_product_vector_rows_by_ids(session, ids)
+            )
+            self._ivf = IVFIndex(sample.shape[1], train_centroids(normalize_rows(sample), self.nlist), total)
+        for rows in crud.iter_product_vector_rows(session, model_id, self.load_batch_size):
+            self._add_rows(rows)
+
+    def _load_saved(self, session: Session, model_id: UUID) -> bool:
+        """
+        Đọc index đã lưu của `model_id` rồi đồng bộ với database: xóa vector đã
+        bị xóa và thêm vector mới được tạo (kể cả bởi tiến trình khác) từ lần lưu.
+        """
+        path = self._path(model_id)
+        if path is None or not os.path.exists(path):
+            return False
+        try:
+            ivf, data = IVFIndex.load(path)
+            with data:
+                self._ivf = ivf
+                self._products = array_to_uuids(data["products"])
+                self._product_number = {product_id: i for i, product_id in enumerate(self._products)}
+                for list_no, inverted_list in enumerate(ivf.lists):
+                    for key, image_id in zip(inverted_list.keys, array_to_uuids(data[f"images_{list_no}"])):
+                        if image_id is not None:
+                            self._link_image(key, image_id)
+        except Exception as e:
+            logger.warning(f"Không đọc được index đã lưu {path}, dựng lại từ database: {e}")
+            self._reset(0)
+            return False
+
+        db_ids = set(crud.get_product_vector_ids(session, model_id))
+        self._remove_keys([key for key in list(self._ivf.keys()) if key not in db_ids])
+        missing = [vector_id for vector_id in db_ids if vector_id not in self._ivf]
+        for ids in self._chunks(missing):
+            self._add_rows(crud.get_product_vector_rows_by_ids(session, ids))
+        return True
+
+    def _chunks(self, values: List[UUID]) -> Iterable[List[UUID]]:
+        for start in range(0, len(values), self.load_batch_size):
+            yield values[start:start + self.load_batch_size]
+
+    def save(self):
+        """Ghi index hiện tại ra `storage_dir` (nếu được cấu hình)."""
+        with self._lock:
+            path = self._path(self.model_id) if self.model_id is not None else None
+            if path is None:
+                return
+            extra = {"products": uuids_to_array(self._products)}
+            for list_no, inverted_list in enumerate(self._ivf.lists):
+                extra[f"images_{list_no}"] = uuids_to_array(self._image_of.get(key) for key in inverted_list.keys)
+            try:
+                self._ivf.save(path, extra)
+            except OSError as e:
+                logger.warning(f"Không lưu được index vector vào {path}: {e}")
+
+    def add(self, batch: VectorBatch):
+        """Thêm vector mới (đã commit). Bỏ qua nếu index chưa dựng hoặc đang giữ model khác."""
+        with self._lock:
+            if batch.model_id != self.model_id or batch.model_id is None or not batch.vector_ids:
+                return
+            self._add(batch.vector_ids, batch.product_ids, batch.image_ids, batch.embeddings)
+        self._maybe_retrain()
+
+    def _add_rows(self, rows: list):
+        if rows:
+            vector_ids, product_ids, image_ids = zip(*(row[:3] for row in rows))
+            self._add(list(vector_ids), list(product_ids), list(image_ids), decode_embeddings(row[3:] for row in rows))
+
+    def _add(self, vector_ids: List[UUID], product_ids: List[UUID], image_ids: List[UUID | None], embeddings: np.ndarray):
+        if self._ivf.size == 0 and self._ivf.dim != embeddings.shape[1]:
+            self._ivf = IVFIndex(embeddings.shape[1])
+        elif self._ivf.dim != embeddings.shape[1]:
+            raise ValueError(f"Vector có {embeddings.shape[1]} chiều, index có {self.dim} chiều.")
+        labels = np.empty(len(product_ids), dtype=np.int32)
+        for i, product_id in enumerate(product_ids):
+            number = self._product_number.get(product_id)
+            if number is None:
+                number = self._product_number[product_id] = len(self._products)
+                self._products.append(product_id)
+            labels[i] = number
+        self._ivf.add(vector_ids, labels, normalize_rows(embeddings))
+        for vector_id, image_id in zip(vector_ids, image_ids):
+            if image_id is not None:
+                self._link_image(vector_id, image_id)
+
+    def _link_image(self, vector_id: UUID, image_id: UUID):
+        self._image_of[vector_id] = image_id
+        self._vectors_of_image.setdefault(image_id, set()).add(vector_id)
+
+    def remove_images(self, image_ids: Iterable[UUID]):
+        with self._lock:
+            self._remove_keys([
+                vector_id for image_id in image_ids for vector_id in self._vectors_of_image.get(image_id, ())
+            ])
+
+    def remove_vectors(self, vector_ids: Iterable[UUID]):
+        with self._lock:
+            self._remove_keys(list(vector_ids))
+
+    def remove_product(self, product_id: UUID):
+        with self._lock:
+            number = self._product_number.get(product_id)
+            if number is not None:
+                self._unlink_images(self._ivf.remove_label(number))
+
+    def _remove_keys(self, vector_ids: List[UUID]):
+        self._unlink_images(self._ivf.remove(vector_ids))
+
+    def _unlink_images(self, vector_ids: List[UUID]):
+        for vector_id in vector_ids:
+            image_id = self._image_of.pop(vector_id, None)
+            if image_id is not None:
+                vectors = self._vectors_of_image[image_id]
+                vectors.discard(vector_id)
+                if not vectors:
+                    del self._vectors_of_image[image_id]
+
+    def retain_model(self, model_id: UUID):
+        """Bỏ index nếu nó giữ vector của model khác `model_id` (vector đó vừa bị xóa khỏi database)."""
+        with self._lock:
+            if self.model_id is not None and self.model_id != model_id:
+                self.model_id = None
+                self._reset(0)
+
+    def _needs_training(self) -> bool:
+        if self.nlist <= 1 or self.size < self.nlist * MIN_POINTS_PER_LIST:
+            return False
+        return self._ivf.centroids is None or self.size >= _RETRAIN_GROWTH * self._ivf.trained_size
+
+    def _maybe_retrain(self):
+        with self._lock:
+            if self._training or not self._needs_training():
+                return
+            self._training = True
+        threading.Thread(target=self.retrain, name="vector-index-retrain", daemon=True).start()
+
+    def retrain(self):
+        """
+        Huấn luyện lại k-means trên một mẫu các vector hiện có và chia lại cụm.
+        K-means chạy ngoài khóa; chỉ bước chia lại cụm chặn tìm kiếm.
+        """
+        try:
+            with self._lock:
+                model_id = self.model_id
+                sample = self._ivf.sample(self.nlist * self.train_points_per_list)
+            if len(sample) < self.nlist:
+                return
+            start = time.perf_counter()
+            centroids = train_centroids(sample, self.nlist)
+            with self._lock:
+                if self.model_id != model_id:
+                    return
+                self._ivf = self._ivf.retrained(centroids)
+                logger.info(
+                    f"Đã huấn luyện lại index vector ({self.size} vector, {self.nlist} cụm) "
+                    f"trong {time.perf_counter() - start:.2f}s."
+                )
+                self.save()
+        finally:
+            self._training = False
+
+    def search(self, model_id: UUID, queries: np.ndarray, top_k: int, nprobe: int | None = None) -> List[List[dict]]:
+        """
+        Trả về, cho mỗi vector truy vấn của model `model_id`, tối đa `top_k` sản
+        phẩm có điểm cosine cao nhất (điểm của sản phẩm là điểm cao nhất trong
+        các vector của nó). Lần đầu gặp một model, index được dựng như trên.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        with self._lock:
+            self.ensure_model(model_id)
+            if self.size == 0:
+                return [[] for _ in range(len(queries))]
+            if queries.shape[1] != self.dim:
+                raise ValueError(f"Embedding có {queries.shape[1]} chiều, index có {self.dim} chiều.")
+            results = self._ivf.search(queries, top_k, nprobe or self.nprobe)
+            return [
+                [
+                    {"product_id": self._products[label], "score": float(score)}
+                    for label, score in zip(labels, scores)
+                ]
+                for labels, scores in results
+            ]
+
+
+vector_index = VectorIndex(lambda: Session(engine))
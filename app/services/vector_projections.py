@@ -0,0 +1,113 @@
+import logging
+from typing import Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.vector_projection import Projection
+from app.models import VectorProjection
+from app.services.ann_index import normalize_rows
+from app.services.vector_compression import sample_product_vectors
+
+logger = logging.getLogger(__name__)
+
+# Randomized SVD: số cột dư và số vòng lặp lũy thừa để các thành phần chính đủ chính xác
+_OVERSAMPLING = 10
+_POWER_ITERATIONS = 4
+
+# Ma trận của các phiên bản đã tải, theo id (mỗi phiên bản 6912 chiều -> 256 chiều là khoảng 7 MiB)
+_CACHE_SIZE = 4
+_cache: dict[UUID, Projection] = {}
+
+
+def fit_pca(vectors: np.ndarray, dims: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    PCA của các vector (đã chuẩn hóa L2) bằng randomized SVD: chỉ nhân ma trận
+    (n, D) với (D, dims + 10), không tạo ma trận hiệp phương sai D x D (6912 x
+    6912 với model hiện tại). Trả về (mean, components (dims, D), tỉ lệ phương
+    sai giữ lại). Raises ValueError nếu số vector hoặc số chiều nhỏ hơn `dims`.
+    """
+    x = normalize_rows(vectors)
+    n, source_dim = x.shape
+    if not 0 < dims <= min(n, source_dim):
+        raise ValueError(f"Không fit được PCA {dims} chiều từ {n} vector {source_dim} chiều")
+    mean = x.mean(axis=0)
+    x -= mean
+    rank = min(dims + _OVERSAMPLING, n, source_dim)
+    rng = np.random.default_rng(seed)
+    basis = x @ rng.standard_normal((source_dim, rank), dtype=np.float32)
+    for _ in range(_POWER_ITERATIONS):
+        basis, _ = np.linalg.qr(basis)
+        basis, _ = np.linalg.qr(x.T @ basis)
+        basis = x @ basis
+    basis, _ = np.linalg.qr(basis)
+    _, singular, components = np.linalg.svd(basis.T @ x, full_matrices=False)
+    total = float(np.einsum("ij,ij->", x, x))
+    explained = float(np.sum(singular[:dims] ** 2) / total) if total > 0 else 1.0
+    return mean, np.ascontiguousarray(components[:dims], dtype=np.float32), explained
+
+
+def to_projection(row: VectorProjection) -> Projection:
+    """Ma trận của một phiên bản projection lưu trong database."""
+    mean = np.frombuffer(row.mean_data, dtype="<f4")
+    components = np.frombuffer(row.components_data, dtype="<f4").reshape(row.dims, row.source_dim)
+    return Projection(row.model_id, row.id, mean, components)
+
+
+def fit_vector_projection(session: Session, model_id: UUID, dims: int, sample_size: int) -> VectorProjection:
+    """Fit PCA trên tối đa `sample_size` vector ngẫu nhiên của model và lưu thành phiên bản mới."""
+    _, sample = sample_product_vectors(session, model_id, sample_size)
+    if not len(sample):
+        raise ValueError(f"Model {model_id} chưa có vector để fit PCA")
+    mean, components, explained = fit_pca(sample, dims)
+    projection = crud.create_vector_projection(session, VectorProjection(
+        model_id=model_id,
+        source_dim=sample.shape[1],
+        dims=dims,
+        fitted_vectors=len(sample),
+        explained_variance=explained,
+        mean_data=mean.astype("<f4").tobytes(),
+        components_data=components.astype("<f4").tobytes(),
+    ))
+    logger.info(
+        f"Đã fit PCA {sample.shape[1]} -> {dims} chiều cho model {model_id} trên {len(sample)} vector, "
+        f"giữ {explained:.1%} phương sai (phiên bản {projection.id})"
+    )
+    return projection
+
+
+def load_projection(session: Session, projection_id: UUID) -> Projection | None:
+    """Ma trận của một phiên bản projection, giữ trong bộ nhớ vì phiên bản không đổi sau khi lưu."""
+    projection = _cache.get(projection_id)
+    if projection is None:
+        row = crud.get_vector_projection_by_id(session, projection_id)
+        if row is None:
+            return None
+        projection = to_projection(row)
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        _cache[projection_id] = projection
+    return projection
+
+
+def get_export_projection(session: Session, model_id: UUID) -> Projection | None:
+    """
+    Projection áp dụng cho vector xuất ra của model: phiên bản mới nhất có
+    VECTOR_PROJECTION_DIMS chiều đã lưu trong database. None khi tắt
+    (VECTOR_PROJECTION_DIMS = 0) hoặc chưa có phiên bản nào; khi đó vector được
+    xuất nguyên chiều.
+
+    Hàm chỉ đọc, không bao giờ fit: phiên bản mới chỉ được tạo qua
+    `POST /vectors/projection`, nên request xuất vector không phải chạy SVD và
+    các worker không tự fit ra các phiên bản khác nhau của cùng một model.
+    """
+    dims = settings.VECTOR_PROJECTION_DIMS
+    if dims <= 0:
+        return None
+    projection_id = crud.get_latest_vector_projection_id(session, model_id, dims)
+    if projection_id is None:
+        return None
+    return load_projection(session, projection_id)
@@ -0,0 +1,432 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+from uuid import UUID
+
+from sqlmodel import Session
+
+from app import crud
+from app.core import vector_codec, vector_snapshot
+from app.core.config import settings
+from app.core.database import engine, export_engine
+from app.core.vector_projection import Projection
+from app.models import ProductVector
+from app.services.ai_service import model_manager
+from app.services.ann_index import uuids_to_array
+from app.services import vector_codebooks, vector_projections
+from app.services.vector_compression import ProductQuantizer
+from app.services.r2_service import r2_service
+
+logger = logging.getLogger(__name__)
+
+# Cột đọc khi xuất vector; không tải ORM object
+_EXPORT_DATA_COLUMNS = (ProductVector.embedding_data, ProductVector.embedding_dtype, ProductVector.embedding_scale)
+_EXPORT_JSON_COLUMNS = (ProductVector.id, ProductVector.product_id, *_EXPORT_DATA_COLUMNS)
+
+# Các biến thể của file tải về: JSON hoặc snapshot nhị phân float32/int8/pq
+JSON = "json"
+VARIANTS = (JSON, vector_codec.FLOAT32, vector_codec.INT8, vector_snapshot.PQ)
+
+# Trong storage_dir: khóa của worker dựng file, và file đánh dấu model được cart yêu cầu
+_BUILDER_LOCK = ".builder.lock"
+_REQUEST_SUFFIX = ".requested"
+
+
+def sync_cursor(session: Session) -> datetime:
+    """
+    Cursor cho lần đồng bộ tiếp theo: giờ của database lùi lại
+    VECTOR_SYNC_SAFETY_LAG_SECONDS, vì `created_at`/`deleted_at` là giờ bắt đầu
+    transaction và một transaction đang mở có thể commit sau thời điểm này.
+    Vector trong khoảng lùi có thể được gửi lại; cart ghi đè theo `id` nên vô hại.
+    """
+    return crud.get_database_time(session) - timedelta(seconds=settings.VECTOR_SYNC_SAFETY_LAG_SECONDS)
+
+
+def iter_json_export(model_id: UUID, batch_size: int, projection: Projection | None = None) -> Iterator[str]:
+    """
+    Sinh file JSON của `/download` theo từng lô đọc từ server-side cursor: mỗi lô
+    được mã hóa và gửi đi ngay, nên bộ nhớ không tăng theo số vector. Với
+    `projection`, vector được chiếu xuống số chiều của projection.
+    """
+    projection_id = json.dumps(str(projection.projection_id) if projection else None)
+    with Session(export_engine) as db:
+        yield '{\n  "model_id": "%s",\n  "projection_id": %s,\n  "vectors": [' % (model_id, projection_id)
+        separator = "\n"
+        for rows in crud.iter_product_vector_rows(db, model_id, batch_size, columns=_EXPORT_JSON_COLUMNS):
+            embeddings = export_embeddings([row[2:] for row in rows], projection)
+            items = [
+                json.dumps({"id": str(vector_id), "product_id": str(product_id), "embedding": embedding.tolist()})
+                for (vector_id, product_id, *_), embedding in zip(rows, embeddings)
+            ]
+            yield separator + ",\n".join(items)
+            separator = ",\n"
+        yield "\n  ]\n}\n"
+
+
+def iter_binary_export(
+    model_id: UUID,
+    dtype: str,
+    batch_size: int,
+    projection: Projection | None = None,
+    quantizer: ProductQuantizer | None = None,
+) -> Iterator[bytes]:
+    """
+    Sinh snapshot nhị phân theo từng lô. Header cần số vector và các phần (vector
+    id, product id, scale, ma trận) nằm liền nhau, nên mỗi phần là một lượt đọc
+    cursor riêng theo cùng thứ tự id, trong cùng một snapshot của database
+    (`export_engine`). pq cần `quantizer` (codebook đã lưu, xem
+    `vector_codebooks.get_export_codebook`), gửi kèm codebook trong file. Với
+    `projection`, vector được chiếu trước khi mã hóa.
+    """
+    if (dtype == vector_snapshot.PQ) != (quantizer is not None):
+        raise ValueError("A codebook is required for pq snapshots and only for them.")
+    with Session(export_engine) as db:
+        count = crud.count_product_vectors(db, model_id)
+        dim = projection.dims if projection else crud.get_product_vector_dim(db, model_id) or 0
+        if quantizer is not None:
+            if count and quantizer.dim != dim:
+                raise ValueError(f"Codebook {quantizer.codebook_id} encodes {quantizer.dim} dimensions, vectors have {dim}.")
+            dim = quantizer.dim
+
+        def id_chunks(column):
+            for rows in crud.iter_product_vector_rows(db, model_id, batch_size, columns=(column,)):
+                yield uuids_to_array(rows)  # Select một cột: sqlmodel trả về giá trị trực tiếp
+
+        def encoded_chunks(part: int):
+            for rows in crud.iter_product_vector_rows(db, model_id, batch_size, columns=_EXPORT_DATA_COLUMNS):
+                if quantizer is not None:
+                    yield quantizer.encode(export_embeddings(rows, projection))
+                elif projection is not None:
+                    yield vector_snapshot.quantize_matrix(export_embeddings(rows, projection), dtype)[part]
+                else:
+                    yield vector_snapshot.encode_matrix(rows, dtype)[part]
+
+        yield from vector_snapshot.iter_snapshot_chunks(
+            model_id, dtype, dim, count,
+            id_chunks(ProductVector.id),
+            id_chunks(ProductVector.product_id),
+            encoded_chunks(0),
+            encoded_chunks(1) if dtype == vector_codec.INT8 else None,
+            quantizer.codebooks if quantizer is not None else None,
+            projection.projection_id if projection else None,
+        )
+
+
+def export_embeddings(rows: list, projection: Projection | None):
+    """Ma trận float32 của các hàng (data, dtype, scale), đã chiếu nếu có `projection`."""
+    embeddings = vector_codec.decode_embeddings(rows)
+    return projection.project(embeddings) if projection is not None and len(rows) else embeddings
+
+
+def iter_export(
+    model_id: UUID,
+    variant: str,
+    batch_size: int,
+    projection: Projection | None = None,
+    quantizer: ProductQuantizer | None = None,
+) -> Iterator[str | bytes]:
+    if variant == JSON:
+        return iter_json_export(model_id, batch_size, projection)
+    return iter_binary_export(model_id, variant, batch_size, projection, quantizer)
+
+
+def media_type_of(variant: str) -> str:
+    return "application/json" if variant == JSON else vector_snapshot.MEDIA_TYPE
+
+
+def filename_of(variant: str) -> str:
+    return "product_vectors.json" if variant == JSON else "product_vectors.bin"
+
+
+@dataclass
+class SnapshotArtifact:
+    """Một file tải về đã dựng sẵn cho (model, biến thể)."""
+    model_id: UUID
+    variant: str
+    sha256: str
+    size: int
+    cursor: datetime  # Cursor delta sync tương ứng với nội dung file
+    fingerprint: list  # Trạng thái vector của model lúc dựng, xem `crud.get_product_vector_fingerprint`, và id projection
+    path: str | None = None  # File trên đĩa (lưu local)
+    key: str | None = None  # Object key trên R2
+    previous: str | None = None  # File/key của thế hệ trước, có thể đang được gửi dở
+    projection_id: str | None = None  # PCA projection đã dùng để chiếu vector trong file
+    codebook_id: str | None = None  # Codebook pq đã dùng để mã hóa vector (chỉ biến thể pq)
+
+    @property
+    def location(self) -> str:
+        return self.key or self.path
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag: hash nội dung file."""
+        return f'"{self.sha256}"'
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data.update(model_id=str(self.model_id), cursor=self.cursor.isoformat())
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, text: str) -> "SnapshotArtifact":
+        data = json.loads(text)
+        data.update(model_id=UUID(data["model_id"]), cursor=datetime.fromisoformat(data["cursor"]))
+        return cls(**data)
+
+
+class SnapshotStore:
+    """
+    Dựng sẵn file tải về của `/vectors/download` cho từng model embedding, để
+    mỗi lượt tải chỉ là gửi một file thay vì truy vấn và mã hóa lại cả bảng.
+
+    Luồng nền kiểm tra mỗi `refresh_seconds` giây "dấu vân tay" vector của các
+    model đang theo dõi (model đang phục vụ và các model được yêu cầu tải); khi
+    nó đổi, mọi biến thể của model đó được dựng lại. File được đặt tên theo hash
+    nội dung, ghi vào `storage_dir` hoặc upload lên R2 (`storage="r2"`), kèm
+    metadata (hash, kích thước, cursor) để phục vụ ETag và giữ qua khởi động lại.
+    File cũ được giữ thêm một thế hệ vì có thể đang được gửi dở.
+
+    File có thể cũ hơn database tối đa một chu kỳ; cursor đi kèm là của lúc dựng
+    nên cart đồng bộ phần còn thiếu qua `/vectors/delta`.
+
+    Các worker dùng chung `storage_dir` (kể cả khi lưu trên R2, metadata vẫn ở
+    đây): chỉ worker giữ khóa `_BUILDER_LOCK` dựng file, các worker khác chỉ đọc
+    metadata đã công bố và đánh dấu model được yêu cầu bằng file `*.requested`.
+    Worker dựng chết thì hệ điều hành nhả khóa, worker khác nhận thay ở chu kỳ sau.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] | None,
+        storage_dir: str = settings.VECTOR_SNAPSHOT_DIR,
+        storage: str = settings.VECTOR_SNAPSHOT_STORAGE,
+        refresh_seconds: float = settings.VECTOR_SNAPSHOT_REFRESH_SECONDS,
+        batch_size: int = settings.VECTOR_EXPORT_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.storage_dir = storage_dir
+        self.storage = storage
+        self.refresh_seconds = refresh_seconds
+        self.batch_size = batch_size
+        self._artifacts: dict[tuple[UUID, str], SnapshotArtifact] = {}
+        self._tracked: set[UUID] = set()
+        self._lock = threading.Lock()  # Chỉ một lượt dựng tại một thời điểm
+        self._builder_lock = None  # File khóa đang giữ nếu worker này là worker dựng
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.storage_dir)
+
+    def get(self, model_id: UUID, variant: str) -> SnapshotArtifact | None:
+        """
+        File đã dựng của (model, biến thể), hoặc None nếu chưa có; model được
+        đưa vào danh sách theo dõi để lượt làm mới kế tiếp dựng nó.
+        """
+        if not self.enabled:
+            return None
+        if model_id not in self._tracked:
+            self._tracked.add(model_id)
+            self._request(model_id)
+        artifact = self._artifacts.get((model_id, variant)) if self.is_builder else None
+        if artifact is None:
+            # Worker khác dựng file: luôn đọc metadata mới nhất đã công bố
+            artifact = self._load_metadata(model_id, variant)
+        return artifact
+
+    @property
+    def is_builder(self) -> bool:
+        return self._builder_lock is not None
+
+    def public_url(self, artifact: SnapshotArtifact) -> str | None:
+        return r2_service.get_public_url(artifact.key) if artifact.key else None
+
+    async def run(self):
+        """Vòng lặp làm mới ở chế độ nền, chạy tới khi task bị hủy."""
+        if not self.enabled:
+            return
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Lỗi khi làm mới snapshot vector: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def refresh(self):
+        """
+        Dựng lại snapshot của các model đang theo dõi có vector đã thay đổi; không
+        làm gì nếu một worker khác đang là worker dựng.
+        """
+        with self._lock:
+            if not self._acquire_builder_lock():
+                return
+            served = model_manager.embedding_model_id
+            if served is not None:
+                self._tracked.add(served)
+            self._tracked.update(self._requested_models())
+            for model_id in list(self._tracked):
+                with self.session_factory() as session:
+                    fingerprint = crud.get_product_vector_fingerprint(session, model_id)
+                    if fingerprint[0] == 0 and model_id != served:
+                        # Model đã bị thay (vector bị xóa hết): thôi theo dõi
+                        self._tracked.discard(model_id)
+                        self._remove_request(model_id)
+                        continue
+                    # Fit lại PCA hoặc huấn luyện lại codebook (phiên bản mới) cũng phải dựng lại file
+                    projection = vector_projections.get_export_projection(session, model_id)
+                    quantizer = vector_codebooks.get_export_codebook(session, model_id, projection)
+                fingerprint.append(str(projection.projection_id) if projection else None)
+                for variant in VARIANTS:
+                    variant_fingerprint, variant_quantizer = fingerprint, None
+                    if variant == vector_snapshot.PQ:
+                        if quantizer is None:
+                            continue  # Chưa huấn luyện codebook (POST /vectors/codebook)
+                        variant_fingerprint = fingerprint + [str(quantizer.codebook_id)]
+                        variant_quantizer = quantizer
+                    artifact = self.get(model_id, variant)
+                    if artifact is None or artifact.fingerprint != variant_fingerprint:
+                        self._build(model_id, variant, variant_fingerprint, projection, variant_quantizer)
+
+    def _acquire_builder_lock(self) -> bool:
+        """Giành khóa worker dựng (không chờ); giữ tới khi tiến trình kết thúc."""
+        if self._builder_lock is not None:
+            return True
+        os.makedirs(self.storage_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.storage_dir, _BUILDER_LOCK), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._builder_lock = lock_file
+        logger.info(f"Worker {os.getpid()} dựng snapshot vector")
+        return True
+
+    def _request_path(self, model_id: UUID) -> str:
+        return os.path.join(self.storage_dir, f"{model_id}{_REQUEST_SUFFIX}")
+
+    def _request(self, model_id: UUID):
+        """Đánh dấu model được yêu cầu tải để worker dựng theo dõi nó."""
+        try:
+            os.makedirs(self.storage_dir, exist_ok=True)
+            open(self._request_path(model_id), "a").close()
+        except OSError as e:
+            logger.warning(f"Không ghi được yêu cầu snapshot cho model {model_id}: {e}")
+
+    def _remove_request(self, model_id: UUID):
+        try:
+            os.remove(self._request_path(model_id))
+        except OSError:
+            pass
+
+    def _requested_models(self) -> set[UUID]:
+        requested = set()
+        for name in os.listdir(self.storage_dir):
+            if name.endswith(_REQUEST_SUFFIX):
+                try:
+                    requested.add(UUID(name[:-len(_REQUEST_SUFFIX)]))
+                except ValueError:
+                    continue
+        return requested
+
+    def _build(
+        self,
+        model_id: UUID,
+        variant: str,
+        fingerprint: list,
+        projection: Projection | None = None,
+        quantizer: ProductQuantizer | None = None,
+    ):
+        started = time.perf_counter()
+        with self.session_factory() as session:
+            cursor = sync_cursor(session)  # Lấy trước khi đọc: thay đổi trong lúc dựng có trong delta
+        os.makedirs(self.storage_dir, exist_ok=True)
+        tmp_path = os.path.join(self.storage_dir, f".{model_id}-{variant}-{uuid.uuid4().hex}.tmp")
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter_export(model_id, variant, self.batch_size, projection, quantizer):
+                    data = chunk.encode() if isinstance(chunk, str) else chunk
+                    digest.update(data)
+                    size += len(data)
+                    f.write(data)
+            sha256 = digest.hexdigest()
+            name = f"{model_id}-{variant}-{sha256[:16]}{os.path.splitext(filename_of(variant))[1]}"
+            artifact = SnapshotArtifact(
+                model_id, variant, sha256, size, cursor, fingerprint,
+                projection_id=str(projection.projection_id) if projection else None,
+                codebook_id=str(quantizer.codebook_id) if quantizer else None,
+            )
+            if self.storage == "r2":
+                key = f"vector-snapshots/{name}"
+                if not r2_service.upload_path(tmp_path, key, media_type_of(variant)):
+                    raise RuntimeError(f"Upload {key} lên R2 thất bại")
+                artifact.key = key
+            else:
+                artifact.path = os.path.join(self.storage_dir, name)
+                os.replace(tmp_path, artifact.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        # Giữ thế hệ trước (có thể đang được gửi dở), xóa thế hệ trước nữa; so với
+        # metadata đã công bố trên đĩa, không phải bản trong bộ nhớ
+        current = self._read_metadata(model_id, variant)
+        stale = None
+        if current is not None and current.location == artifact.location:
+            artifact.previous = current.previous  # Nội dung không đổi, cùng tên file
+        elif current is not None:
+            artifact.previous, stale = current.location, current.previous
+        self._save_metadata(artifact)
+        self._artifacts[(model_id, variant)] = artifact
+        if stale and stale not in self._published_locations(model_id, variant):
+            self._remove(stale)
+        logger.info(
+            f"Đã dựng snapshot {variant} cho model {model_id}: {size / 2**20:.1f} MiB, "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+    def _metadata_path(self, model_id: UUID, variant: str) -> str:
+        return os.path.join(self.storage_dir, f"{model_id}-{variant}.json")
+
+    def _save_metadata(self, artifact: SnapshotArtifact):
+        path = self._metadata_path(artifact.model_id, artifact.variant)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(artifact.to_json())
+        os.replace(tmp_path, path)
+
+    def _read_metadata(self, model_id: UUID, variant: str) -> SnapshotArtifact | None:
+        try:
+            with open(self._metadata_path(model_id, variant)) as f:
+                return SnapshotArtifact.from_json(f.read())
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def _load_metadata(self, model_id: UUID, variant: str) -> SnapshotArtifact | None:
+        artifact = self._read_metadata(model_id, variant)
+        if artifact is None or (artifact.path is not None and not os.path.exists(artifact.path)):
+            return None
+        self._artifacts[(model_id, variant)] = artifact
+        return artifact
+
+    def _published_locations(self, model_id: UUID, variant: str) -> set[str]:
+        """File/key mà metadata đã công bố còn trỏ tới: thế hệ hiện tại và thế hệ trước."""
+        artifact = self._read_metadata(model_id, variant)
+        return {artifact.location, artifact.previous} if artifact is not None else set()
+
+    def _remove(self, location: str):
+        if self.storage == "r2":
+            r2_service.delete_file(location)
+        elif os.path.exists(location):
+            os.remove(location)
+
+
+snapshot_store = SnapshotStore(lambda: Session(engine))
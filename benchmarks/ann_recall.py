@@ -0,0 +1,91 @@
+"""
+So sánh recall@k và độ trễ của index IVF (`app.services.ann_index`) với tìm
+kiếm chính xác, trên vector giả lập sinh trong bộ nhớ (không cần database):
+
+    python -m benchmarks.ann_recall --vectors 100000 --dim 512 --nlist 256 --nprobe 1 4 16 64
+
+Dữ liệu có cấu trúc hai tầng giống catalog thật: sản phẩm thuộc các nhóm
+(ngành hàng) có tâm gần nhau, mỗi sản phẩm có vài vector quanh tâm của nó.
+Truy vấn là tâm một sản phẩm cộng nhiễu. Recall@k là tỉ lệ sản phẩm trong
+top-k chính xác cũng có mặt trong top-k của IVF.
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+
+from app.services.ann_index import IVFIndex, normalize_rows, train_centroids
+
+
+def generate(num_vectors: int, dim: int, vectors_per_product: int, num_groups: int, noise: float, num_queries: int, seed: int = 0):
+    """Trả về (vector, nhãn sản phẩm, truy vấn)."""
+    rng = np.random.default_rng(seed)
+    num_products = max(1, num_vectors // vectors_per_product)
+    groups = rng.standard_normal((num_groups, dim), dtype=np.float32)
+    centers = groups[rng.integers(0, num_groups, num_products)]
+    centers += 0.6 * rng.standard_normal(centers.shape, dtype=np.float32)
+    labels = np.arange(num_vectors, dtype=np.int32) % num_products
+    vectors = centers[labels] + noise * rng.standard_normal((num_vectors, dim), dtype=np.float32)
+    queries = centers[rng.integers(0, num_products, num_queries)]
+    queries += noise * rng.standard_normal(queries.shape, dtype=np.float32)
+    return normalize_rows(vectors), labels, normalize_rows(queries)
+
+
+def timed_search(index: IVFIndex, queries: np.ndarray, top_k: int, nprobe: int):
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query[None, :], top_k, nprobe)[0][0])
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, np.array(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--vectors-per-product", type=int, default=5)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.0, help="Độ lệch chuẩn của nhiễu quanh tâm sản phẩm.")
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--train-points-per-list", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    vectors, labels, queries = generate(
+        args.vectors, args.dim, args.vectors_per_product, args.groups, args.noise, args.queries
+    )
+    keys = [uuid.uuid4() for _ in range(len(vectors))]
+
+    exact = IVFIndex(args.dim)
+    exact.add(keys, labels, vectors)
+
+    start = time.perf_counter()
+    centroids = train_centroids(exact.sample(args.nlist * args.train_points_per_list), args.nlist)
+    train_seconds = time.perf_counter() - start
+    ivf = IVFIndex(args.dim, centroids)
+    start = time.perf_counter()
+    ivf.add(keys, labels, vectors)
+    assign_seconds = time.perf_counter() - start
+    sizes = [inverted_list.size for inverted_list in ivf.lists]
+
+    print(f"{args.vectors} vector x {args.dim} chiều, {args.vectors // args.vectors_per_product} sản phẩm | "
+          f"nlist {args.nlist}: huấn luyện {train_seconds:.1f}s, gán cụm {assign_seconds:.1f}s, "
+          f"cỡ cụm min/median/max {min(sizes)}/{int(np.median(sizes))}/{max(sizes)}")
+    truth, exact_ms = timed_search(exact, queries, args.top_k, 1)
+    print(f"{'nprobe':>7} {'recall@' + str(args.top_k):>9} {'p50 ms':>8} {'p95 ms':>8}")
+    print(f"{'exact':>7} {1.0:9.3f} {np.percentile(exact_ms, 50):8.2f} {np.percentile(exact_ms, 95):8.2f}")
+    for nprobe in args.nprobe:
+        found, samples = timed_search(ivf, queries, args.top_k, nprobe)
+        recall = np.mean([
+            len(set(expected.tolist()) & set(got.tolist())) / max(len(expected), 1)
+            for expected, got in zip(truth, found)
+        ])
+        print(f"{nprobe:>7} {recall:9.3f} {np.percentile(samples, 50):8.2f} {np.percentile(samples, 95):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+So sánh throughput của backend suy luận "thread" và "process" trong ModelManager.
+
+Model được đọc từ file .tflite cục bộ nên không cần database hay R2:
+
+    python -m benchmarks.inference_backends \
+        --crop-model crop.tflite --embedding-model embedding.tflite \
+        --image shelf.jpg --requests 64 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+from app.services.ai_service import ModelManager
+
+
+def load_image(path: str | None, width: int, height: int) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    rng = np.random.default_rng(0)
+    frame = (rng.random((height, width, 3)) * 255).astype(np.uint8)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+async def build_manager(backend: str, workers: int, crop_path: str, embedding_path: str) -> ModelManager:
+    manager = ModelManager(pool_size=workers, backend=backend, process_pool_size=workers)
+    await manager.load_model_files(uuid.uuid4(), crop_path, uuid.uuid4(), embedding_path)
+    return manager
+
+
+async def run_backend(backend: str, args, image: bytes) -> float:
+    manager = await build_manager(backend, args.workers, args.crop_model, args.embedding_model)
+    try:
+        # Làm nóng: mỗi worker chạy ít nhất một lần trước khi đo
+        await asyncio.gather(*[manager.predict_async(image) for _ in range(args.workers)])
+
+        start = time.perf_counter()
+        await asyncio.gather(*[manager.predict_async(image) for _ in range(args.requests)])
+        elapsed = time.perf_counter() - start
+    finally:
+        manager.shutdown()
+    return args.requests / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--crop-model", required=True)
+    parser.add_argument("--embedding-model", required=True)
+    parser.add_argument("--image", help="Ảnh đầu vào; bỏ trống để dùng ảnh nhiễu ngẫu nhiên.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    image = load_image(args.image, args.width, args.height)
+
+    print(f"CPU: {os.cpu_count()} | workers: {args.workers} | requests: {args.requests}")
+    results = {}
+    for backend in ("thread", "process"):
+        results[backend] = await run_backend(backend, args, image)
+        print(f"{backend:>8}: {results[backend]:8.2f} ảnh/giây")
+    print(f"process/thread: {results['process'] / results['thread']:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Đo độ trễ từng giai đoạn của pipeline AI (decode, YOLO, NMS, crop+resize,
+embedding) và của cả `ModelManager.predict`, trên model TFLite giả lập sinh
+cục bộ bởi `benchmarks.synthetic_models` nên không cần database, R2 hay mạng:
+
+    python -m benchmarks.pipeline_stages --sizes 640x480 1920x1080 --boxes 1 10 50
+
+Với mỗi cặp (kích thước ảnh, số box) in ra p50/p95 (ms) và số ảnh/giây của
+từng giai đoạn khi chạy tuần tự trên một interpreter.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.ai_service import (
+    ModelManager,
+    crop_and_resize,
+    decode_image,
+    detect_boxes,
+    run_embedding_batch,
+    select_boxes,
+)
+from app.services.prediction_cache import PredictionCache
+from benchmarks.inference_backends import load_image
+from benchmarks.synthetic_models import ensure_crop_model, ensure_embedding_model
+
+STAGES = ("decode", "yolo", "nms", "crop_resize", "embedding", "predict")
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+async def build_manager(crop_path: str, embedding_path: str) -> ModelManager:
+    # Tắt cache kết quả để mỗi lần predict đều chạy lại toàn bộ pipeline
+    manager = ModelManager(pool_size=1, result_cache=PredictionCache(0, 0))
+    await manager.load_model_files(uuid.uuid4(), crop_path, uuid.uuid4(), embedding_path)
+    return manager
+
+
+def measure(manager: ModelManager, image: bytes, iterations: int, warmup: int) -> tuple[Dict[str, List[float]], int]:
+    """Chạy pipeline `iterations` lần, trả về thời gian (giây) theo giai đoạn và số crop mỗi ảnh."""
+    active = manager._require_active()
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    num_crops = 0
+
+    with active.crop_pool.checkout() as crop_model, active.embedding_pool.checkout() as embedding_model:
+        for i in range(warmup + iterations):
+            t0 = time.perf_counter()
+            frame = decode_image(image)
+            t1 = time.perf_counter()
+            boxes, scores = detect_boxes(crop_model, frame)
+            t2 = time.perf_counter()
+            crop_boxes = select_boxes(boxes, scores, frame.shape[1], frame.shape[0])
+            t3 = time.perf_counter()
+            crops = crop_and_resize(frame, crop_boxes, embedding_model.input_shape)
+            t4 = time.perf_counter()
+            if crops:
+                run_embedding_batch(embedding_model, crops)
+            t5 = time.perf_counter()
+
+            if i >= warmup:
+                for stage, elapsed in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                    timings[stage].append(elapsed)
+            num_crops = len(crops)
+
+    # Toàn bộ pipeline qua ModelManager, gồm cả checkout interpreter
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        manager.predict(image)
+        if i >= warmup:
+            timings["predict"].append(time.perf_counter() - start)
+    return timings, num_crops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x960", "1920x1080", "4032x3024"])
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--crop-size", type=int, default=320)
+    parser.add_argument("--embedding-size", type=int, default=224)
+    parser.add_argument("--model-dir", help="Thư mục chứa/ghi model giả lập; bỏ trống để dùng thư mục tạm.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dir = args.model_dir or tmp_dir
+        embedding_path = ensure_embedding_model(model_dir, args.embedding_size)
+
+        print(f"CPU: {os.cpu_count()} | iterations: {args.iterations} | "
+              f"crop {args.crop_size}px | embedding {args.embedding_size}px")
+        print(f"{'ảnh':>10} {'box':>4} {'crop':>4} {'giai đoạn':>12} {'p50 ms':>9} {'p95 ms':>9} {'ảnh/giây':>9}")
+        for num_boxes in args.boxes:
+            crop_path = ensure_crop_model(model_dir, num_boxes, args.crop_size)
+            manager = asyncio.run(build_manager(crop_path, embedding_path))
+            try:
+                for size in args.sizes:
+                    width, height = parse_size(size)
+                    image = load_image(None, width, height)
+                    timings, num_crops = measure(manager, image, args.iterations, args.warmup)
+                    for stage in STAGES:
+                        samples_ms = np.array(timings[stage]) * 1000
+                        p50, p95 = np.percentile(samples_ms, [50, 95])
+                        throughput = 1000 / samples_ms.mean() if samples_ms.mean() > 0 else float("inf")
+                        print(f"{size:>10} {num_boxes:>4} {num_crops:>4} {stage:>12} "
+                              f"{p50:9.2f} {p95:9.2f} {throughput:9.1f}")
+            finally:
+                manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Sinh model TFLite giả lập có cùng layout với model thật để benchmark offline.
+
+- Crop model: input float32 (1, S, S, 3), output YOLOv8 một lớp (1, 5, A) với
+  A = (S/8)² + (S/16)² + (S/32)² anchor (2100 cho S=320). Đúng `num_boxes`
+  anchor có score vượt ngưỡng, đặt trên lưới không chồng nhau nên đều sống sót
+  qua NMS; phần còn lại có score thấp.
+- Embedding model: int8 lượng tử hóa toàn phần, input (B, S, S, 3), output
+  (B, 6912), batch dimension động hoặc cố định.
+
+Các model có vài lớp conv thật để thời gian invoke không bằng 0, nhưng không
+nhằm mô phỏng chính xác chi phí của model production.
+
+    python -m benchmarks.synthetic_models --output-dir .synthetic_models --boxes 1 10 50
+"""
+import argparse
+import math
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from app.services.ai_service import CONFIDENCE_THRESHOLD, EMBEDDING_OUTPUT_DIMS
+
+YOLO_STRIDES = (8, 16, 32)
+
+
+def yolo_anchor_count(input_size: int) -> int:
+    return sum((input_size // stride) ** 2 for stride in YOLO_STRIDES)
+
+
+def yolo_output(num_boxes: int, input_size: int, seed: int = 0) -> np.ndarray:
+    """Output YOLOv8 (1, 5, A) với đúng `num_boxes` box vượt ngưỡng, không chồng nhau."""
+    anchors = yolo_anchor_count(input_size)
+    if num_boxes > anchors:
+        raise ValueError(f"num_boxes={num_boxes} vượt quá số anchor ({anchors}).")
+    rng = np.random.default_rng(seed)
+
+    output = np.empty((5, anchors), dtype=np.float32)
+    output[0:2] = rng.uniform(0.1, 0.9, (2, anchors))
+    output[2:4] = rng.uniform(0.05, 0.3, (2, anchors))
+    output[4] = rng.uniform(0.0, CONFIDENCE_THRESHOLD / 2, anchors)
+
+    if num_boxes:
+        grid = math.ceil(math.sqrt(num_boxes))
+        cell = 1.0 / grid
+        index = np.arange(num_boxes)
+        output[0, :num_boxes] = (index % grid + 0.5) * cell
+        output[1, :num_boxes] = (index // grid + 0.5) * cell
+        output[2:4, :num_boxes] = cell * 0.6
+        output[4, :num_boxes] = rng.uniform(CONFIDENCE_THRESHOLD + 0.05, 0.99, num_boxes)
+    return output[np.newaxis]
+
+
+class _FixedDetections(tf.keras.layers.Layer):
+    """Trả về output YOLO cố định, phụ thuộc giả vào feature map của backbone."""
+    def __init__(self, detections: np.ndarray, **kwargs):
+        super().__init__(**kwargs)
+        self.detections = detections
+
+    def call(self, features):
+        # Hệ số nhỏ nhưng khác 0: với x * 0.0 converter gấp hằng và cắt bỏ toàn bộ backbone
+        return tf.constant(self.detections) + tf.reduce_mean(features) * 1e-30
+
+
+def build_crop_model(num_boxes: int, input_size: int = 320, seed: int = 0) -> bytes:
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input((input_size, input_size, 3), batch_size=1)
+    x = inputs
+    for filters in (16, 32, 64, 64):
+        x = tf.keras.layers.Conv2D(filters, 3, strides=2, padding="same", activation="relu")(x)
+    outputs = _FixedDetections(yolo_output(num_boxes, input_size, seed))(x)
+    model = tf.keras.Model(inputs, outputs)
+    return tf.lite.TFLiteConverter.from_keras_model(model).convert()
+
+
+def build_embedding_model(
+    input_size: int = 224, output_dims: int = EMBEDDING_OUTPUT_DIMS, dynamic_batch: bool = True, seed: int = 0
+) -> bytes:
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input((input_size, input_size, 3), batch_size=None if dynamic_batch else 1)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, padding="same", activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(32, 3, strides=2, padding="same", activation="relu")(x)
+    x = tf.keras.layers.Conv2D(64, 3, strides=2, padding="same", activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(output_dims)(x)
+    model = tf.keras.Model(inputs, outputs)
+
+    rng = np.random.default_rng(seed)
+
+    def representative_dataset():
+        for _ in range(8):
+            yield [rng.uniform(-128, 127, (1, input_size, input_size, 3)).astype(np.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def crop_model_path(output_dir: str, num_boxes: int, input_size: int) -> str:
+    return os.path.join(output_dir, f"crop-{input_size}-{num_boxes}boxes.tflite")
+
+
+def embedding_model_path(output_dir: str, input_size: int, dynamic_batch: bool) -> str:
+    batch = "dynamic" if dynamic_batch else "static"
+    return os.path.join(output_dir, f"embedding-{input_size}-{batch}.tflite")
+
+
+def ensure_crop_model(output_dir: str, num_boxes: int, input_size: int = 320) -> str:
+    """Sinh crop model vào `output_dir` nếu chưa có và trả về đường dẫn."""
+    path = crop_model_path(output_dir, num_boxes, input_size)
+    if not os.path.exists(path):
+        _write(path, build_crop_model(num_boxes, input_size))
+    return path
+
+
+def ensure_embedding_model(output_dir: str, input_size: int = 224, dynamic_batch: bool = True) -> str:
+    """Sinh embedding model vào `output_dir` nếu chưa có và trả về đường dẫn."""
+    path = embedding_model_path(output_dir, input_size, dynamic_batch)
+    if not os.path.exists(path):
+        _write(path, build_embedding_model(input_size, dynamic_batch=dynamic_batch))
+    return path
+
+
+def _write(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=".synthetic_models")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--crop-size", type=int, default=320)
+    parser.add_argument("--embedding-size", type=int, default=224)
+    parser.add_argument("--static-batch", action="store_true", help="Embedding model có batch cố định bằng 1.")
+    args = parser.parse_args()
+
+    for num_boxes in args.boxes:
+        print(ensure_crop_model(args.output_dir, num_boxes, args.crop_size))
+    print(ensure_embedding_model(args.output_dir, args.embedding_size, not args.static_batch))
+
+
+if __name__ == "__main__":
+    main()
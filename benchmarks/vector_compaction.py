@@ -0,0 +1,66 @@
+"""
+Mức thu gọn và recall của việc thu gọn vector theo sản phẩm
+(`POST /vectors/compaction`, `app.services.vector_compaction`) theo từng ngưỡng
+trùng lặp và số vector tối đa mỗi sản phẩm, không cần database:
+
+    python -m benchmarks.vector_compaction --products 2000 --dim 512 --thresholds 0.95 0.98 --caps 2 4 8
+
+Mỗi sản phẩm có `--views` góc chụp khác nhau quanh tâm sản phẩm; mỗi góc được
+tải lên lặp lại tối đa `--max-uploads` lần với nhiễu nhỏ `--upload-noise`
+(ảnh gần như trùng nhau), như catalog tích lũy ảnh sau nhiều lần xử lý lại.
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+
+from app.services.vector_compaction import compact_groups
+
+
+def generate(products: int, dim: int, views: int, max_uploads: int, view_noise: float, upload_noise: float, seed: int = 0):
+    """Danh sách nhóm (vector id, ma trận) theo sản phẩm."""
+    rng = np.random.default_rng(seed)
+    groups = []
+    for center in rng.standard_normal((products, dim), dtype=np.float32):
+        product_views = center + view_noise * rng.standard_normal((int(rng.integers(1, views + 1)), dim), dtype=np.float32)
+        uploads = np.repeat(product_views, rng.integers(1, max_uploads + 1, len(product_views)), axis=0)
+        vectors = uploads + upload_noise * rng.standard_normal(uploads.shape, dtype=np.float32)
+        groups.append(([uuid.uuid4() for _ in range(len(vectors))], vectors))
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--views", type=int, default=6)
+    parser.add_argument("--max-uploads", type=int, default=5)
+    parser.add_argument("--view-noise", type=float, default=0.5, help="Độ lệch chuẩn giữa các góc chụp của một sản phẩm.")
+    parser.add_argument("--upload-noise", type=float, default=0.15, help="Độ lệch chuẩn giữa các lần tải lên cùng một góc.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.9, 0.95, 0.98])
+    parser.add_argument("--caps", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    groups = generate(args.products, args.dim, args.views, args.max_uploads, args.view_noise, args.upload_noise)
+    ids = [vector_id for vector_ids, _ in groups for vector_id in vector_ids]
+    vectors = np.concatenate([matrix for _, matrix in groups])
+    rows = np.random.default_rng(1).choice(len(ids), min(args.queries, len(ids)), replace=False)
+    query_ids, queries = [ids[row] for row in rows], vectors[rows]
+
+    print(f"{args.products} sản phẩm, {len(ids)} vector x {args.dim} chiều, {len(query_ids)} truy vấn")
+    print(f"{'ngưỡng':>7} {'tối đa':>7} {'còn lại':>8} {'trùng':>7} {'vượt':>6} {'thu gọn':>8} "
+          f"{'recall@1':>9} {'recall@5':>9} {'MiB':>7} {'s':>5}")
+    for threshold in args.thresholds:
+        for cap in args.caps:
+            start = time.perf_counter()
+            _, report = compact_groups(groups, query_ids, queries, cap, threshold)
+            seconds = time.perf_counter() - start
+            print(f"{threshold:7.3f} {cap:>7} {report['vectors_after']:>8} {report['removed_duplicates']:>7} "
+                  f"{report['removed_by_cap']:>6} {report['shrinkage']:8.1%} {report['recall_at_1']:9.3f} "
+                  f"{report['recall_at_5']:9.3f} {report['index_bytes_after'] / 2**20:7.1f} {seconds:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
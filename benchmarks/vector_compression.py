@@ -0,0 +1,46 @@
+"""
+So sánh kích thước và recall@1/@5 theo sản phẩm của các dạng nén vector của
+`GET /vectors/download` (float32, int8, product quantization với các số chiều
+mỗi đoạn khác nhau), trên vector giả lập có cấu trúc như `benchmarks.ann_recall`,
+không cần database:
+
+    python -m benchmarks.vector_compression --vectors 5000 --dim 512 --subvector-dims 4 8 16
+
+Cùng phép đo với `GET /vectors/compression-report` (`evaluate_recall`): truy vấn
+là một vector của mẫu, tìm trên phần còn lại; recall@k là tỉ lệ sản phẩm trong
+top-k chính xác (float32) cũng có trong top-k tính trên vector đã nén.
+"""
+import argparse
+import time
+
+from app.services.vector_compression import evaluate_recall
+from benchmarks.ann_recall import generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--vectors-per-product", type=int, default=4)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--subvector-dims", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    vectors, labels, _ = generate(args.vectors, args.dim, args.vectors_per_product, args.groups, args.noise, 0)
+    start = time.perf_counter()
+    report = evaluate_recall(vectors, labels, args.queries, args.subvector_dims)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.vectors} vector, {args.dim} chiều, {args.queries} truy vấn, {elapsed:.1f}s (gồm huấn luyện codebook)")
+    print(f"{'định dạng':>10} {'byte/vector':>12} {'tỉ lệ nén':>10} {'recall@1':>9} {'recall@5':>9}")
+    for row in report:
+        print(
+            f"{row['format']:>10} {row['bytes_per_vector']:>12} {row['compression_ratio']:>9.1f}x "
+            f"{row['recall_at_1']:>9.3f} {row['recall_at_5']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Đường cong recall theo số chiều của bước chiếu PCA (`VECTOR_PROJECTION_DIMS`,
+`app.services.vector_projections`): fit PCA trên một mẫu vector, chiếu cả
+catalog và truy vấn xuống từng số chiều, rồi so recall@1/@5 theo sản phẩm và độ
+trễ tìm kiếm chính xác với tìm trên vector đầy đủ, không cần database:
+
+    python -m benchmarks.vector_projection --vectors 20000 --dim 6912 --dims 32 64 128 256 512
+
+Dữ liệu như `benchmarks.ann_recall` nhưng nằm gần một không gian con
+`--intrinsic-dim` chiều (embedding thật có số chiều nội tại thấp hơn nhiều so
+với 6912), cộng nhiễu đẳng hướng `--ambient-noise` trên mọi chiều.
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+
+from app.core.vector_projection import Projection
+from app.services.ann_index import IVFIndex
+from app.services.vector_projections import fit_pca
+from benchmarks.ann_recall import generate, timed_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--intrinsic-dim", type=int, default=128)
+    parser.add_argument("--vectors-per-product", type=int, default=5)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.0, help="Độ lệch chuẩn của nhiễu quanh tâm sản phẩm.")
+    parser.add_argument("--ambient-noise", type=float, default=0.02)
+    parser.add_argument("--dims", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--train-sample", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    latent, labels, latent_queries = generate(
+        args.vectors, args.intrinsic_dim, args.vectors_per_product, args.groups, args.noise, args.queries
+    )
+    rng = np.random.default_rng(1)
+    basis = rng.standard_normal((args.intrinsic_dim, args.dim), dtype=np.float32) / np.sqrt(args.intrinsic_dim)
+    vectors = latent @ basis + args.ambient_noise * rng.standard_normal((args.vectors, args.dim), dtype=np.float32)
+    queries = latent_queries @ basis + args.ambient_noise * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    keys = [uuid.uuid4() for _ in range(len(vectors))]
+
+    exact = IVFIndex(args.dim)
+    exact.add(keys, labels, vectors)
+    truth, full_ms = timed_search(exact, queries, 5, 1)
+    sample = vectors[rng.choice(len(vectors), min(args.train_sample, len(vectors)), replace=False)]
+
+    print(f"{args.vectors} vector x {args.dim} chiều (nội tại {args.intrinsic_dim}), "
+          f"PCA fit trên {len(sample)} vector, {args.queries} truy vấn")
+    print(f"{'chiều':>6} {'phương sai':>10} {'fit s':>6} {'recall@1':>9} {'recall@5':>9} {'p50 ms':>7} {'byte/vector':>12}")
+    print(f"{args.dim:>6} {1.0:10.3f} {'-':>6} {1.0:9.3f} {1.0:9.3f} {np.percentile(full_ms, 50):7.2f} {args.dim * 4:>12}")
+    for dims in args.dims:
+        start = time.perf_counter()
+        mean, components, explained = fit_pca(sample, dims)
+        fit_seconds = time.perf_counter() - start
+        projection = Projection(uuid.uuid4(), uuid.uuid4(), mean, components)
+        index = IVFIndex(dims)
+        index.add(keys, labels, projection.project(vectors))
+        found, samples = timed_search(index, projection.project(queries), 5, 1)
+        recall = {
+            k: np.mean([
+                len(set(expected[:k].tolist()) & set(got[:k].tolist())) / max(min(k, len(expected)), 1)
+                for expected, got in zip(truth, found)
+            ])
+            for k in (1, 5)
+        }
+        print(f"{dims:>6} {explained:10.3f} {fit_seconds:6.1f} {recall[1]:9.3f} {recall[5]:9.3f} "
+              f"{np.percentile(samples, 50):7.2f} {dims * 4:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Đo độ trễ tìm kiếm chính xác (quét toàn bộ) của `VectorIndex` (endpoint
+`POST /vectors/search`) trên vector ngẫu nhiên sinh trong bộ nhớ, không cần
+database; so sánh với IVF ở `benchmarks.ann_recall`:
+
+    python -m benchmarks.vector_search --vectors 10000 100000 --dims 512 6912
+
+Mỗi sản phẩm có `--vectors-per-product` vector quanh một tâm chung; truy vấn
+là một vector đã lưu cộng nhiễu. In ra p50/p95 (ms) cho một truy vấn và cho
+một lô truy vấn (như một ảnh có nhiều vật thể), kèm bộ nhớ của ma trận.
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+
+from app.services.vector_index import VectorBatch, VectorIndex
+
+
+def build_index(num_vectors: int, dim: int, vectors_per_product: int, seed: int = 0) -> tuple[VectorIndex, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    model_id = uuid.uuid4()
+    index = VectorIndex(session_factory=None, nlist=1, storage_dir="")  # Tìm kiếm chính xác, không lưu file
+    index.model_id = model_id  # Bỏ qua bước dựng từ database
+
+    num_products = max(1, num_vectors // vectors_per_product)
+    product_ids = [uuid.uuid4() for _ in range(num_products)]
+    centers = rng.standard_normal((num_products, dim), dtype=np.float32)
+    chunk = 10000
+    for start in range(0, num_vectors, chunk):
+        rows = np.arange(start, min(start + chunk, num_vectors))
+        owners = rows % num_products
+        embeddings = centers[owners] + 0.3 * rng.standard_normal((len(rows), dim), dtype=np.float32)
+        index.add(VectorBatch(
+            model_id,
+            [uuid.uuid4() for _ in rows],
+            [product_ids[owner] for owner in owners],
+            [None] * len(rows),
+            embeddings,
+        ))
+    queries = centers[rng.integers(0, num_products, 256)]
+    queries += 0.3 * rng.standard_normal(queries.shape, dtype=np.float32)
+    return index, queries
+
+
+def measure(index: VectorIndex, queries: np.ndarray, batch: int, top_k: int, iterations: int, warmup: int) -> np.ndarray:
+    samples = []
+    for i in range(warmup + iterations):
+        start = (i * batch) % (len(queries) - batch + 1)
+        t0 = time.perf_counter()
+        index.search(index.model_id, queries[start:start + batch], top_k)
+        if i >= warmup:
+            samples.append((time.perf_counter() - t0) * 1000)
+    return np.array(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 6912])
+    parser.add_argument("--vectors-per-product", type=int, default=5)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'vector':>8} {'chiều':>6} {'MiB':>7} {'lô':>4} {'p50 ms':>9} {'p95 ms':>9}")
+    for dim in args.dims:
+        for num_vectors in args.vectors:
+            index, queries = build_index(num_vectors, dim, args.vectors_per_product)
+            size_mib = index.size * dim * 4 / 2**20
+            for batch in args.batches:
+                samples = measure(index, queries, batch, args.top_k, args.iterations, args.warmup)
+                p50, p95 = np.percentile(samples, [50, 95])
+                print(f"{num_vectors:>8} {dim:>6} {size_mib:7.0f} {batch:>4} {p50:9.2f} {p95:9.2f}")
+            del index
+
+
+if __name__ == "__main__":
+    main()
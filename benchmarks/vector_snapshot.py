@@ -0,0 +1,102 @@
+"""
+So sánh kích thước và thời gian đọc của file tải về từ `GET /vectors/download`
+ở dạng JSON (như endpoint đang trả) và snapshot nhị phân float32/int8
+(`app.core.vector_snapshot`), trên vector ngẫu nhiên, không cần database:
+
+    python -m benchmarks.vector_snapshot --vectors 1000 10000 --dims 512 6912
+
+Thời gian đọc tính từ lúc có file trên đĩa đến khi có ma trận float32 trong
+bộ nhớ: JSON là `json.load` rồi `np.array`; snapshot là memory-map rồi chạm
+vào toàn bộ ma trận (`embeddings().sum()`), còn cột `mmap ms` chỉ là mở file.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.core import vector_codec, vector_snapshot
+from app.services.ann_index import uuids_to_array
+
+
+def write_json(path: str, product_ids: list, matrix: np.ndarray):
+    payload = {"vectors": [
+        {"id": uuid.uuid4(), "product_id": product_id, "embedding": vector.tolist()}
+        for product_id, vector in zip(product_ids, matrix)
+    ]}
+    with open(path, "w") as f:
+        f.write(json.dumps(payload, indent=2, default=str))
+
+
+def write_snapshot(path: str, model_id: uuid.UUID, product_ids: list, matrix: np.ndarray, dtype: str):
+    rows = [(vector.tobytes(), vector_codec.FLOAT32, None) for vector in matrix]  # Như cột embedding_data float32
+    snapshot_matrix, scales = vector_snapshot.encode_matrix(rows, dtype)
+    with open(path, "wb") as f:
+        chunks = vector_snapshot.iter_snapshot_chunks(
+            model_id, dtype, matrix.shape[1], len(matrix),
+            [uuids_to_array(uuid.uuid4() for _ in product_ids)], [uuids_to_array(product_ids)],
+            [snapshot_matrix], None if scales is None else [scales],
+        )
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def read_json(path: str) -> np.ndarray:
+    with open(path) as f:
+        payload = json.load(f)
+    return np.array([item["embedding"] for item in payload["vectors"]], dtype=np.float32)
+
+
+def read_snapshot(path: str) -> vector_snapshot.VectorSnapshot:
+    snapshot = vector_snapshot.open_snapshot(path)
+    snapshot.embeddings().sum()
+    return snapshot
+
+
+def timed(fn, path: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 6912])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    model_id = uuid.uuid4()
+    print(f"{'vector':>7} {'chiều':>6} {'định dạng':>10} {'MiB':>8} {'đọc ms':>9} {'mmap ms':>8} {'sai số max':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for dim in args.dims:
+            for num_vectors in args.vectors:
+                matrix = rng.standard_normal((num_vectors, dim), dtype=np.float32)
+                product_ids = [uuid.uuid4() for _ in range(num_vectors)]
+
+                path = os.path.join(directory, "vectors.json")
+                write_json(path, product_ids, matrix)
+                size = os.path.getsize(path) / 2**20
+                print(f"{num_vectors:>7} {dim:>6} {'json':>10} {size:8.1f} {timed(read_json, path, args.repeat):9.1f} {'-':>8} {0.0:10.4f}")
+                os.remove(path)
+
+                for dtype in (vector_codec.FLOAT32, vector_codec.INT8):
+                    path = os.path.join(directory, f"vectors.{dtype}.bin")
+                    write_snapshot(path, model_id, product_ids, matrix, dtype)
+                    size = os.path.getsize(path) / 2**20
+                    read_ms = timed(read_snapshot, path, args.repeat)
+                    open_ms = timed(vector_snapshot.open_snapshot, path, args.repeat)
+                    error = float(np.abs(vector_snapshot.open_snapshot(path).embeddings() - matrix).max())
+                    print(f"{num_vectors:>7} {dim:>6} {dtype:>10} {size:8.1f} {read_ms:9.1f} {open_ms:8.2f} {error:10.4f}")
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
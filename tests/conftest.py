@@ -0,0 +1,28 @@
+import os
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+# Settings đọc biến môi trường lúc import app; test không cần database hay R2 thật
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("CLOUDFLARE_R2_ACCOUNT_ID", "test")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+
+
+@pytest.fixture(scope="session")
+def synthetic_models(tmp_path_factory):
+    """(crop model 10 box, embedding model batch động) giả lập, sinh một lần cho cả phiên test."""
+    from benchmarks.synthetic_models import ensure_crop_model, ensure_embedding_model
+
+    model_dir = str(tmp_path_factory.mktemp("synthetic_models"))
+    return ensure_crop_model(model_dir, 10), ensure_embedding_model(model_dir)
+
+
+@pytest.fixture
+def session():
+    """Session trên database SQLite trong bộ nhớ, dùng chung một kết nối cho mọi luồng."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
@@ -0,0 +1,100 @@
+import asyncio
+import tracemalloc
+import uuid
+from typing import Callable
+
+import numpy as np
+import pytest
+
+from app.services.ai_service import (
+    InterpreterOptions,
+    ModelManager,
+    crop_and_resize,
+    decode_image,
+    detect_boxes,
+    run_embedding_batch,
+    select_boxes,
+)
+from app.services.pipeline_metrics import PipelineMetrics
+from app.services.prediction_cache import PredictionCache
+from benchmarks.inference_backends import load_image
+
+WIDTH, HEIGHT = 640, 480
+CALLS = 20
+# Đối tượng Python nhỏ (trace, dict, list...) mỗi lần gọi
+SLACK = 128 * 1024
+
+
+@pytest.fixture
+def manager(synthetic_models):
+    crop_path, embedding_path = synthetic_models
+    # Tắt cache kết quả để mỗi lần predict đều chạy lại toàn bộ pipeline
+    manager = ModelManager(
+        pool_size=1,
+        backend="thread",
+        result_cache=PredictionCache(0, 0),
+        crop_options=InterpreterOptions(1),
+        embedding_options=InterpreterOptions(1),
+        autotune=False,
+        metrics=PipelineMetrics(log_traces=False),
+    )
+    asyncio.run(manager.load_model_files(uuid.uuid4(), crop_path, uuid.uuid4(), embedding_path))
+    yield manager
+    manager.shutdown()
+
+
+def traced(call: Callable[[], object], calls: int = CALLS) -> tuple[list[int], list[int]]:
+    """(đỉnh, bộ nhớ còn giữ lại) theo byte của từng lần gọi, tính từ trước lần gọi đó."""
+    call()  # làm nóng: buffer resize và tensor batch được cấp phát ở lần đầu
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            call()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return peaks, retained
+
+
+def test_detect_boxes_writes_input_in_place(manager):
+    frame = decode_image(load_image(None, WIDTH, HEIGHT))
+    with manager._require_active().crop_pool.checkout() as crop_model:
+        peaks, _ = traced(lambda: detect_boxes(crop_model, frame))
+
+    # Chỉ output YOLO (5 x 2100 float32) và box đã giải mã; input float32 tạo mới
+    # (320 x 320 x 3 x 4 byte) hay ảnh resize tạo mới sẽ vượt ngưỡng này
+    assert max(peaks) < 5 * 2100 * 4 + SLACK
+
+
+def test_embedding_batch_writes_crops_in_place(manager):
+    active = manager._require_active()
+    frame = decode_image(load_image(None, WIDTH, HEIGHT))
+    with active.crop_pool.checkout() as crop_model, active.embedding_pool.checkout() as embedding_model:
+        crop_boxes = select_boxes(*detect_boxes(crop_model, frame), WIDTH, HEIGHT)
+        crops = crop_and_resize(frame, crop_boxes, embedding_model.input_shape)
+        peaks, _ = traced(lambda: run_embedding_batch(embedding_model, crops))
+
+    # Chỉ mảng vector kết quả (B x 6912 int8); batch tạo mới hoặc crop chuyển sang
+    # float32 (224 x 224 x 3 x 4 byte mỗi crop) sẽ vượt ngưỡng này
+    assert len(crops) == 10
+    assert max(peaks) < len(crops) * embedding_model.output_size + SLACK
+
+
+def test_predict_allocations_stay_bounded(manager):
+    image = load_image(None, WIDTH, HEIGHT)
+    active = manager._require_active()
+    crop_size = active.embedding_pool.input_shape[1]
+    dims = active.embedding_pool.output_size
+    peaks, retained = traced(lambda: manager.predict(image))
+
+    # Frame đã giải mã, crop RGB uint8, vector kết quả và output YOLO
+    required = WIDTH * HEIGHT * 3 + 10 * (crop_size * crop_size * 3 + dims) + 5 * 2100 * 4
+    assert max(peaks) < required + SLACK
+    # Không giữ lại bộ nhớ giữa các lần gọi
+    assert max(retained) < 64 * 1024
+    assert np.median(retained) < 8 * 1024
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from app.services.ai_service import CONFIDENCE_THRESHOLD, clip_boxes_to_image, decode_yolo_output
+
+
+def legacy_decode(output_data, w_orig, h_orig):
+    """Vòng lặp giải mã theo từng hàng trước khi được vector hóa."""
+    boxes_for_nms, scores_for_nms = [], []
+    for row in output_data:
+        score = float(row[4])
+        if score > CONFIDENCE_THRESHOLD:
+            x_c, y_c, w_box, h_box = row[0:4]
+            x_min = int((x_c - w_box/2) * w_orig)
+            y_min = int((y_c - h_box/2) * h_orig)
+            box_w = int(w_box * w_orig)
+            box_h = int(h_box * h_orig)
+            boxes_for_nms.append([x_min, y_min, box_w, box_h])
+            scores_for_nms.append(score)
+    return boxes_for_nms, scores_for_nms
+
+
+def legacy_clip(box, w_orig, h_orig):
+    """Box [x_min, y_min, w, h] -> [x_min, y_min, x_max, y_max] kẹp trong ảnh, từng box một."""
+    x_min, y_min, box_w, box_h = box
+    x_max, y_max = x_min + box_w, y_min + box_h
+    return [
+        min(max(x_min, 0), w_orig), min(max(y_min, 0), h_orig),
+        min(max(x_max, 0), w_orig), min(max(y_max, 0), h_orig),
+    ]
+
+
+def yolo_rows(rng, anchors):
+    """Output YOLO (A, 5) gồm box âm, tràn biên, diện tích 0 và score đúng bằng ngưỡng."""
+    rows = np.empty((anchors, 5), dtype=np.float32)
+    rows[:, 0:2] = rng.uniform(-0.3, 1.3, (anchors, 2))
+    rows[:, 2:4] = rng.uniform(0.0, 0.8, (anchors, 2))
+    rows[:, 4] = rng.uniform(0.0, 1.0, anchors)
+    quarter = anchors // 4
+    rows[:quarter, 2:4] = 0.0
+    rows[quarter:2 * quarter, 4] = CONFIDENCE_THRESHOLD
+    rows[2 * quarter:2 * quarter + 8, 4] = np.nextafter(np.float32(CONFIDENCE_THRESHOLD), np.float32(1))
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("w_orig, h_orig", [(640, 480), (2, 3), (1920, 1080), (333, 777)])
+def test_decode_matches_legacy_loop(seed, w_orig, h_orig):
+    output_data = yolo_rows(np.random.default_rng(seed), 2100)
+
+    boxes, scores = decode_yolo_output(output_data, w_orig, h_orig)
+    expected_boxes, expected_scores = legacy_decode(output_data, w_orig, h_orig)
+
+    assert boxes.dtype == np.int32 and scores.dtype == np.float32
+    assert boxes.tolist() == expected_boxes
+    assert scores.tolist() == expected_scores
+    assert (boxes < 0).any()  # dữ liệu thật sự có box âm
+
+
+def test_decode_excludes_scores_at_threshold():
+    output_data = np.array([
+        [0.5, 0.5, 0.2, 0.2, CONFIDENCE_THRESHOLD],
+        [0.5, 0.5, 0.2, 0.2, np.nextafter(np.float32(CONFIDENCE_THRESHOLD), np.float32(1))],
+    ], dtype=np.float32)
+
+    boxes, scores = decode_yolo_output(output_data, 100, 100)
+
+    assert boxes.tolist() == legacy_decode(output_data, 100, 100)[0]
+    assert len(boxes) == 1
+
+
+def test_decode_without_detections():
+    output_data = np.zeros((2100, 5), dtype=np.float32)
+
+    boxes, scores = decode_yolo_output(output_data, 640, 480)
+
+    assert boxes.shape == (0, 4) and scores.shape == (0,)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_clip_matches_per_box_clipping(seed):
+    w_orig, h_orig = 640, 480
+    boxes, _ = decode_yolo_output(yolo_rows(np.random.default_rng(seed), 2100), w_orig, h_orig)
+
+    clipped = clip_boxes_to_image(boxes, w_orig, h_orig)
+
+    assert clipped.tolist() == [legacy_clip(box, w_orig, h_orig) for box in boxes.tolist()]
+    assert clipped[:, [0, 2]].min() >= 0 and clipped[:, [0, 2]].max() <= w_orig
+    assert clipped[:, [1, 3]].min() >= 0 and clipped[:, [1, 3]].max() <= h_orig
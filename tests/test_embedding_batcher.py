@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.services.ai_service import EmbeddingBatcher, InterpreterOptions, InterpreterPool, ModelManager
+from app.services.pipeline_metrics import PipelineMetrics
+from app.services.prediction_cache import PredictionCache
+from benchmarks.inference_backends import load_image
+
+TIMEOUT = 30
+
+
+def build_manager() -> ModelManager:
+    # Tắt cache kết quả để mỗi lần predict_async đều đi qua micro-batcher
+    return ModelManager(
+        pool_size=2,
+        backend="thread",
+        result_cache=PredictionCache(0, 0),
+        crop_options=InterpreterOptions(1),
+        embedding_options=InterpreterOptions(1),
+        autotune=False,
+        metrics=PipelineMetrics(log_traces=False),
+    )
+
+
+def crops_for(pool: InterpreterPool, count: int) -> list[np.ndarray]:
+    return [np.full(pool.input_shape[1:], i, dtype=np.uint8) for i in range(count)]
+
+
+def test_predict_async_finishes_on_old_pair_across_swap(synthetic_models, monkeypatch):
+    crop_path, embedding_path = synthetic_models
+    image = load_image(None, 640, 480)
+
+    async def scenario():
+        manager = build_manager()
+        old_id, new_id = uuid.uuid4(), uuid.uuid4()
+        await manager.load_model_files(uuid.uuid4(), crop_path, old_id, embedding_path)
+        old_set = manager._require_active()
+        # Vòng gom batch của cặp cũ đã chạy trước khi đổi model
+        expected, _ = await manager.predict_async(image)
+
+        extracted, release = threading.Event(), threading.Event()
+        extract_crops = ModelManager._extract_crops
+
+        def paused_extract(active, image_data, trace):
+            crops = extract_crops(active, image_data, trace)
+            extracted.set()
+            release.wait(TIMEOUT)
+            return crops
+
+        monkeypatch.setattr(ModelManager, "_extract_crops", staticmethod(paused_extract))
+        request = asyncio.create_task(manager.predict_async(image))
+        assert await asyncio.to_thread(extracted.wait, TIMEOUT)
+
+        # Đổi model khi request đã lấy cặp cũ nhưng chưa tới bước embedding
+        await manager.load_model_files(uuid.uuid4(), crop_path, new_id, embedding_path)
+        assert manager.embedding_model_id == new_id
+        release.set()
+
+        vectors, model_id = await asyncio.wait_for(request, TIMEOUT)
+        assert model_id == old_id
+        np.testing.assert_array_equal(vectors, expected)
+        assert old_set.batcher._task.done()
+
+        _, model_id = await asyncio.wait_for(manager.predict_async(image), TIMEOUT)
+        assert model_id == new_id
+        manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def embedding_pool(synthetic_models):
+    return InterpreterPool(synthetic_models[1], 1, InterpreterOptions(1))
+
+
+def test_close_runs_every_queued_request(embedding_pool):
+    async def scenario():
+        with ThreadPoolExecutor(1) as executor:
+            # Chờ gom batch lâu để close() rơi đúng lúc đang gom
+            batcher = EmbeddingBatcher(embedding_pool, executor, max_batch_size=64, max_wait_ms=5000)
+            queued = [asyncio.create_task(batcher.embed(crops_for(embedding_pool, n))) for n in (1, 2)]
+            await asyncio.sleep(0)
+            batcher.close()
+            after_close = asyncio.create_task(batcher.embed(crops_for(embedding_pool, 3)))
+
+            results = await asyncio.wait_for(asyncio.gather(*queued, after_close), TIMEOUT)
+            assert [len(vectors) for vectors in results] == [1, 2, 3]
+            assert batcher.batches == 1 and batcher.queued_requests == 0
+            await asyncio.wait_for(batcher._task, TIMEOUT)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_collector_fails_pending_requests(embedding_pool):
+    async def scenario():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = EmbeddingBatcher(embedding_pool, executor, max_batch_size=64, max_wait_ms=5000)
+            requests = [asyncio.create_task(batcher.embed(crops_for(embedding_pool, 1))) for _ in range(3)]
+            await asyncio.sleep(0.05)  # vòng gom đã lấy request khỏi hàng đợi và đang chờ thêm
+            batcher._task.cancel()
+
+            results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), TIMEOUT)
+            assert all(isinstance(result, HTTPException) and result.status_code == 503 for result in results)
+
+    asyncio.run(scenario())
@@ -0,0 +1,115 @@
+import asyncio
+from collections import Counter
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from sqlmodel import func, select
+
+from app import crud
+from app.models import (
+    AIModel, AIModelType, Product, ProductImage, ProductVector, ProductVectorTombstone, ReembeddingJobStatus,
+)
+from app.services import reembedding
+from app.services.reembedding import ReembeddingRunner
+
+DIM = 16
+IMAGES = 10
+BATCH_SIZE = 4
+
+
+class FakeModelManager:
+    """Thay ModelManager: mỗi ảnh cho một vector, đếm số lần mỗi ảnh được chạy."""
+    def __init__(self, model_id):
+        self.embedding_model_id = model_id
+        self.calls: Counter = Counter()
+        self.crash_on: bytes | None = None
+        self.failing: set[bytes] = set()
+
+    async def predict_async(self, image_data: bytes):
+        self.calls[image_data] += 1
+        if image_data == self.crash_on:
+            raise RuntimeError("tiến trình bị dừng giữa lô")
+        if image_data in self.failing:
+            raise HTTPException(status_code=500, detail="lỗi xử lý ảnh")
+        return np.ones((1, DIM), dtype=np.float32), self.embedding_model_id
+
+
+@pytest.fixture
+def catalog(session, monkeypatch):
+    old_model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="v1.tflite")
+    new_model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="2", file_path="v2.tflite")
+    product = Product(name="product", barcode="1", price=Decimal("1"), weight_grams=1)
+    images = [ProductImage(product_id=product.id, image_url=f"image-{i}") for i in range(IMAGES)]
+    session.add_all([old_model, new_model, product, *images])
+    session.commit()
+    session.add_all(
+        ProductVector.from_embedding(np.ones(DIM), product_id=product.id, model_id=old_model.id, image_id=image.id)
+        for image in images
+    )
+    # Vector không gắn ảnh không tạo lại được, luôn bị xóa khi job xong
+    session.add(ProductVector.from_embedding(np.ones(DIM), product_id=product.id, model_id=old_model.id))
+    session.commit()
+
+    monkeypatch.setattr(reembedding.r2_service, "download_file", lambda url: url.encode())
+    monkeypatch.setattr(reembedding, "engine", session.get_bind())
+    ordered = sorted(images, key=lambda image: image.id)
+    return old_model.id, new_model.id, [image.id for image in ordered], [image.image_url.encode() for image in ordered]
+
+
+def vectors_per_image(session, model_id) -> Counter:
+    return Counter(session.exec(select(ProductVector.image_id).where(ProductVector.model_id == model_id)).all())
+
+
+def count(session, model) -> int:
+    return session.exec(select(func.count()).select_from(model)).one()
+
+
+def test_interrupted_job_resumes_from_checkpoint(session, catalog):
+    old_id, new_id, image_ids, image_data = catalog
+    manager = FakeModelManager(new_id)
+    runner = ReembeddingRunner(manager, batch_size=BATCH_SIZE, concurrency=2, pause_seconds=0, model_wait_seconds=0)
+    job = crud.create_reembedding_job(session, new_id)
+
+    # Dừng giữa lô thứ hai: lô đầu đã được ghi cùng checkpoint
+    manager.crash_on = image_data[BATCH_SIZE + 1]
+    with pytest.raises(RuntimeError):
+        asyncio.run(runner._run_job(session, job))
+    session.rollback()
+    job = crud.get_reembedding_job_by_id(session, job.id)
+    assert job.status == ReembeddingJobStatus.RUNNING
+    assert job.last_image_id == image_ids[BATCH_SIZE - 1]
+    assert job.processed_images == BATCH_SIZE
+
+    manager.crash_on = None
+    asyncio.run(runner.run_pending())
+    session.expire_all()  # runner ghi qua session riêng
+
+    job = crud.get_reembedding_job_by_id(session, job.id)
+    assert job.status == ReembeddingJobStatus.COMPLETED
+    assert job.processed_images == IMAGES and job.failed_images == 0
+    # Lô đã ghi không chạy lại; mọi ảnh có đúng một vector của model mới
+    assert all(manager.calls[data] == 1 for data in image_data[:BATCH_SIZE])
+    assert vectors_per_image(session, new_id) == Counter({image_id: 1 for image_id in image_ids})
+    assert vectors_per_image(session, old_id) == Counter()
+    assert job.retired_vectors == IMAGES + 1
+    assert count(session, ProductVectorTombstone) == IMAGES + 1
+
+
+def test_failed_images_keep_their_old_vectors(session, catalog):
+    old_id, new_id, image_ids, image_data = catalog
+    manager = FakeModelManager(new_id)
+    manager.failing = {image_data[2]}
+    runner = ReembeddingRunner(manager, batch_size=BATCH_SIZE, concurrency=2, pause_seconds=0, model_wait_seconds=0)
+    job = crud.create_reembedding_job(session, new_id)
+
+    asyncio.run(runner.run_pending())
+    session.expire_all()  # runner ghi qua session riêng
+
+    job = crud.get_reembedding_job_by_id(session, job.id)
+    assert job.status == ReembeddingJobStatus.COMPLETED and job.failed_images == 1
+    assert vectors_per_image(session, old_id) == Counter({image_ids[2]: 1})
+    assert image_ids[2] not in vectors_per_image(session, new_id)
+    tombstoned = set(session.exec(select(ProductVectorTombstone.model_id)).all())
+    assert tombstoned == {old_id} and count(session, ProductVectorTombstone) == job.retired_vectors == IMAGES
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlmodel import func, select
+
+from app.core.config import settings
+from app.models import AIModel, AIModelType, Product, ProductVector, VectorCodebook
+from app.services import vector_codebooks, vector_projections
+
+DIM = 20
+
+
+@pytest.fixture
+def model_id(session):
+    model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="embedding.tflite")
+    product = Product(name="product", barcode="1", price=Decimal("1"), weight_grams=1)
+    session.add_all([model, product])
+    session.commit()
+    rng = np.random.default_rng(0)
+    session.add_all(
+        ProductVector.from_embedding(embedding, product_id=product.id, model_id=model.id)
+        for embedding in rng.standard_normal((300, DIM))
+    )
+    session.commit()
+    return model.id
+
+
+def codebook_count(session) -> int:
+    return session.exec(select(func.count()).select_from(VectorCodebook)).one()
+
+
+def test_export_codebook_never_trains(session, model_id):
+    assert vector_codebooks.get_export_codebook(session, model_id, None) is None
+    assert codebook_count(session) == 0
+
+
+def test_export_codebook_uses_latest_trained_version(session, model_id):
+    vector_codebooks.train_vector_codebook(session, model_id, 4, 300)
+    trained = vector_codebooks.train_vector_codebook(session, model_id, 8, 300)
+
+    quantizer = vector_codebooks.get_export_codebook(session, model_id, None)
+
+    assert quantizer.codebook_id == trained.id
+    assert (quantizer.dim, quantizer.subvectors, quantizer.subvector_dim) == (DIM, 3, 8)
+    assert codebook_count(session) == 2
+
+
+def test_stored_codebook_round_trip(session, model_id):
+    trained = vector_codebooks.train_vector_codebook(session, model_id, 8, 300)
+    vectors = np.random.default_rng(1).standard_normal((50, DIM)).astype(np.float32)
+
+    first = vector_codebooks.load_codebook(session, trained.id)
+    reloaded = vector_codebooks.to_quantizer(session.get(VectorCodebook, trained.id))
+
+    np.testing.assert_array_equal(first.codebooks, reloaded.codebooks)
+    np.testing.assert_array_equal(first.encode(vectors), reloaded.encode(vectors))
+    assert vector_codebooks.load_codebook(session, trained.id) is first
+
+
+def test_training_is_deterministic(session, model_id):
+    # Mẫu gồm mọi vector của model: cùng dữ liệu cho cùng codebook
+    first = vector_codebooks.train_vector_codebook(session, model_id, 8, 1000)
+    second = vector_codebooks.train_vector_codebook(session, model_id, 8, 1000)
+
+    assert first.id != second.id
+    assert first.codebook_data == second.codebook_data
+
+
+def test_codebook_follows_the_export_projection(session, model_id, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 6)
+    unprojected = vector_codebooks.train_vector_codebook(session, model_id, 4, 300)
+    projection = vector_projections.to_projection(vector_projections.fit_vector_projection(session, model_id, 6, 300))
+
+    # PCA vừa fit lại: codebook cũ mã hóa vector nguyên chiều nên không dùng được
+    assert vector_codebooks.get_export_codebook(session, model_id, projection) is None
+
+    trained = vector_codebooks.train_vector_codebook(session, model_id, 4, 300)
+
+    assert trained.projection_id == projection.projection_id and trained.dim == 6
+    assert vector_codebooks.get_export_codebook(session, model_id, projection).codebook_id == trained.id
+    assert vector_codebooks.get_export_codebook(session, model_id, None).codebook_id == unprojected.id
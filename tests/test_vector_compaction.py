@@ -0,0 +1,184 @@
+import asyncio
+from decimal import Decimal
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from sqlmodel import select
+
+from app import crud
+from app.models import (
+    AIModel, AIModelType, Product, ProductVector, ProductVectorTombstone, VectorCompactionJob, VectorCompactionJobStatus,
+)
+from app.services import vector_compaction
+from app.services.ann_index import normalize_rows
+from app.services.vector_compaction import VectorCompactionRunner, compact_groups, select_representatives
+
+DIM = 32
+
+
+def near_copies(vector: np.ndarray, count: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    return normalize_rows(vector + noise * rng.standard_normal((count, len(vector))).astype(np.float32))
+
+
+def test_near_duplicates_are_dropped():
+    rng = np.random.default_rng(0)
+    a, b = normalize_rows(rng.standard_normal((2, DIM)).astype(np.float32))
+    vectors = np.concatenate([near_copies(a, 3, 0.01, rng), [b], near_copies(b, 2, 0.01, rng)])
+
+    keep, unique = select_representatives(vectors, 10, 0.98)
+
+    # Giữ vector đầu tiên (ưu tiên, ví dụ mới nhất) của mỗi nhóm trùng
+    assert keep.tolist() == [0, 3]
+    assert unique == 2
+
+
+def test_cap_keeps_medoids_of_the_input():
+    rng = np.random.default_rng(1)
+    centers = normalize_rows(rng.standard_normal((4, DIM)).astype(np.float32))
+    vectors = np.concatenate([near_copies(center, 6, 0.05, rng) for center in centers])
+
+    keep, unique = select_representatives(vectors, 4, 0.999)
+
+    assert unique == len(vectors)
+    assert 1 <= len(keep) <= 4
+    # Medoid là vector thật của sản phẩm (chỉ số trong đầu vào), không phải tâm cụm
+    assert np.all(np.diff(keep) > 0) and keep.min() >= 0 and keep.max() < len(vectors)
+
+
+def test_single_cluster_keeps_the_member_closest_to_its_mean():
+    rng = np.random.default_rng(5)
+    vectors = near_copies(rng.standard_normal(DIM).astype(np.float32), 10, 0.2, rng)
+    mean = normalize_rows(vectors.mean(axis=0, keepdims=True))[0]
+
+    keep, unique = select_representatives(vectors, 1, 0.999)
+
+    assert unique == 10
+    assert keep.tolist() == [int(np.argmax(vectors @ mean))]
+
+
+@pytest.mark.parametrize("count", [1, 5, 40])
+def test_cap_is_enforced(count):
+    vectors = normalize_rows(np.random.default_rng(count).standard_normal((count, DIM)).astype(np.float32))
+
+    keep, _ = select_representatives(vectors, 3, 0.98)
+
+    assert 1 <= len(keep) <= min(3, count)
+    assert len(set(keep.tolist())) == len(keep)
+
+
+def groups_of(rng: np.random.Generator, products: int, per_product: int, noise: float):
+    groups = []
+    for _ in range(products):
+        center = rng.standard_normal(DIM).astype(np.float32)
+        groups.append(([uuid4() for _ in range(per_product)], near_copies(center, per_product, noise, rng)))
+    return groups
+
+
+def test_recall_is_one_when_nothing_is_removed():
+    rng = np.random.default_rng(2)
+    groups = groups_of(rng, 10, 3, 1.0)
+    query_ids = [vector_ids[0] for vector_ids, _ in groups]
+    queries = np.stack([vectors[0] for _, vectors in groups])
+
+    removed, report = compact_groups(groups, query_ids, queries, 10, 1.0)
+
+    assert removed == []
+    assert report["vectors_before"] == report["vectors_after"] == 30
+    assert report["shrinkage"] == 0.0 and report["compacted_products"] == 0
+    assert report["recall_at_1"] == 1.0 and report["recall_at_5"] == 1.0
+    assert report["queries"] == 10
+
+
+def test_report_accounts_for_every_removed_vector():
+    rng = np.random.default_rng(3)
+    groups = groups_of(rng, 8, 12, 0.05) + groups_of(rng, 4, 12, 2.0)
+    all_ids = {vector_id for vector_ids, _ in groups for vector_id in vector_ids}
+
+    removed, report = compact_groups(groups, [], np.zeros((0, DIM), dtype=np.float32), 4, 0.98)
+
+    assert set(removed) <= all_ids and len(set(removed)) == len(removed)
+    assert report["removed_duplicates"] + report["removed_by_cap"] == len(removed)
+    assert report["vectors_before"] == 144 and report["vectors_after"] == 144 - len(removed)
+    assert report["vectors_after"] <= 12 * 4 and report["removed_duplicates"] > 0
+    assert report["index_bytes_after"] == report["vectors_after"] * DIM * 4
+    assert report["recall_at_1"] == 1.0  # Không có truy vấn
+
+
+@pytest.fixture
+def catalog(session, monkeypatch):
+    """Model embedding với hai sản phẩm: một có nhiều ảnh gần trùng, một có vector khác nhau."""
+    monkeypatch.setattr(vector_compaction, "engine", session.get_bind())
+    model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="embedding.tflite")
+    products = [Product(name=f"product {i}", barcode=str(i), price=Decimal("1"), weight_grams=1) for i in range(2)]
+    session.add_all([model, *products])
+    session.commit()
+    rng = np.random.default_rng(4)
+    center = rng.standard_normal(DIM).astype(np.float32)
+    embeddings = [near_copies(center, 6, 0.01, rng), normalize_rows(rng.standard_normal((3, DIM)).astype(np.float32))]
+    session.add_all(
+        ProductVector.from_embedding(embedding, product_id=product.id, model_id=model.id)
+        for product, vectors in zip(products, embeddings)
+        for embedding in vectors
+    )
+    session.commit()
+    return model.id
+
+
+def vector_ids(session) -> set:
+    return set(session.exec(select(ProductVector.id)).all())
+
+
+def test_compaction_deletes_with_tombstones(session, catalog):
+    before = vector_ids(session)
+
+    report = vector_compaction.compact_product_vectors(session, catalog, 8, 0.98, num_queries=5)
+
+    after = vector_ids(session)
+    tombstones = session.exec(select(ProductVectorTombstone)).all()
+    assert report["vectors_before"] == 9 and report["vectors_after"] == len(after) == 4
+    assert report["removed_duplicates"] == 5
+    assert {tombstone.vector_id for tombstone in tombstones} == before - after
+    assert all(tombstone.model_id == catalog for tombstone in tombstones)
+
+
+def test_dry_run_deletes_nothing(session, catalog):
+    before = vector_ids(session)
+
+    report = vector_compaction.compact_product_vectors(session, catalog, 8, 0.98, num_queries=5, dry_run=True)
+
+    assert report["vectors_after"] == 4
+    assert vector_ids(session) == before
+    assert session.exec(select(ProductVectorTombstone)).all() == []
+
+
+def queue_job(session, model_id, **fields) -> VectorCompactionJob:
+    params = dict(model_id=model_id, max_per_product=8, duplicate_threshold=0.98, queries=5, dry_run=False)
+    return crud.create_vector_compaction_job(session, VectorCompactionJob(**{**params, **fields}))
+
+
+def test_runner_completes_jobs_in_the_background(session, catalog):
+    dry = queue_job(session, catalog, dry_run=True)
+    job = queue_job(session, catalog)
+
+    asyncio.run(VectorCompactionRunner().run_pending())
+    session.expire_all()  # runner ghi qua session riêng
+
+    assert dry.status == job.status == VectorCompactionJobStatus.COMPLETED
+    assert dry.report["vectors_after"] == job.report["vectors_after"] == 4
+    assert job.completed_at is not None
+    assert len(vector_ids(session)) == 4
+
+
+def test_runner_records_failures(session, catalog, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(vector_compaction, "compact_product_vectors", fail)
+    job = queue_job(session, catalog)
+
+    asyncio.run(VectorCompactionRunner().run_pending())
+    session.expire_all()
+
+    assert job.status == VectorCompactionJobStatus.FAILED and job.error == "boom"
+    assert crud.get_next_vector_compaction_job(session) is None
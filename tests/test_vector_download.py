@@ -0,0 +1,105 @@
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.api import vectors
+from app.core.config import settings
+from app.models import AIModel, AIModelType, Product, ProductVector
+from app.services import vector_codebooks, vector_projections
+from app.services.vector_snapshots import SnapshotArtifact
+
+DIM = 16
+BINARY = "application/octet-stream"
+
+
+@pytest.fixture
+def model_id(session, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 4)
+    model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="embedding.tflite")
+    product = Product(name="product", barcode="1", price=Decimal("1"), weight_grams=1)
+    session.add_all([model, product])
+    session.commit()
+    rng = np.random.default_rng(0)
+    session.add_all(
+        ProductVector.from_embedding(embedding, product_id=product.id, model_id=model.id)
+        for embedding in rng.standard_normal((40, DIM))
+    )
+    session.commit()
+    return model.id
+
+
+@pytest.fixture
+def artifacts(monkeypatch, tmp_path):
+    """File dựng sẵn mà `snapshot_store.get` trả về, theo biến thể."""
+    published = {}
+    monkeypatch.setattr(vectors.snapshot_store, "get", lambda model_id, variant: published.get(variant))
+
+    def publish(model_id, variant, projection_id, codebook_id=None):
+        path = tmp_path / f"{variant}.bin"
+        path.write_bytes(b"prebuilt")
+        published[variant] = SnapshotArtifact(
+            model_id, variant, "0" * 64, 8, datetime.now(timezone.utc), [], path=str(path),
+            projection_id=str(projection_id) if projection_id else None,
+            codebook_id=str(codebook_id) if codebook_id else None,
+        )
+        return published[variant]
+
+    return publish
+
+
+def download(session, model_id, accept="application/json", dtype=None):
+    return vectors.download_all_vectors(db=session, accept=accept, if_none_match=None, dtype=dtype, model_id=model_id)
+
+
+def test_prebuilt_file_with_current_projection_is_served(session, model_id, artifacts):
+    projection = vector_projections.fit_vector_projection(session, model_id, 4, 40)
+    artifact = artifacts(model_id, "json", projection.id)
+
+    response = download(session, model_id)
+
+    assert isinstance(response, FileResponse)
+    assert response.headers["ETag"] == artifact.etag
+    assert response.headers["X-Projection-Id"] == str(projection.id)
+
+
+def test_refitted_projection_streams_until_rebuilt(session, model_id, artifacts):
+    old = vector_projections.fit_vector_projection(session, model_id, 4, 40)
+    artifacts(model_id, "json", old.id)
+    refitted = vector_projections.fit_vector_projection(session, model_id, 4, 40)
+
+    response = download(session, model_id)
+
+    assert isinstance(response, StreamingResponse)
+    assert response.headers["X-Projection-Id"] == str(refitted.id)
+    assert "ETag" not in response.headers
+
+
+def test_projection_enabled_after_build_streams(session, model_id, artifacts):
+    artifacts(model_id, "json", None)
+    projection = vector_projections.fit_vector_projection(session, model_id, 4, 40)
+
+    response = download(session, model_id)
+
+    assert isinstance(response, StreamingResponse)
+    assert response.headers["X-Projection-Id"] == str(projection.id)
+
+
+def test_pq_requires_a_codebook_for_the_current_projection(session, model_id, artifacts):
+    projection = vector_projections.fit_vector_projection(session, model_id, 4, 40)
+    old = vector_codebooks.train_vector_codebook(session, model_id, 2, 40)
+    artifacts(model_id, "pq", projection.id, old.id)
+
+    assert isinstance(download(session, model_id, BINARY, "pq"), FileResponse)
+
+    vector_codebooks.train_vector_codebook(session, model_id, 2, 40)
+    assert isinstance(download(session, model_id, BINARY, "pq"), StreamingResponse)
+
+    vector_projections.fit_vector_projection(session, model_id, 4, 40)
+    with pytest.raises(HTTPException) as error:
+        download(session, model_id, BINARY, "pq")
+    assert error.value.status_code == 404
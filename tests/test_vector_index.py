@@ -0,0 +1,154 @@
+import uuid
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from app import crud
+from app.models import AIModel, AIModelType, Product, ProductImage, ProductVector
+from app.services.ann_index import IVFIndex, normalize_rows, top_labels, train_centroids
+from app.services.vector_index import VectorBatch, VectorIndex
+
+DIM = 32
+PRODUCTS = 200
+VECTORS_PER_PRODUCT = 20
+NLIST = 16
+
+
+def clustered(products: int, per_product: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Vector quanh tâm của từng sản phẩm, kèm nhãn sản phẩm."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((products, DIM)).astype(np.float32)
+    labels = np.repeat(np.arange(products, dtype=np.int32), per_product)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((len(labels), DIM)).astype(np.float32)
+    return normalize_rows(vectors), labels
+
+
+def brute_force(vectors: np.ndarray, labels: np.ndarray, queries: np.ndarray, top_k: int) -> list[np.ndarray]:
+    return [top_labels(scores, labels, top_k)[0] for scores in queries @ vectors.T]
+
+
+def recall(expected: list[np.ndarray], found: list[tuple[np.ndarray, np.ndarray]]) -> float:
+    return float(np.mean([
+        len(set(e.tolist()) & set(f.tolist())) / len(e) for e, (f, _) in zip(expected, found)
+    ]))
+
+
+def assert_consistent(index: IVFIndex):
+    """Mỗi khóa trỏ đúng hàng của nó và mọi hàng trong danh sách đều có khóa."""
+    assert index.size == len(index._location) == sum(inverted_list.size for inverted_list in index.lists)
+    for key, (list_no, row) in index._location.items():
+        assert index.lists[list_no].keys[row] == key
+    for inverted_list in index.lists:
+        assert len(inverted_list.keys) == inverted_list.size
+
+
+def test_ivf_recall_against_brute_force_and_npz_round_trip(tmp_path):
+    vectors, labels = clustered(PRODUCTS, VECTORS_PER_PRODUCT)
+    keys = [uuid.uuid4() for _ in range(len(vectors))]
+    index = IVFIndex(DIM, train_centroids(vectors, NLIST), len(vectors))
+    index.add(keys, labels, vectors)
+    queries = normalize_rows(vectors[::40] + 0.1)
+    expected = brute_force(vectors, labels, queries, 5)
+
+    # Sản phẩm gần nhất gần như luôn nằm trong vài cụm gần nhất; top-5 cần quét rộng hơn
+    assert recall([e[:1] for e in expected], index.search(queries, 1, nprobe=4)) >= 0.95
+    found = index.search(queries, 5, nprobe=NLIST // 2)
+    assert recall(expected, found) >= 0.9
+    assert recall(expected, index.search(queries, 5, nprobe=NLIST)) == 1.0
+
+    path = str(tmp_path / "index.npz")
+    index.save(path, {"extra": np.arange(3)})
+    loaded, data = IVFIndex.load(path)
+    with data:
+        np.testing.assert_array_equal(data["extra"], np.arange(3))
+    assert loaded.nlist == NLIST and loaded.trained_size == len(vectors)
+    assert set(loaded.keys()) == set(keys)
+    assert_consistent(loaded)
+    for (labels_a, scores_a), (labels_b, scores_b) in zip(found, loaded.search(queries, 5, nprobe=NLIST // 2)):
+        np.testing.assert_array_equal(labels_a, labels_b)
+        np.testing.assert_array_equal(scores_a, scores_b)
+
+
+def test_ivf_remove_and_add_after_retrain_keep_mapping():
+    vectors, labels = clustered(PRODUCTS, VECTORS_PER_PRODUCT, seed=1)
+    keys = [uuid.uuid4() for _ in range(len(vectors))]
+    half = len(vectors) // 2
+    index = IVFIndex(DIM)
+    index.add(keys[:half], labels[:half], vectors[:half])
+
+    index = index.retrained(train_centroids(vectors[:half], NLIST))
+    assert_consistent(index)
+    rng = np.random.default_rng(2)
+    removed = set(rng.choice(half, half // 3, replace=False).tolist())
+    assert len(index.remove([keys[i] for i in removed] + [uuid.uuid4()])) == len(removed)
+    index.add(keys[half:], labels[half:], vectors[half:])
+    assert_consistent(index)
+
+    kept = np.array([i for i in range(len(vectors)) if i not in removed])
+    assert set(index.keys()) == {keys[i] for i in kept}
+    queries = vectors[::37]
+    # Quét mọi cụm là tìm chính xác trên đúng tập vector còn lại
+    expected = brute_force(vectors[kept], labels[kept], queries, 5)
+    assert recall(expected, index.search(queries, 5, nprobe=NLIST)) == 1.0
+
+
+@pytest.fixture
+def catalog(session):
+    """Model embedding với PRODUCTS sản phẩm, mỗi sản phẩm một ảnh và VECTORS_PER_PRODUCT vector."""
+    model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="embedding.tflite")
+    products = [Product(name=f"p{i}", barcode=str(i), price=Decimal("1"), weight_grams=1) for i in range(PRODUCTS)]
+    images = [ProductImage(product_id=product.id, image_url=f"p{i}.jpg") for i, product in enumerate(products)]
+    session.add_all([model, *products, *images])
+    vectors, labels = clustered(PRODUCTS, VECTORS_PER_PRODUCT, seed=3)
+    session.add_all(
+        ProductVector.from_embedding(vector, product_id=products[label].id, model_id=model.id, image_id=images[label].id)
+        for vector, label in zip(vectors, labels)
+    )
+    session.commit()
+    return model.id, products, images
+
+
+def test_vector_index_updates_after_retrain_and_reload(session, catalog, tmp_path):
+    model_id, products, images = catalog
+    engine = session.get_bind()
+    index = VectorIndex(lambda: Session(engine), nlist=4, nprobe=4, storage_dir=str(tmp_path))
+    index.ensure_model(model_id)
+    assert index._ivf.centroids is not None and index.size == PRODUCTS * VECTORS_PER_PRODUCT
+
+    new_vectors, new_labels = clustered(10, 5, seed=4)
+    batch = VectorBatch(
+        model_id,
+        [uuid.uuid4() for _ in new_labels],
+        [products[label].id for label in new_labels],
+        [images[label].id for label in new_labels],
+        new_vectors,
+    )
+    index.add(batch)
+    index.retrain()
+    index.remove_images([images[1].id])
+    assert images[1].id not in index._vectors_of_image
+    index.remove_vectors(batch.vector_ids[:5])
+    index.add(VectorBatch(model_id, batch.vector_ids[:5], batch.product_ids[:5], batch.image_ids[:5], new_vectors[:5]))
+    assert_consistent(index._ivf)
+    # Ảnh 1 mang theo cả 5 vector mới của sản phẩm 1
+    assert index.size == (PRODUCTS - 1) * VECTORS_PER_PRODUCT + len(new_labels) - 5
+    assert set(index._image_of) == set(index._ivf.keys())
+    assert all(key in index._vectors_of_image[index._image_of[key]] for key in index._ivf.keys())
+
+    # Vector được ánh xạ về đúng product id
+    for row in (2, 12):  # vector mới được thêm lại và vector mới chỉ qua lần huấn luyện lại
+        top = index.search(model_id, new_vectors[row], 3, nprobe=4)[0]
+        assert top[0]["product_id"] == products[new_labels[row]].id
+        assert top[0]["score"] == pytest.approx(1.0)
+
+    index.save()
+    reloaded = VectorIndex(lambda: Session(engine), nlist=4, nprobe=4, storage_dir=str(tmp_path))
+    reloaded.ensure_model(model_id)
+    assert_consistent(reloaded._ivf)
+    # Đồng bộ lại với database: vector chỉ có trong bộ nhớ bị bỏ, vector chỉ bị bỏ khỏi index được thêm lại
+    db_ids = set(crud.get_product_vector_ids(session, model_id))
+    assert set(reloaded._ivf.keys()) == db_ids
+    saved = set(index._ivf.keys()) & db_ids
+    assert {key: reloaded._image_of[key] for key in saved} == {key: index._image_of[key] for key in saved}
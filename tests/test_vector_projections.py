@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlmodel import func, select
+
+from app.core.config import settings
+from app.models import AIModel, AIModelType, Product, ProductVector, VectorProjection
+from app.services import vector_projections
+
+DIM = 32
+
+
+@pytest.fixture
+def model_id(session):
+    model = AIModel(model_type=AIModelType.EMBEDDING, name="embedding", version="1", file_path="embedding.tflite")
+    product = Product(name="product", barcode="1", price=Decimal("1"), weight_grams=1)
+    session.add_all([model, product])
+    session.commit()
+    rng = np.random.default_rng(0)
+    session.add_all(
+        ProductVector.from_embedding(embedding, product_id=product.id, model_id=model.id)
+        for embedding in rng.standard_normal((50, DIM))
+    )
+    session.commit()
+    return model.id
+
+
+def projection_count(session) -> int:
+    return session.exec(select(func.count()).select_from(VectorProjection)).one()
+
+
+def test_export_projection_never_fits(session, model_id, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 8)
+
+    assert vector_projections.get_export_projection(session, model_id) is None
+    assert projection_count(session) == 0
+
+
+def test_export_projection_uses_latest_fitted_version(session, model_id, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 8)
+    vector_projections.fit_vector_projection(session, model_id, 4, 50)
+    fitted = vector_projections.fit_vector_projection(session, model_id, 8, 50)
+
+    projection = vector_projections.get_export_projection(session, model_id)
+
+    assert projection.projection_id == fitted.id and projection.dims == 8
+    assert projection_count(session) == 2
+
+
+def test_export_projection_disabled(session, model_id, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 0)
+    vector_projections.fit_vector_projection(session, model_id, 8, 50)
+
+    assert vector_projections.get_export_projection(session, model_id) is None
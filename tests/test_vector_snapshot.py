@@ -0,0 +1,140 @@
+import struct
+import uuid
+
+import numpy as np
+import pytest
+
+from app.core import vector_codec, vector_snapshot
+from app.services.ann_index import normalize_rows
+from app.services.vector_compression import ProductQuantizer
+
+COUNT = 300
+DIM = 20
+
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    vector_ids = [uuid.uuid4() for _ in range(COUNT)]
+    product_ids = [uuid.uuid4() for _ in range(COUNT)]
+    return vector_ids, product_ids, rng.standard_normal((COUNT, DIM)).astype(np.float32)
+
+
+def uuid_bytes(ids) -> np.ndarray:
+    return np.frombuffer(b"".join(value.bytes for value in ids), dtype=np.uint8).reshape(-1, 16)
+
+
+def write(dtype, vector_ids, product_ids, matrix, scales=None, codebook=None, projection_id=None, chunk=128) -> bytes:
+    """Ghi snapshot theo từng khối `chunk` hàng, như khi đọc từ database theo lô."""
+    def chunks(array):
+        return (array[start:start + chunk] for start in range(0, len(array), chunk))
+
+    model_id = uuid.UUID(int=7)
+    return b"".join(vector_snapshot.iter_snapshot_chunks(
+        model_id, dtype, DIM, len(vector_ids), chunks(uuid_bytes(vector_ids)), chunks(uuid_bytes(product_ids)),
+        chunks(matrix), None if scales is None else chunks(scales), codebook, projection_id,
+    ))
+
+
+def test_float32_round_trip(rows):
+    vector_ids, product_ids, matrix = rows
+
+    data = write(vector_codec.FLOAT32, vector_ids, product_ids, matrix)
+    snapshot = vector_snapshot.read_snapshot(data)
+
+    assert len(data) == vector_snapshot.SnapshotLayout.for_shape(vector_codec.FLOAT32, DIM, COUNT).size
+    assert snapshot.dtype == vector_codec.FLOAT32
+    assert snapshot.model_id == uuid.UUID(int=7)
+    assert snapshot.vector_uuids() == vector_ids
+    assert snapshot.product_uuids() == product_ids
+    assert snapshot.projection_id is None
+    np.testing.assert_array_equal(snapshot.embeddings(), matrix)
+    # Ma trận bắt đầu ở offset căn 64 byte, đọc thẳng từ buffer không sao chép
+    assert vector_snapshot.SnapshotLayout.for_shape(vector_codec.FLOAT32, DIM, COUNT).matrix_offset % 64 == 0
+    assert not snapshot.matrix.flags.owndata
+
+
+def test_int8_round_trip(rows):
+    vector_ids, product_ids, matrix = rows
+    quantized, scales = vector_snapshot.quantize_matrix(matrix, vector_codec.INT8)
+
+    snapshot = vector_snapshot.read_snapshot(write(vector_codec.INT8, vector_ids, product_ids, quantized, scales))
+
+    assert snapshot.dtype == vector_codec.INT8
+    assert snapshot.vector_uuids() == vector_ids
+    np.testing.assert_array_equal(snapshot.matrix, quantized)
+    np.testing.assert_array_equal(snapshot.scales, scales)
+    # Sai số lượng tử hóa không quá nửa bước của từng hàng
+    error = np.abs(snapshot.embeddings() - matrix)
+    assert np.all(error <= scales[:, None] / 2 + 1e-6)
+
+
+def test_pq_round_trip(rows):
+    vector_ids, product_ids, matrix = rows
+    # DIM không chia hết cho subvector_dim: hàng được đệm 0 rồi cắt lại khi dựng
+    quantizer = ProductQuantizer.train(matrix, subvector_dim=8)
+    codes = quantizer.encode(matrix)
+
+    snapshot = vector_snapshot.read_snapshot(
+        write(vector_snapshot.PQ, vector_ids, product_ids, codes, codebook=quantizer.codebooks)
+    )
+
+    assert snapshot.dtype == vector_snapshot.PQ
+    assert snapshot.product_uuids() == product_ids
+    assert snapshot.matrix.shape == (COUNT, 3)
+    np.testing.assert_array_equal(snapshot.matrix, codes)
+    np.testing.assert_array_equal(snapshot.codebook, quantizer.codebooks)
+    np.testing.assert_allclose(snapshot.embeddings(), quantizer.decode(codes))
+    assert snapshot.embeddings().shape == (COUNT, DIM)
+    # Bản dựng lại gần với vector gốc đã chuẩn hóa
+    cosine = np.sum(normalize_rows(snapshot.embeddings()) * normalize_rows(matrix), axis=1)
+    assert cosine.mean() > 0.8
+
+
+@pytest.mark.parametrize("dtype", [vector_codec.FLOAT32, vector_codec.INT8, vector_snapshot.PQ])
+def test_projection_id_in_header(rows, dtype):
+    vector_ids, product_ids, matrix = rows
+    projection_id = uuid.uuid4()
+    scales = codebook = None
+    if dtype == vector_codec.INT8:
+        matrix, scales = vector_snapshot.quantize_matrix(matrix, dtype)
+    elif dtype == vector_snapshot.PQ:
+        quantizer = ProductQuantizer.train(matrix, subvector_dim=4, iterations=2)
+        matrix, codebook = quantizer.encode(matrix), quantizer.codebooks
+
+    data = write(dtype, vector_ids, product_ids, matrix, scales, codebook, projection_id)
+
+    assert data[48:64] == projection_id.bytes
+    assert vector_snapshot.read_snapshot(data).projection_id == projection_id
+    magic, version = struct.unpack_from("<8sH", data)
+    assert (magic, version) == (vector_snapshot.MAGIC, vector_snapshot.VERSION)
+
+
+def test_open_snapshot_memory_maps_file(rows, tmp_path):
+    vector_ids, product_ids, matrix = rows
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(write(vector_codec.FLOAT32, vector_ids, product_ids, matrix))
+
+    snapshot = vector_snapshot.open_snapshot(str(path))
+
+    assert snapshot.vector_uuids() == vector_ids
+    np.testing.assert_array_equal(snapshot.embeddings(), matrix)
+
+
+def test_writer_rejects_short_sections(rows):
+    vector_ids, product_ids, matrix = rows
+
+    with pytest.raises(RuntimeError):
+        write(vector_codec.FLOAT32, vector_ids, product_ids, matrix[:-1])
+    with pytest.raises(RuntimeError):
+        write(vector_codec.FLOAT32, vector_ids, product_ids[:-1], matrix)
+
+
+def test_reader_rejects_truncated_or_foreign_data(rows):
+    vector_ids, product_ids, matrix = rows
+    data = write(vector_codec.FLOAT32, vector_ids, product_ids, matrix)
+
+    with pytest.raises(ValueError):
+        vector_snapshot.read_snapshot(data[:-1])
+    with pytest.raises(ValueError):
+        vector_snapshot.read_snapshot(b"x" * len(data))
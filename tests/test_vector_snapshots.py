@@ -0,0 +1,162 @@
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import Session
+
+from app import crud
+from app.core.vector_snapshot import PQ
+from app.services import vector_codebooks, vector_projections, vector_snapshots
+from app.services.vector_snapshots import JSON, VARIANTS, SnapshotStore
+
+
+@pytest.fixture
+def exports(session, monkeypatch):
+    """
+    Dữ liệu vector giả: nội dung file là `version` hiện tại, dấu vân tay đổi theo
+    nó; `builds` ghi lại các lượt dựng (model, biến thể).
+    """
+    state = {"version": 1, "builds": []}
+
+    def iter_export(model_id, variant, batch_size, projection=None, quantizer=None):
+        state["builds"].append((model_id, variant))
+        yield f"{model_id} {variant} {state['version']}"
+
+    monkeypatch.setattr(vector_snapshots, "iter_export", iter_export)
+    monkeypatch.setattr(crud, "get_product_vector_fingerprint", lambda session, model_id: [10, state["version"]])
+    monkeypatch.setattr(vector_projections, "get_export_projection", lambda session, model_id: None)
+    quantizer = SimpleNamespace(codebook_id=uuid.UUID(int=1))
+    monkeypatch.setattr(vector_codebooks, "get_export_codebook", lambda session, model_id, projection: quantizer)
+    return state
+
+
+def make_store(session, storage_dir) -> SnapshotStore:
+    return SnapshotStore(lambda: Session(session.get_bind()), storage_dir=str(storage_dir), storage="local")
+
+
+def release(store: SnapshotStore):
+    """Giả lập worker dựng kết thúc: hệ điều hành nhả khóa."""
+    store._builder_lock.close()
+    store._builder_lock = None
+
+
+def snapshot_files(storage_dir, variant: str) -> set[str]:
+    suffix = ".json" if variant == JSON else ".bin"
+    return {name for name in os.listdir(storage_dir) if name.endswith(suffix) and name.count("-") > 5}
+
+
+def test_only_the_builder_builds(session, exports, tmp_path):
+    model_id = uuid.uuid4()
+    builder, follower = make_store(session, tmp_path), make_store(session, tmp_path)
+
+    # Worker không dựng chỉ đánh dấu model được yêu cầu
+    assert follower.get(model_id, JSON) is None
+    builder.refresh()
+    follower.refresh()
+
+    assert builder.is_builder and not follower.is_builder
+    assert sorted(exports["builds"]) == sorted((model_id, variant) for variant in VARIANTS)
+    for variant in VARIANTS:
+        assert follower.get(model_id, variant).etag == builder.get(model_id, variant).etag
+
+    exports["version"] = 2
+    builder.refresh()
+
+    # Worker đọc luôn metadata mới công bố, không giữ bản cũ trong bộ nhớ
+    assert follower.get(model_id, JSON).etag == builder.get(model_id, JSON).etag
+    assert follower.get(model_id, JSON).fingerprint == [10, 2, None]
+    assert len(exports["builds"]) == 2 * len(VARIANTS)
+
+
+def test_unchanged_vectors_are_not_rebuilt(session, exports, tmp_path):
+    model_id = uuid.uuid4()
+    store = make_store(session, tmp_path)
+    store.get(model_id, JSON)
+
+    store.refresh()
+    store.refresh()
+
+    assert len(exports["builds"]) == len(VARIANTS)
+
+
+def test_generations_are_removed_only_when_unpublished(session, exports, tmp_path):
+    model_id = uuid.uuid4()
+    store = make_store(session, tmp_path)
+    store.get(model_id, JSON)
+    locations = []
+    for version in range(1, 4):
+        exports["version"] = version
+        store.refresh()
+        locations.append(store.get(model_id, JSON).location)
+
+    artifact = store.get(model_id, JSON)
+    assert artifact.previous == locations[1]
+    assert not os.path.exists(locations[0])
+    assert {os.path.join(tmp_path, name) for name in snapshot_files(tmp_path, JSON)} == set(locations[1:])
+
+    # Worker khác nhận thay: so với metadata đã công bố, không xóa thế hệ đang được trỏ tới
+    release(store)
+    successor = make_store(session, tmp_path)
+    successor.get(model_id, JSON)
+    successor.refresh()
+    assert len(exports["builds"]) == 3 * len(VARIANTS)
+
+    exports["version"] = 4
+    successor.refresh()
+
+    current = successor.get(model_id, JSON)
+    assert current.previous == locations[2]
+    assert not os.path.exists(locations[1])
+    assert os.path.exists(locations[2]) and os.path.exists(current.location)
+
+
+def test_requested_models_reach_the_builder(session, exports, tmp_path):
+    builder, follower = make_store(session, tmp_path), make_store(session, tmp_path)
+    builder.refresh()
+    requested = uuid.uuid4()
+
+    follower.get(requested, JSON)
+    builder.refresh()
+
+    assert {model_id for model_id, _ in exports["builds"]} == {requested}
+    assert follower.get(requested, JSON) is not None
+
+
+def test_models_without_vectors_stop_being_tracked(session, exports, tmp_path, monkeypatch):
+    model_id = uuid.uuid4()
+    builder, follower = make_store(session, tmp_path), make_store(session, tmp_path)
+    builder.refresh()
+    follower.get(model_id, JSON)
+    monkeypatch.setattr(crud, "get_product_vector_fingerprint", lambda session, model_id: [0, None])
+
+    builder.refresh()
+    builder.refresh()
+
+    assert exports["builds"] == []
+    assert not any(name.endswith(".requested") for name in os.listdir(tmp_path))
+
+
+def test_pq_uses_the_stored_codebook(session, exports, tmp_path, monkeypatch):
+    model_id = uuid.uuid4()
+    store = make_store(session, tmp_path)
+    store.get(model_id, JSON)
+    codebook = {"quantizer": None}
+    monkeypatch.setattr(vector_codebooks, "get_export_codebook", lambda session, model_id, projection: codebook["quantizer"])
+
+    # Chưa huấn luyện codebook: không dựng pq
+    store.refresh()
+    assert PQ not in {variant for _, variant in exports["builds"]}
+
+    codebook["quantizer"] = SimpleNamespace(codebook_id=uuid.uuid4())
+    store.refresh()
+    store.refresh()
+    assert [variant for _, variant in exports["builds"]].count(PQ) == 1
+    assert store.get(model_id, PQ).codebook_id == str(codebook["quantizer"].codebook_id)
+
+    # Huấn luyện lại chỉ dựng lại pq
+    codebook["quantizer"] = SimpleNamespace(codebook_id=uuid.uuid4())
+    builds = len(exports["builds"])
+    store.refresh()
+    assert exports["builds"][builds:] == [(model_id, PQ)]
+    assert store.get(model_id, PQ).fingerprint[-1] == str(codebook["quantizer"].codebook_id)
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlmodel import select
+
+from app import crud
+from app.api.vectors import get_vector_delta
+from app.core.config import settings
+from app.models import AIModel, AIModelType, Product, ProductVector, ProductVectorTombstone
+from app.services import vector_projections, vector_snapshots
+
+DIM = 16
+
+
+def now(session) -> datetime:
+    return crud.get_database_time(session)
+
+
+def add_model(session, name: str, uploaded_at: datetime) -> AIModel:
+    model = AIModel(
+        model_type=AIModelType.EMBEDDING, name=name, version="1", file_path=f"{name}.tflite", uploaded_at=uploaded_at
+    )
+    session.add(model)
+    session.commit()
+    return model
+
+
+def add_vectors(session, model_id, product_id, created_at: datetime, count: int = 1) -> list[ProductVector]:
+    rng = np.random.default_rng(len(session.exec(select(ProductVector.id)).all()))
+    vectors = [
+        ProductVector.from_embedding(embedding, product_id=product_id, model_id=model_id, created_at=created_at)
+        for embedding in rng.standard_normal((count, DIM)).astype(np.float32)
+    ]
+    session.add_all(vectors)
+    session.commit()
+    return vectors
+
+
+def delta(session, since: datetime, **params) -> dict:
+    return get_vector_delta(db=session, since=since, model_id=params.get("model_id"), projection_id=params.get("projection_id"))
+
+
+@pytest.fixture
+def model(session):
+    return add_model(session, "embedding", now(session) - timedelta(days=90))
+
+
+@pytest.fixture
+def product(session):
+    product = Product(name="product", barcode="1", price=Decimal("1"), weight_grams=1)
+    session.add(product)
+    session.commit()
+    return product
+
+
+def test_delta_returns_new_vectors_and_tombstones(session, model, product):
+    since = now(session) - timedelta(hours=1)
+    old = add_vectors(session, model.id, product.id, since - timedelta(hours=1), count=3)
+    new = add_vectors(session, model.id, product.id, since + timedelta(minutes=10), count=2)
+    deleted_ids = [old[0].id, new[1].id]
+    crud.delete_product_vectors(session, deleted_ids)
+
+    result = delta(session, since, model_id=model.id)
+
+    assert result["full_resync"] is False
+    assert result["model_id"] == model.id and result["projection_id"] is None
+    # Vector vừa thêm vừa xóa trong khoảng không còn trong danh sách thêm, chỉ còn trong deleted_ids
+    assert [vector["id"] for vector in result["vectors"]] == [new[0].id]
+    np.testing.assert_allclose(result["vectors"][0]["embedding"], new[0].embedding)
+    assert sorted(result["deleted_ids"]) == sorted(deleted_ids)
+    assert len(session.exec(select(ProductVectorTombstone)).all()) == 2
+
+
+def test_delta_ignores_other_models(session, model, product):
+    other = add_model(session, "other", now(session) - timedelta(days=100))
+    since = now(session) - timedelta(hours=1)
+    vectors = add_vectors(session, other.id, product.id, since + timedelta(minutes=1), count=2)
+    crud.delete_product_vectors(session, [vectors[0].id])
+
+    result = delta(session, since, model_id=model.id)
+
+    assert result["vectors"] == [] and result["deleted_ids"] == []
+
+
+def test_cursor_lags_behind_database_time(session, model, product):
+    """
+    Transaction bắt đầu trước cursor nhưng commit sau lần đồng bộ có `created_at`
+    nhỏ hơn giờ database lúc đồng bộ; cursor lùi VECTOR_SYNC_SAFETY_LAG_SECONDS nên
+    lần đồng bộ sau vẫn nhận được vector đó.
+    """
+    first = delta(session, now(session) - timedelta(hours=1))
+    cursor = first["cursor"]
+    synced_at = now(session)
+    assert synced_at - cursor >= timedelta(seconds=settings.VECTOR_SYNC_SAFETY_LAG_SECONDS)
+
+    late = add_vectors(session, model.id, product.id, cursor + timedelta(seconds=1))
+    assert late[0].created_at.replace(tzinfo=timezone.utc) < synced_at
+
+    second = delta(session, cursor)
+
+    assert [vector["id"] for vector in second["vectors"]] == [late[0].id]
+    assert second["cursor"] >= cursor
+
+
+def test_full_resync_when_cursor_older_than_tombstone_retention(session, model, product):
+    retention = timedelta(days=settings.VECTOR_TOMBSTONE_RETENTION_DAYS)
+    add_vectors(session, model.id, product.id, now(session) - timedelta(minutes=5))
+
+    stale = delta(session, now(session) - retention - timedelta(days=1))
+    fresh = delta(session, now(session) - retention + timedelta(days=1))
+
+    assert stale["full_resync"] is True
+    assert stale["cursor"] is None and stale["vectors"] == [] and stale["deleted_ids"] == []
+    assert fresh["full_resync"] is False and len(fresh["vectors"]) == 1
+
+
+def test_purge_vector_tombstones(session, model, product):
+    vectors = add_vectors(session, model.id, product.id, now(session) - timedelta(days=60), count=3)
+    crud.delete_product_vectors(session, [vector.id for vector in vectors])
+    tombstones = session.exec(select(ProductVectorTombstone)).all()
+    tombstones[0].deleted_at = now(session) - timedelta(days=45)
+    session.add(tombstones[0])
+    session.commit()
+    purged_id = tombstones[0].vector_id
+    # SQLite trả về datetime không có múi giờ; bỏ các đối tượng đã nạp để DELETE không so sánh chúng trong Python
+    session.expire_all()
+
+    before = now(session) - timedelta(days=settings.VECTOR_TOMBSTONE_RETENTION_DAYS)
+    assert crud.purge_vector_tombstones(session, before) == 1
+
+    remaining = session.exec(select(ProductVectorTombstone.vector_id)).all()
+    assert len(remaining) == 2 and purged_id not in remaining
+    # Cart có cursor trong thời gian giữ vẫn nhận được các tombstone còn lại
+    result = delta(session, before + timedelta(hours=1))
+    assert sorted(result["deleted_ids"]) == sorted(remaining)
+
+
+def test_full_resync_when_served_model_changes(session, model, product):
+    since = now(session) - timedelta(hours=1)
+    newer = add_model(session, "embedding-v2", now(session) - timedelta(days=1))
+    add_vectors(session, newer.id, product.id, since + timedelta(minutes=1))
+
+    result = delta(session, since, model_id=model.id)
+
+    assert result["full_resync"] is True
+    assert result["model_id"] == newer.id
+    assert delta(session, since, model_id=newer.id)["full_resync"] is False
+
+
+def test_full_resync_when_projection_changes(session, model, product, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_PROJECTION_DIMS", 4)
+    since = now(session) - timedelta(hours=1)
+    add_vectors(session, model.id, product.id, since - timedelta(hours=1), count=20)
+    first = vector_projections.fit_vector_projection(session, model.id, 4, 20)
+
+    synced = delta(session, since, projection_id=first.id)
+    assert synced["full_resync"] is False and synced["projection_id"] == first.id
+
+    add_vectors(session, model.id, product.id, since + timedelta(minutes=1))
+    refitted = vector_projections.fit_vector_projection(session, model.id, 4, 20)
+
+    assert delta(session, since, projection_id=first.id)["full_resync"] is True
+    # Cart chưa có projection (PCA vừa được bật) cũng phải tải lại
+    assert delta(session, since)["full_resync"] is True
+    result = delta(session, since, projection_id=refitted.id)
+    assert result["full_resync"] is False
+    assert [len(vector["embedding"]) for vector in result["vectors"]] == [4]
+
+
+def test_full_resync_when_too_many_new_vectors(session, model, product, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_SYNC_MAX_VECTORS", 2)
+    since = now(session) - timedelta(hours=1)
+    add_vectors(session, model.id, product.id, since + timedelta(minutes=1), count=2)
+    assert delta(session, since)["full_resync"] is False
+
+    add_vectors(session, model.id, product.id, since + timedelta(minutes=2))
+
+    assert delta(session, since)["full_resync"] is True
+
+
+def test_sync_cursor_uses_database_clock(session, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_SYNC_SAFETY_LAG_SECONDS", 30)
+    database_now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    monkeypatch.setattr(crud, "get_database_time", lambda session: database_now)
+
+    assert vector_snapshots.sync_cursor(session) == database_now - timedelta(seconds=30)